@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Comparaison des fonctions de chiffrement/déchiffrement AES-CBC de `electriflux.utils`
+avec leurs versions d'origine (lecture complète pour le déchiffrement, blocs de 16 octets
+pour le chiffrement).
+
+Usage :
+    python benchmarks/bench_crypto.py --size-mb 256
+"""
+
+import os
+import time
+import argparse
+import tempfile
+import tracemalloc
+from pathlib import Path
+
+from Crypto.Cipher import AES
+
+from electriflux.utils import decrypt_file, encrypt_file
+
+
+def legacy_decrypt_file(file_path: Path, key: bytes, iv: bytes, prefix: str = "decrypted_") -> Path:
+    cipher = AES.new(key, AES.MODE_CBC, iv)
+    output_file = file_path.with_name(prefix + file_path.stem + ".zip")
+    with file_path.open("rb") as f_in, output_file.open("wb") as f_out:
+        f_out.write(cipher.decrypt(f_in.read()))
+    return output_file
+
+
+def legacy_encrypt_file(file_path: Path, key: bytes, iv: bytes, prefix: str = "encrypted_") -> Path:
+    cipher = AES.new(key, AES.MODE_CBC, iv)
+    output_file = file_path.with_name(prefix + file_path.stem + ".enc")
+    with file_path.open("rb") as f_in, output_file.open("wb") as f_out:
+        while True:
+            data = f_in.read(16)
+            if len(data) == 0:
+                break
+            elif len(data) % 16 != 0:
+                data += b' ' * (16 - len(data) % 16)
+            f_out.write(cipher.encrypt(data))
+    return output_file
+
+
+def raw_aes(size: int, key: bytes, iv: bytes) -> float:
+    """Débit de référence : AES-CBC seul, sur un tampon en mémoire."""
+    data = os.urandom(min(size, 64 << 20) // 16 * 16)
+    cipher = AES.new(key, AES.MODE_CBC, iv)
+    start = time.perf_counter()
+    cipher.encrypt(data)
+    return len(data) / (time.perf_counter() - start)
+
+
+def measure(func, *args) -> tuple[Path, float, int]:
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size-mb', type=float, default=64, help="Taille du fichier de test (Mio)")
+    parser.add_argument('--skip-legacy-encrypt', action='store_true',
+                        help="Ne pas mesurer l'ancien chiffrement (très lent sur les gros fichiers)")
+    args = parser.parse_args()
+
+    key, iv = os.urandom(16), os.urandom(16)
+    size = int(args.size_mb * 1024 * 1024) + 5  # dernier bloc incomplet, pour tester le bourrage
+    mib = size / 1024**2
+    print(f"AES-CBC brut : {raw_aes(size, key, iv) / 1024**2:.0f} Mio/s")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = Path(tmp) / 'archive.zip'
+        with source.open('wb') as f:
+            remaining = size
+            while remaining:
+                chunk = os.urandom(min(remaining, 16 << 20))
+                f.write(chunk)
+                remaining -= len(chunk)
+
+        runs = [('encrypt', 'nouveau', encrypt_file, 'new')]
+        if not args.skip_legacy_encrypt:
+            runs.append(('encrypt', 'ancien', legacy_encrypt_file, 'old'))
+        encrypted = {}
+        for op, label, func, prefix in runs:
+            out, elapsed, peak = measure(func, source, key, iv, f'{prefix}_')
+            encrypted[prefix] = out
+            print(f"{op:8} {label:8} {elapsed:7.2f} s  {mib / elapsed:8.1f} Mio/s  pic mémoire {peak / 1024**2:8.1f} Mio")
+        if 'old' in encrypted:
+            assert encrypted['new'].read_bytes() == encrypted['old'].read_bytes(), "chiffrés différents"
+
+        decrypted = {}
+        for label, func, prefix in [('nouveau', decrypt_file, 'dnew'), ('ancien', legacy_decrypt_file, 'dold')]:
+            out, elapsed, peak = measure(func, encrypted['new'], key, iv, f'{prefix}_')
+            decrypted[prefix] = out
+            print(f"{'decrypt':8} {label:8} {elapsed:7.2f} s  {mib / elapsed:8.1f} Mio/s  pic mémoire {peak / 1024**2:8.1f} Mio")
+        assert decrypted['dnew'].read_bytes() == decrypted['dold'].read_bytes(), "déchiffrés différents"
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Banc de mesure reproductible d'electriflux, sur des flux synthétiques.
+
+Pour chaque flux et chaque cas (lecteur pandas, lecteur polars, traitement itératif,
+chiffrement), mesure le débit (lignes/s, Mio/s) et le pic mémoire (RSS). Chaque cas
+tourne dans un processus neuf, pour que le pic mémoire lui soit propre. Les résultats
+sont enregistrés en JSON, avec le commit courant, et peuvent être comparés à un
+enregistrement précédent.
+
+Usage :
+    python benchmarks/run.py --prms 5000 --files 4 --output bench.json
+    python benchmarks/run.py --prms 5000 --files 4 --compare bench.json
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import datetime
+import resource
+import tempfile
+import subprocess
+import multiprocessing
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable
+
+sys.path.insert(0, str(Path(__file__).parent))
+from synthetic import FLUXES, Shape, generate_all  # noqa: E402
+
+PARSE_CASES = ('simple_reader', 'simple_reader_arrow', 'polars_reader', 'iterative_csv', 'iterative_parquet')
+CRYPTO_CASES = ('encrypt_file', 'decrypt_file')
+
+
+def _rss_mb() -> float:
+    # ru_maxrss est en Kio sous Linux, en octets sous macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 1024**2
+
+
+def _parse_case(case: str, flux_type: str, directory: Path, workers: int, work: Path) -> Callable[[], int]:
+    from electriflux import polars_reader, simple_reader
+
+    if case == 'simple_reader':
+        return lambda: len(simple_reader.process_flux(flux_type, directory, workers=workers))
+    if case == 'simple_reader_arrow':
+        return lambda: len(simple_reader.process_flux(flux_type, directory, workers=workers, backend='arrow'))
+    if case == 'polars_reader':
+        return lambda: polars_reader.process_flux(flux_type, directory, workers=workers).height
+    # Le traitement itératif écrit à côté des XML : il travaille sur une copie
+    shutil.copytree(directory, work / flux_type)
+    if case == 'iterative_csv':
+        return lambda: len(simple_reader.iterative_process_flux(flux_type, work / flux_type, workers=workers))
+    if case == 'iterative_parquet':
+        return lambda: len(simple_reader.iterative_process_flux(flux_type, work / flux_type, workers=workers,
+                                                                storage='parquet', store_dir=work / 'store'))
+    raise ValueError(f"Cas inconnu : {case}")
+
+
+def _crypto_case(case: str, path: Path) -> Callable[[], int]:
+    from electriflux.utils import decrypt_file, encrypt_file
+
+    key, iv = b'k' * 16, b'i' * 16
+    if case == 'encrypt_file':
+        return lambda: encrypt_file(path, key, iv).stat().st_size
+    if case == 'decrypt_file':
+        encrypted = encrypt_file(path, key, iv)
+        return lambda: decrypt_file(encrypted, key, iv).stat().st_size
+    raise ValueError(f"Cas inconnu : {case}")
+
+
+def _measure(kind: str, case: str, flux_type: str | None, path: str, workers: int) -> dict[str, Any]:
+    """Exécuté dans un processus neuf : prépare le cas, puis le chronomètre."""
+    with tempfile.TemporaryDirectory(prefix='electriflux-bench-') as work:
+        if kind == 'parse':
+            run = _parse_case(case, flux_type, Path(path), workers, Path(work))
+        else:
+            run = _crypto_case(case, Path(path))
+        baseline = _rss_mb()
+        start = time.perf_counter()
+        count = run()
+        seconds = time.perf_counter() - start
+    return {'count': count, 'seconds': seconds, 'peak_rss_mb': _rss_mb(), 'baseline_rss_mb': baseline}
+
+
+def run_case(kind: str, case: str, flux_type: str | None, path: Path, input_bytes: int,
+             workers: int = 1, repeat: int = 1) -> dict[str, Any]:
+    """Meilleur temps et pic mémoire maximal sur `repeat` exécutions."""
+    context = multiprocessing.get_context('spawn')
+    runs = []
+    for _ in range(repeat):
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            runs.append(executor.submit(_measure, kind, case, flux_type, str(path), workers).result())
+    best = min(runs, key=lambda r: r['seconds'])
+    seconds = best['seconds']
+    result = {
+        'case': case,
+        'flux': flux_type,
+        'workers': workers,
+        'input_mb': input_bytes / 1024**2,
+        'seconds': seconds,
+        'mb_per_s': input_bytes / 1024**2 / seconds if seconds else None,
+        'peak_rss_mb': max(r['peak_rss_mb'] for r in runs),
+        'peak_delta_mb': max(r['peak_rss_mb'] - r['baseline_rss_mb'] for r in runs),
+    }
+    if kind == 'parse':
+        result['rows'] = best['count']
+        result['rows_per_s'] = best['count'] / seconds if seconds else None
+    return result
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=Path(__file__).parent,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _key(result: dict[str, Any]) -> tuple:
+    return result['case'], result['flux'], result['workers']
+
+
+def compare(results: list[dict[str, Any]], baseline_path: Path) -> None:
+    """Affiche l'évolution du temps et du pic mémoire par rapport à un enregistrement précédent."""
+    baseline = {_key(r): r for r in json.loads(baseline_path.read_text())['results']}
+    print(f"\nComparaison avec {baseline_path} :")
+    for r in results:
+        old = baseline.get(_key(r))
+        if old is None:
+            continue
+        print(f"  {r['case']:20} {r['flux'] or '':8} temps x{r['seconds'] / old['seconds']:5.2f}"
+              f"  mémoire x{r['peak_delta_mb'] / old['peak_delta_mb'] if old['peak_delta_mb'] else float('nan'):5.2f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--prms', type=int, default=2000, help="PRM par fichier")
+    parser.add_argument('--files', type=int, default=4, help="Fichiers par flux")
+    parser.add_argument('--nesting', type=int, default=4, help="Éléments répétés par ligne (voir synthetic.Shape)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--flux', nargs='*', default=list(FLUXES), choices=FLUXES)
+    parser.add_argument('--cases', nargs='*', default=list(PARSE_CASES + CRYPTO_CASES),
+                        choices=PARSE_CASES + CRYPTO_CASES)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=1, help="Exécutions par cas (meilleur temps retenu)")
+    parser.add_argument('--crypto-mb', type=float, default=64, help="Taille du fichier chiffré/déchiffré")
+    parser.add_argument('--data-dir', type=Path, help="Dossier des flux générés (temporaire par défaut)")
+    parser.add_argument('--output', type=Path, help="Fichier JSON de résultats")
+    parser.add_argument('--compare', type=Path, help="Résultats JSON précédents à comparer")
+    args = parser.parse_args()
+
+    shape = Shape(args.prms, args.files, args.nesting, args.seed)
+    with tempfile.TemporaryDirectory(prefix='electriflux-bench-') as tmp:
+        data_dir = args.data_dir or Path(tmp)
+        results = []
+        parse_cases = [c for c in args.cases if c in PARSE_CASES]
+        if parse_cases:
+            generated = generate_all(data_dir, shape, tuple(args.flux))
+            for flux_type, paths in generated.items():
+                input_bytes = sum(p.stat().st_size for p in paths)
+                for case in parse_cases:
+                    result = run_case('parse', case, flux_type, data_dir / flux_type, input_bytes,
+                                      args.workers, args.repeat)
+                    results.append(result)
+                    print(f"{case:20} {flux_type:8} {result['rows']:9d} lignes {result['seconds']:7.2f} s "
+                          f"{result['rows_per_s']:10.0f} l/s {result['mb_per_s']:7.1f} Mio/s "
+                          f"pic +{result['peak_delta_mb']:.0f} Mio")
+
+        crypto_cases = [c for c in args.cases if c in CRYPTO_CASES]
+        if crypto_cases:
+            source = Path(tmp) / 'archive.zip'
+            size = int(args.crypto_mb * 1024**2)
+            with source.open('wb') as f:
+                for offset in range(0, size, 1 << 20):
+                    f.write(os.urandom(min(1 << 20, size - offset)))
+            for case in crypto_cases:
+                result = run_case('crypto', case, None, source, size, 1, args.repeat)
+                results.append(result)
+                print(f"{case:20} {'':8} {result['seconds']:7.2f} s {result['mb_per_s']:7.1f} Mio/s "
+                      f"pic +{result['peak_delta_mb']:.0f} Mio")
+
+    report = {
+        'meta': {
+            'commit': _git_commit(),
+            'date': datetime.datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'shape': vars(shape),
+            'crypto_mb': args.crypto_mb,
+        },
+        'results': results,
+    }
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+        print(f"Résultats enregistrés dans {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
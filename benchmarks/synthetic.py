@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Générateur de flux Enedis synthétiques (C15, F12, F15, R15, R151, R15_ACC).
+
+Les fichiers suivent la structure attendue par `simple_flux.yaml` : chaque champ de
+la configuration y est présent (certains champs facultatifs seulement pour une partie
+des lignes), de même que les conditions des champs imbriqués. Le contenu est
+déterministe pour une graine donnée.
+
+Usage :
+    python benchmarks/synthetic.py /tmp/flux --prms 2000 --files 4 --nesting 4
+"""
+
+import random
+import argparse
+import datetime
+from pathlib import Path
+from dataclasses import dataclass
+from typing import Callable
+
+FLUXES = ('C15', 'F12', 'F15', 'R15', 'R151', 'R15_ACC')
+
+_CADRANS = ['HPH', 'HPB', 'HCH', 'HCB', 'HP', 'HC', 'BASE']
+_FTA = ['BTINFCU4', 'BTINFMU4', 'BTINFCUST', 'BTINFLU']
+_EVENEMENTS = ['MES', 'MCT', 'CFNE', 'RES', 'MDACT', 'PMES']
+
+
+@dataclass
+class Shape:
+    """
+    Forme des fichiers générés.
+
+    Attributes:
+        prms (int): Nombre de PRM par fichier.
+        files (int): Nombre de fichiers par flux.
+        nesting (int): Nombre d'éléments répétés sous chaque ligne : classes temporelles
+            par relevé (C15, R15, R151, R15_ACC) et éléments valorisés par PRM (F12, F15).
+        seed (int): Graine du générateur aléatoire.
+    """
+    prms: int = 1000
+    files: int = 2
+    nesting: int = 4
+    seed: int = 0
+
+
+def _cadrans(nesting: int) -> list[str]:
+    return [_CADRANS[i] if i < len(_CADRANS) else f'C{i}' for i in range(max(1, nesting))]
+
+
+def _pdl(i: int) -> str:
+    return f'{14000000000000 + i:014d}'
+
+
+def _date(rng: random.Random) -> str:
+    return (datetime.date(2023, 1, 1) + datetime.timedelta(days=rng.randrange(730))).isoformat()
+
+
+def _classe_temporelle(out: list[str], ct: str, classe: str, sens: str, valeur: int) -> None:
+    out.append(f'<Classe_Temporelle_Distributeur><Id_Classe_Temporelle>{ct}</Id_Classe_Temporelle>'
+               f'<Classe_Mesure>{classe}</Classe_Mesure><Sens_Mesure>{sens}</Sens_Mesure>'
+               f'<Valeur>{valeur}</Valeur></Classe_Temporelle_Distributeur>')
+
+
+def _optional(rng: random.Random, tag: str, value: str, ratio: float = 0.3) -> str:
+    return f'<{tag}>{value}</{tag}>' if rng.random() < ratio else ''
+
+
+def c15(rng: random.Random, shape: Shape, offset: int) -> list[str]:
+    out = ['<C15>', '<En_Tete_Flux><Identifiant_Flux>C15</Identifiant_Flux></En_Tete_Flux>']
+    for i in range(offset, offset + shape.prms):
+        evenement = rng.choice(_EVENEMENTS)
+        out.append(
+            f'<PRM><Id_PRM>{_pdl(i)}</Id_PRM><Segment_Clientele>C5</Segment_Clientele>'
+            f'<Num_Depannage>{rng.randrange(10**9):09d}</Num_Depannage>'
+            f'{_optional(rng, "Date_Derniere_Modification_FTA", _date(rng))}'
+            f'<Situation_Contractuelle><Ref_Situation_Contractuelle>{rng.randrange(10**6)}</Ref_Situation_Contractuelle>'
+            f'<Etat_Contractuel>{rng.choice(["SERVC", "RESIL", "EN_COURS"])}</Etat_Contractuel>'
+            f'<Titulaire_Contrat><Categorie>{rng.choice(["RES", "PRO"])}</Categorie></Titulaire_Contrat>'
+            f'<Structure_Tarifaire><Puissance_Souscrite>{rng.choice([3, 6, 9, 12, 36])}</Puissance_Souscrite>'
+            f'<Formule_Tarifaire_Acheminement>{rng.choice(_FTA)}</Formule_Tarifaire_Acheminement></Structure_Tarifaire>'
+            f'</Situation_Contractuelle>'
+            f'<Dispositif_De_Comptage><Compteur><Type>{rng.choice(["CCB", "CEB", "CFB"])}</Type>'
+            f'<Num_Serie>{rng.randrange(10**12):012d}</Num_Serie></Compteur></Dispositif_De_Comptage>'
+            f'<Evenement_Declencheur><Nature_Evenement>{evenement}</Nature_Evenement>'
+            f'<Type_Evenement>CONTRAT</Type_Evenement><Date_Evenement>{_date(rng)}</Date_Evenement>'
+            f'{_optional(rng, "Ref_Demandeur", str(rng.randrange(10**6)))}'
+            f'{_optional(rng, "Id_Affaire", "A" + str(rng.randrange(10**7)))}'
+        )
+        if evenement != 'PMES':
+            out.append('<Releves>')
+            # Relevés avant (1) et après (2) l'événement, en soutirage (0) et injection (1)
+            for qualification in ('1', '2'):
+                out.append(f'<Donnees_Releve><Code_Qualification>{qualification}</Code_Qualification>'
+                           f'<Date_Releve>{_date(rng)}</Date_Releve><Nature_Index>{rng.choice(["REEL", "ESTIME"])}</Nature_Index>'
+                           f'<Id_Calendrier_Distributeur>DI00000{shape.nesting}</Id_Calendrier_Distributeur>'
+                           f'<Id_Calendrier>FC00000{shape.nesting}</Id_Calendrier>')
+                for ct in _cadrans(shape.nesting):
+                    _classe_temporelle(out, ct, '1', '0', rng.randrange(100000))
+                    if rng.random() < 0.1:
+                        _classe_temporelle(out, ct, '1', '1', rng.randrange(1000))
+                out.append('</Donnees_Releve>')
+            out.append('</Releves>')
+        out.append('</Evenement_Declencheur></PRM>')
+    out.append('</C15>')
+    return out
+
+
+def _facture_header(out: list[str], flux: str, rng: random.Random, index: int) -> None:
+    out.append(f'<En_Tete_Flux><Identifiant_Flux>{flux}</Identifiant_Flux></En_Tete_Flux>'
+               f'<Rappel_En_Tete><Num_Facture>{flux}{index:08d}</Num_Facture>'
+               f'<Date_Facture>{_date(rng)}</Date_Facture></Rappel_En_Tete>')
+
+
+def f12(rng: random.Random, shape: Shape, offset: int) -> list[str]:
+    out = ['<F12>']
+    _facture_header(out, 'F12', rng, offset)
+    for i in range(offset, offset + shape.prms):
+        out.append(f'<Donnees_Valorisation><Num_Sous_Lot>{rng.randrange(10)}</Num_Sous_Lot>'
+                   f'<Type_Facturation>{rng.choice(["NORM", "RECT"])}</Type_Facturation>'
+                   f'{_optional(rng, "Motif_Rectif", "ERR", 0.05)}'
+                   f'<Id_PRM>{_pdl(i)}</Id_PRM><Type_PRM>{rng.choice(["C4", "C2"])}</Type_PRM>'
+                   f'<Code_Segmentation_ERDF>C4</Code_Segmentation_ERDF>'
+                   f'<Puissance_Ponderee>{rng.randrange(36, 250)}</Puissance_Ponderee>'
+                   f'<Autoproducteur>{rng.choice(["OUI", "NON"])}</Autoproducteur>'
+                   f'<Tarif_Souscrit>{rng.choice(["HTACU5", "BTSUPCU4"])}</Tarif_Souscrit>')
+        debut = _date(rng)
+        for ev in range(max(1, shape.nesting)):
+            out.append(f'<Element_Valorise><Id_EV>{ev + 1:03d}</Id_EV><Libelle_EV>Composante {ev + 1}</Libelle_EV>'
+                       f'<Code_Recapitulatif>R{ev % 3}</Code_Recapitulatif><CSPE_Applicable>OUI</CSPE_Applicable>'
+                       f'<Taux_TVA_Applicable>{rng.choice(["NS", "5.5", "20"])}</Taux_TVA_Applicable>'
+                       f'<Code_Debit_Credit>{rng.choice(["D", "C"])}</Code_Debit_Credit>'
+                       f'<Acheminement><Date_Debut>{debut}</Date_Debut><Date_Fin>{_date(rng)}</Date_Fin>'
+                       f'<Unite_Quantite>kWh</Unite_Quantite><Quantite>{rng.randrange(100000)}</Quantite>'
+                       f'<Prix_Unitaire>{rng.random():.5f}</Prix_Unitaire><Montant_HT>{rng.random() * 1000:.2f}</Montant_HT>'
+                       f'</Acheminement></Element_Valorise>')
+        out.append('</Donnees_Valorisation>')
+    out.append('</F12>')
+    return out
+
+
+def f15(rng: random.Random, shape: Shape, offset: int) -> list[str]:
+    out = ['<F15>']
+    _facture_header(out, 'F15', rng, offset)
+    for i in range(offset, offset + shape.prms):
+        out.append(f'<PRM><Type_Facturation>{rng.choice(["NORM", "RECT"])}</Type_Facturation>'
+                   f'<Donnees_PRM><Id_PRM>{_pdl(i)}</Id_PRM></Donnees_PRM>')
+        # Deux blocs de valorisation par PRM : prestations (01) et acheminement (02)
+        for nature in ('01', '02'):
+            out.append(f'<Donnees_Valorisation><Nature_EV>{nature}</Nature_EV>')
+            for ev in range(max(1, shape.nesting)):
+                debut = _date(rng)
+                out.append(f'<Element_Valorise><Id_EV>{nature}{ev:02d}</Id_EV><Libelle_EV>Composante {ev}</Libelle_EV>'
+                           f'<Taux_TVA_Applicable>{rng.choice(["NS", "5.5", "20"])}</Taux_TVA_Applicable>'
+                           f'<Formule_Tarifaire_Acheminement>{rng.choice(_FTA)}</Formule_Tarifaire_Acheminement>'
+                           f'<Unite_Quantite>{rng.choice(["kWh", "jour", "u"])}</Unite_Quantite>'
+                           f'<Prix_Unitaire>{rng.random():.5f}</Prix_Unitaire><Quantite>{rng.randrange(1000)}</Quantite>'
+                           f'<Montant_HT>{rng.random() * 100:.2f}</Montant_HT>'
+                           f'<Date_Debut>{debut}</Date_Debut><Date_Fin>{_date(rng)}</Date_Fin></Element_Valorise>')
+            out.append('</Donnees_Valorisation>')
+        out.append('</PRM>')
+    out.append('</F15>')
+    return out
+
+
+def _releves(flux: str, extra: Callable[[random.Random], str], classes: tuple[str, ...]):
+    def generate(rng: random.Random, shape: Shape, offset: int) -> list[str]:
+        out = [f'<{flux}>', f'<En_Tete_Flux><Identifiant_Flux>{flux}</Identifiant_Flux>'
+                            f'<Unite_Mesure_Index>kWh</Unite_Mesure_Index></En_Tete_Flux>']
+        for i in range(offset, offset + shape.prms):
+            out.append(f'<PRM><Id_PRM>{_pdl(i)}</Id_PRM><Donnees_Releve><Date_Releve>{_date(rng)}</Date_Releve>'
+                       f'{extra(rng)}{_optional(rng, "Id_Affaire", "A" + str(rng.randrange(10**7)))}')
+            for classe in classes:
+                for ct in _cadrans(shape.nesting):
+                    _classe_temporelle(out, ct, classe, '0', rng.randrange(100000))
+            out.append('</Donnees_Releve></PRM>')
+        out.append(f'</{flux}>')
+        return out
+    return generate
+
+
+r15 = _releves('R15', lambda rng: (
+    f'<Id_Calendrier>FC000004</Id_Calendrier><Ref_Situation_Contractuelle>{rng.randrange(10**6)}</Ref_Situation_Contractuelle>'
+    f'<Type_Compteur>{rng.choice(["CCB", "CEB"])}</Type_Compteur><Motif_Releve>{rng.choice(["CYCL", "CFNE"])}</Motif_Releve>'
+    f'{_optional(rng, "Ref_Demandeur", str(rng.randrange(10**6)))}'), ('1',))
+
+r151 = _releves('R151', lambda rng: (
+    '<Id_Calendrier_Fournisseur>FC000004</Id_Calendrier_Fournisseur>'
+    '<Id_Calendrier_Distributeur>DI000003</Id_Calendrier_Distributeur>'), ('1',))
+
+r15_acc = _releves('R15_ACC', lambda rng: (
+    f'<Id_Calendrier>FC000004</Id_Calendrier><Id_Calendrier_Distributeur>DI000003</Id_Calendrier_Distributeur>'
+    f'<Ref_Situation_Contractuelle>{rng.randrange(10**6)}</Ref_Situation_Contractuelle>'
+    f'<Type_Compteur>CCB</Type_Compteur><Motif_Releve>CYCL</Motif_Releve><Nature_Index>REEL</Nature_Index>'
+    f'<Statut_Releve>INITIAL</Statut_Releve><Autoconsommation_Collective>OUI</Autoconsommation_Collective>'),
+    ('3', '4', '5', '6'))
+
+GENERATORS = {'C15': c15, 'F12': f12, 'F15': f15, 'R15': r15, 'R151': r151, 'R15_ACC': r15_acc}
+
+
+def file_name(flux_type: str, index: int) -> str:
+    # F12 et F15 doivent respecter le file_regex de la configuration
+    if flux_type in ('F12', 'F15'):
+        return f'FL_{index}_{index}.xml'
+    return f'{flux_type}_{index}.xml'
+
+
+def generate_flux(flux_type: str, directory: Path, shape: Shape = Shape()) -> list[Path]:
+    """
+    Écrit `shape.files` fichiers du flux dans `directory` (répartis dans des sous-dossiers,
+    comme après extraction des archives).
+
+    Returns:
+        list[Path]: Fichiers écrits.
+    """
+    rng = random.Random(f'{shape.seed}-{flux_type}')
+    generate = GENERATORS[flux_type]
+    written = []
+    for index in range(shape.files):
+        name = file_name(flux_type, index)
+        path = Path(directory) / name.removesuffix('.xml') / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        lines = generate(rng, shape, index * shape.prms)
+        path.write_text("<?xml version='1.0' encoding='UTF-8'?>\n" + '\n'.join(lines), encoding='utf-8')
+        written.append(path)
+    return written
+
+
+def generate_all(directory: Path, shape: Shape = Shape(), fluxes: tuple[str, ...] = FLUXES) -> dict[str, list[Path]]:
+    """Génère chaque flux dans `directory/<flux>`."""
+    return {flux: generate_flux(flux, Path(directory) / flux, shape) for flux in fluxes}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('directory', type=Path)
+    parser.add_argument('--prms', type=int, default=Shape.prms)
+    parser.add_argument('--files', type=int, default=Shape.files)
+    parser.add_argument('--nesting', type=int, default=Shape.nesting)
+    parser.add_argument('--seed', type=int, default=Shape.seed)
+    parser.add_argument('--flux', nargs='*', default=list(FLUXES), choices=FLUXES)
+    args = parser.parse_args()
+    generated = generate_all(args.directory, Shape(args.prms, args.files, args.nesting, args.seed), tuple(args.flux))
+    for flux, paths in generated.items():
+        print(f"{flux}: {len(paths)} fichiers, {sum(p.stat().st_size for p in paths) / 1024**2:.1f} Mio")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Cache disque des résultats d'extraction, fichier par fichier.
+
+Chaque fichier XML extrait est conservé au format Parquet sous une clé combinant :
+ - l'identité du fichier (chemin, taille et mtime, ou empreinte de son contenu),
+ - l'empreinte du plan compilé du flux (`FluxPlan.fingerprint`).
+
+Modifier `simple_flux.yaml` change l'empreinte des flux concernés, et invalide
+donc leurs entrées. Le cache est borné en taille : les entrées les moins
+récemment utilisées sont supprimées au-delà du budget disque.
+"""
+
+import os
+import hashlib
+import logging
+from pathlib import Path
+from typing import Callable, TypeVar
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+_logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+
+class ParseCache:
+    """
+    Cache LRU de tables Arrow sur disque.
+
+    Parameters:
+        directory (Path): Dossier du cache (créé si besoin).
+        max_bytes (int): Budget disque ; les entrées les plus anciennement lues sont
+            évincées au-delà.
+        hash_content (bool): Si True, la clé dépend du contenu du fichier (sha256) plutôt que
+            de son chemin, sa taille et sa date de modification. Plus sûr, mais chaque fichier
+            est relu.
+
+    Attributes:
+        hits (int): Nombre de lectures servies par le cache.
+        misses (int): Nombre de lectures absentes du cache.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int = 2 * 1024**3, hash_content: bool = False):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hash_content = hash_content
+        self.hits = 0
+        self.misses = 0
+        self._size: int | None = None
+
+    def key(self, path: Path, fingerprint: str) -> str:
+        """Clé d'un fichier pour un plan d'extraction donné."""
+        h = hashlib.sha256(fingerprint.encode())
+        if self.hash_content:
+            with open(path, 'rb') as f:
+                while chunk := f.read(1 << 20):
+                    h.update(chunk)
+        else:
+            stat = os.stat(path)
+            h.update(f"{Path(path).resolve()}|{stat.st_size}|{stat.st_mtime_ns}".encode())
+        return h.hexdigest()
+
+    def _entry(self, key: str) -> Path:
+        return self.directory / key[:2] / f'{key}.parquet'
+
+    def get(self, key: str) -> pa.Table | None:
+        entry = self._entry(key)
+        try:
+            table = pq.read_table(entry)
+        except (FileNotFoundError, OSError, pa.ArrowInvalid):
+            self.misses += 1
+            return None
+        # La date de modification sert d'horodatage LRU
+        os.utime(entry)
+        self.hits += 1
+        return table
+
+    def put(self, key: str, table: pa.Table) -> None:
+        entry = self._entry(key)
+        entry.parent.mkdir(exist_ok=True)
+        tmp = entry.with_suffix(f'.{os.getpid()}.tmp')
+        pq.write_table(table, tmp)
+        size = tmp.stat().st_size
+        tmp.replace(entry)
+        if self._size is not None:
+            self._size += size
+        if self.size() > self.max_bytes:
+            # Marge de 10 % pour ne pas rebalayer le cache à chaque écriture
+            self.evict(int(self.max_bytes * 0.9))
+
+    def _entries(self) -> list[os.DirEntry]:
+        entries = []
+        for sub in os.scandir(self.directory):
+            if sub.is_dir():
+                entries.extend(e for e in os.scandir(sub.path) if e.name.endswith('.parquet'))
+        return entries
+
+    def size(self) -> int:
+        """Taille totale des entrées, en octets."""
+        if self._size is None:
+            self._size = sum(e.stat().st_size for e in self._entries())
+        return self._size
+
+    def evict(self, max_bytes: int | None = None) -> int:
+        """
+        Supprime les entrées les moins récemment utilisées jusqu'à repasser sous le budget.
+
+        Returns:
+            int: Nombre d'entrées supprimées.
+        """
+        budget = self.max_bytes if max_bytes is None else max_bytes
+        entries = sorted(self._entries(), key=lambda e: e.stat().st_mtime_ns)
+        total = sum(e.stat().st_size for e in entries)
+        removed = 0
+        for e in entries:
+            if total <= budget:
+                break
+            total -= e.stat().st_size
+            try:
+                os.unlink(e.path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+        self._size = total
+        if removed:
+            _logger.info(f"Cache : {removed} entrées évincées ({total} octets restants)")
+        return removed
+
+    def clear(self) -> None:
+        self.evict(0)
+
+    def stats(self) -> dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses, 'bytes': self.size()}
+
+
+def cached_parse(xml_files: list[Path],
+                 parse: Callable[[list[Path]], list[tuple[Path, T]]],
+                 cache: ParseCache,
+                 fingerprint: str,
+                 to_table: Callable[[T], pa.Table],
+                 from_table: Callable[[pa.Table], T]) -> list[tuple[Path, T]]:
+    """
+    Sert depuis le cache les fichiers déjà extraits et ne passe que les autres à `parse`.
+
+    Parameters:
+        xml_files (list[Path]): Fichiers à traiter.
+        parse (Callable): Fonction traitant une liste de fichiers et renvoyant des couples
+            (fichier, résultat) pour ceux qui ont réussi.
+        cache (ParseCache): Cache à utiliser.
+        fingerprint (str): Empreinte du plan d'extraction (et du lecteur) utilisé.
+        to_table, from_table (Callable): Conversions entre le résultat de `parse` et une table Arrow.
+
+    Returns:
+        list[tuple[Path, T]]: Couples (fichier, résultat), dans l'ordre de `xml_files`.
+    """
+    keys = {f: cache.key(f, fingerprint) for f in xml_files}
+    results: dict[Path, T] = {}
+    missing = []
+    for f in xml_files:
+        table = cache.get(keys[f])
+        if table is None:
+            missing.append(f)
+        else:
+            results[f] = from_table(table)
+
+    for f, result in parse(missing):
+        cache.put(keys[f], to_table(result))
+        results[f] = result
+    _logger.info(f"Cache : {len(xml_files) - len(missing)} fichiers lus depuis le cache, {len(missing)} extraits")
+    return [(f, results[f]) for f in xml_files if f in results]
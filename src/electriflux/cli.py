@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Ligne de commande `electriflux`.
+
+    electriflux watch ~/data/flux_enedis --flux C15 R151 F15 --interval 60
+    electriflux ingest ~/data/flux_enedis --flux C15 F12 F15 R15 R151 R15_ACC
+    electriflux export F15 ~/data/flux_enedis/F15 F15.parquet
+
+Les accès sFTP et les clés AES sont lus dans l'environnement, sous les mêmes noms que
+les clés de configuration de `download_decrypt_extract_new_files` : FTP_ADDRESS,
+FTP_PORT, FTP_USER, FTP_PASSWORD, AES_KEY, AES_IV et FTP_<flux>_DIR.
+"""
+
+import os
+import signal
+import logging
+import argparse
+import threading
+from pathlib import Path
+
+from electriflux.plan import DEFAULT_CONFIG_PATH, load_configs
+
+_logger = logging.getLogger(__name__)
+
+CONFIG_PREFIXES = ('FTP_', 'AES_')
+
+
+def env_config() -> dict[str, str] | None:
+    """Configuration sFTP lue dans l'environnement, None si FTP_ADDRESS n'est pas défini."""
+    if 'FTP_ADDRESS' not in os.environ:
+        return None
+    return {key: value for key, value in os.environ.items() if key.startswith(CONFIG_PREFIXES)}
+
+
+def _watch(args: argparse.Namespace) -> None:
+    from electriflux.watch import Watcher
+
+    config = None if args.no_download else env_config()
+    if config is None:
+        _logger.info("Pas de configuration sFTP (FTP_ADDRESS) : seuls les fichiers locaux sont ingérés")
+    watcher = Watcher(config, args.flux, args.local.expanduser(),
+                      store_dir=args.store.expanduser() if args.store else None,
+                      flux_config_path=args.config, interval=args.interval,
+                      channels=args.channels, workers=args.workers, parse_workers=args.parse_workers,
+                      queue_size=args.queue_size, batch_files=args.batch_files, settle=args.settle)
+    if args.once:
+        watcher.run_once()
+        watcher.close()
+        return
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    watcher.run(stop)
+
+
+def _ingest(args: argparse.Namespace) -> None:
+    from electriflux.ingest import ingest_fluxes
+    from electriflux.parallel import FileError
+
+    errors: list[FileError] = []
+    ingest_fluxes(args.root.expanduser(), args.flux,
+                  store_dir=args.store.expanduser() if args.store else None,
+                  config_path=args.config, workers=args.workers, batch_files=args.batch_files,
+                  stream=args.stream, backend=args.backend, errors=errors)
+    if errors:
+        _logger.warning(f"{len(errors)} fichiers en erreur, retentés au prochain passage")
+        raise SystemExit(1)
+
+
+def _export(args: argparse.Namespace) -> None:
+    from electriflux.parallel import FileError
+    from electriflux.simple_reader import process_flux_to
+
+    errors: list[FileError] = []
+    process_flux_to(args.flux, args.xml_dir.expanduser(), args.output.expanduser(), batch_rows=args.batch_rows,
+                    format=args.format, config_path=args.config, stream=args.stream, workers=args.workers,
+                    errors=errors, backend=args.backend, batch_files=args.batch_files)
+    if errors:
+        _logger.warning(f"{len(errors)} fichiers en erreur, absents de l'export")
+        raise SystemExit(1)
+
+
+def parser() -> argparse.ArgumentParser:
+    fluxes = list(load_configs(DEFAULT_CONFIG_PATH))
+    root = argparse.ArgumentParser(prog='electriflux', description=__doc__,
+                                   formatter_class=argparse.RawDescriptionHelpFormatter)
+    root.add_argument('-v', '--verbose', action='count', default=0, help="-v : INFO, -vv : DEBUG")
+    commands = root.add_subparsers(dest='command', required=True)
+
+    watch = commands.add_parser('watch', help="Ingestion continue : sFTP -> XML -> stockage Parquet")
+    watch.add_argument('local', type=Path, help="Dossier local des archives extraites")
+    watch.add_argument('--flux', nargs='+', default=fluxes, help="Flux surveillés (tous par défaut)")
+    watch.add_argument('--store', type=Path, help="Stockage Parquet (LOCAL/store par défaut)")
+    watch.add_argument('--config', type=Path, help="Configuration YAML des flux")
+    watch.add_argument('--interval', type=float, default=60.0, help="Secondes entre deux passages")
+    watch.add_argument('--channels', type=int, default=4, help="Canaux sFTP simultanés")
+    watch.add_argument('--workers', type=int, default=2, help="Threads de déchiffrement/extraction")
+    watch.add_argument('--parse-workers', type=int, default=1, help="Processus de lecture XML (0 : tous les cœurs)")
+    watch.add_argument('--queue-size', type=int, default=1024, help="Fichiers en attente d'ingestion au plus")
+    watch.add_argument('--batch-files', type=int, default=256, help="Fichiers par lot écrit")
+    watch.add_argument('--settle', type=float, default=0.0, help="Âge minimal d'un fichier avant ingestion (s)")
+    watch.add_argument('--no-download', action='store_true', help="Ne pas interroger le sFTP")
+    watch.add_argument('--once', action='store_true', help="Un seul passage, puis arrêt")
+    watch.set_defaults(func=_watch)
+
+    ingest = commands.add_parser('ingest', help="Ingestion en un passage de plusieurs flux : XML -> stockage Parquet")
+    ingest.add_argument('root', type=Path, help="Dossier parcouru (sous-dossiers compris)")
+    ingest.add_argument('--flux', nargs='+', default=fluxes, help="Flux ingérés (tous par défaut)")
+    ingest.add_argument('--store', type=Path, help="Stockage Parquet (ROOT/store par défaut)")
+    ingest.add_argument('--config', type=Path, help="Configuration YAML des flux")
+    ingest.add_argument('--workers', type=int, default=0, help="Processus de lecture XML (0 : tous les cœurs)")
+    ingest.add_argument('--batch-files', type=int, default=1024, help="Fichiers lus entre deux écritures")
+    ingest.add_argument('--stream', action='store_true', help="Lecture incrémentale (iterparse) des gros fichiers")
+    ingest.add_argument('--backend', choices=['rows', 'arrow'], default='rows', help="Construction des DataFrames")
+    ingest.set_defaults(func=_ingest)
+
+    export = commands.add_parser('export', help="Export d'un flux par lots : XML -> Parquet, Arrow IPC ou CSV")
+    export.add_argument('flux', choices=fluxes, help="Flux exporté")
+    export.add_argument('xml_dir', type=Path, help="Dossier des fichiers XML (sous-dossiers compris)")
+    export.add_argument('output', type=Path, help="Fichier produit (.parquet, .arrow, .ipc, .feather ou .csv)")
+    export.add_argument('--format', choices=['parquet', 'ipc', 'csv'], help="Format, à défaut de l'extension")
+    export.add_argument('--config', type=Path, help="Configuration YAML des flux")
+    export.add_argument('--workers', type=int, default=0, help="Processus de lecture XML (0 : tous les cœurs)")
+    export.add_argument('--batch-rows', type=int, default=100_000, help="Lignes par lot écrit")
+    export.add_argument('--batch-files', type=int, default=64, help="Fichiers lus entre deux écritures")
+    export.add_argument('--stream', action='store_true', help="Lecture incrémentale (iterparse) des gros fichiers")
+    export.add_argument('--backend', choices=['rows', 'arrow'], default='rows', help="Construction des DataFrames")
+    export.set_defaults(func=_export)
+    return root
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = parser().parse_args(argv)
+    logging.basicConfig(level=[logging.WARNING, logging.INFO, logging.DEBUG][min(args.verbose, 2)],
+                        format='%(asctime)s %(levelname)s %(name)s : %(message)s')
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Accumulation colonne par colonne des valeurs extraites.
+
+Plutôt que de construire un dict par ligne puis un DataFrame à partir d'une liste
+de dicts, les valeurs sont ajoutées directement dans une liste par colonne.
+Le schéma des `data_fields` est connu d'avance grâce au plan compilé ; seules les
+colonnes imbriquées (préfixe + Id_Classe_Temporelle) sont découvertes en cours de route.
+Le résultat est ensuite remis à Arrow, pandas (ArrowDtype) ou polars en une fois.
+"""
+
+from typing import Iterable
+
+import pandas as pd
+import polars as pl
+import pyarrow as pa
+
+
+class ColumnBuilder:
+    """
+    Colonnes de chaînes construites ligne à ligne.
+
+    Les colonnes fixes reçoivent une valeur (éventuellement None) à chaque ligne ;
+    les colonnes dynamiques sont créées à leur première valeur, complétées par None
+    pour les lignes précédentes puis pour chaque ligne qui ne les renseigne pas.
+    """
+
+    def __init__(self, columns: Iterable[str] = ()):
+        self.columns: dict[str, list[str | None]] = {name: [] for name in columns}
+        self._dynamic: list[list[str | None]] = []
+        self.n_rows = 0
+
+    def append_dynamic(self, values: dict[str, str | None]) -> None:
+        """Ajoute les valeurs des colonnes dynamiques de la ligne courante."""
+        columns = self.columns
+        for name, value in values.items():
+            column = columns.get(name)
+            if column is None:
+                column = columns[name] = [None] * self.n_rows
+                self._dynamic.append(column)
+            if len(column) == self.n_rows:
+                column.append(value)
+            else:
+                # Clé déjà renseignée pour cette ligne : la dernière valeur l'emporte
+                column[-1] = value
+
+    def end_row(self) -> None:
+        self.n_rows += 1
+        n_rows = self.n_rows
+        for column in self._dynamic:
+            if len(column) < n_rows:
+                column.append(None)
+
+    def to_arrow(self, meta: dict[str, str] = {}) -> pa.Table:
+        """Table Arrow de chaînes, les métadonnées étant répétées sur chaque ligne."""
+        arrays = {name: pa.array(values, pa.string()) for name, values in self.columns.items()}
+        for name, value in meta.items():
+            arrays[name] = pa.repeat(pa.scalar(value, pa.string()), self.n_rows)
+        return pa.table(arrays) if arrays else pa.table({})
+
+    def to_pandas(self, meta: dict[str, str] = {}) -> pd.DataFrame:
+        """DataFrame pandas adossé à Arrow (colonnes `pd.ArrowDtype(pa.string())`)."""
+        return self.to_arrow(meta).to_pandas(types_mapper=pd.ArrowDtype)
+
+    def to_polars(self, meta: dict[str, str] = {}) -> pl.DataFrame:
+        """DataFrame polars dont toutes les colonnes sont de type Utf8."""
+        df = pl.DataFrame(self.columns, schema={name: pl.Utf8 for name in self.columns})
+        if meta:
+            df = df.with_columns([pl.lit(value, pl.Utf8).alias(name) for name, value in meta.items()])
+        return df
+
+
+class RecordBuilder:
+    """
+    Table longue des enfants imbriqués (voir `FluxPlan.record_extractor`).
+
+    Une ligne par enfant : numéro de la ligne parente ('row'), groupe de blocs
+    ('group'), position de l'enfant dans son groupe ('position'), puis une valeur
+    (éventuellement None) par colonne de champ. Les listes `keys` et `values` sont
+    remplies directement par l'extracteur.
+    """
+
+    KEYS = ('row', 'group', 'position')
+
+    def __init__(self, columns: Iterable[str] = ()):
+        self.columns = list(columns)
+        self.keys: tuple[list[int], list[int], list[int]] = ([], [], [])
+        self.values: list[list[str | None]] = [[] for _ in self.columns]
+
+    def __len__(self) -> int:
+        return len(self.keys[0])
+
+    def to_polars(self) -> pl.DataFrame:
+        """DataFrame polars : clés en UInt32, champs en Utf8."""
+        data = dict(zip(self.KEYS, self.keys)) | dict(zip(self.columns, self.values))
+        schema = {key: pl.UInt32 for key in self.KEYS} | {name: pl.Utf8 for name in self.columns}
+        return pl.DataFrame(data, schema=schema)
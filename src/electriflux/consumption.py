@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""
+Consommations par cadran à partir des relevés d'index (R15, R151, R15_ACC, C15).
+
+Les flux de relevés donnent des index cumulés par cadran (voir `get_consumption_names`).
+Plutôt qu'une boucle pandas par `pdl`, tout est calculé en quelques passes polars :
+ - `index_readings` et `c15_readings` ramènent les relevés à un schéma commun
+   (`READING_SCHEMA`). Les relevés C15 `Avant_` ferment une période de comptage, les
+   relevés `Après_` en ouvrent une nouvelle ;
+ - `consumption_intervals` trie par PRM et date de relevé, découpe chaque PRM en segments
+   (changement de compteur `Num_Compteur`, de calendrier `Id_Calendrier_Distributeur`, ou
+   relevé `Après_` du C15) et calcule la consommation entre deux relevés consécutifs d'un
+   même segment. Un index qui repart de zéro après avoir atteint la capacité du compteur
+   (puissance de 10) est compté comme un tour de compteur, pas comme une consommation négative ;
+ - `prorate` répartit ces consommations sur des périodes de facturation quelconques, au
+   prorata du temps, à partir de la consommation cumulée interpolée aux bornes de chaque
+   période (deux `join_asof`, sans produit PRM × période).
+
+Exemple :
+
+    releves = index_readings(process_flux('R151', xml_dir))
+    c15 = c15_readings(process_flux('C15', c15_dir))
+    intervalles = consumption_intervals(releves, c15)
+    mensuel = prorate(intervalles, periodes)
+"""
+
+import logging
+
+import pandas as pd
+import polars as pl
+
+from electriflux.schema import TIME_ZONE, type_expr
+from electriflux.simple_reader import get_consumption_names
+
+_logger = logging.getLogger(__name__)
+
+CADRANS = get_consumption_names()
+
+DATE_TYPE = pl.Datetime('us', TIME_ZONE)
+
+# Position d'un relevé parmi ceux d'un même PRM à la même date
+AVANT, RELEVE, APRES = 0, 1, 2
+
+READING_SCHEMA = {
+    'pdl': pl.Utf8,
+    'Date_Releve': DATE_TYPE,
+    'Num_Compteur': pl.Utf8,
+    'Id_Calendrier_Distributeur': pl.Utf8,
+    'Ordre': pl.Int8,
+    **{cadran: pl.Float64 for cadran in CADRANS},
+}
+
+# Calendrier distributeur : colonne R151/R15_ACC/C15, à défaut `Id_Calendrier` du R15
+_CALENDAR_COLUMNS = ('Id_Calendrier_Distributeur', 'Id_Calendrier')
+
+# Un index plus petit que le précédent est un tour de compteur si, ramené à la capacité
+# du compteur (plus petite puissance de 10 supérieure à l'index précédent, quelle que soit
+# l'unité), l'écart reste sous cette fraction de la capacité
+ROLLOVER_MARGIN = 0.1
+
+Frame = pl.DataFrame | pl.LazyFrame | pd.DataFrame
+
+
+def _lazy(df: Frame) -> pl.LazyFrame:
+    if isinstance(df, pd.DataFrame):
+        df = pl.from_pandas(df)
+    return df.lazy()
+
+
+def _as_text(schema: pl.Schema, col: str) -> pl.Expr:
+    if col not in schema:
+        return pl.lit(None, pl.Utf8)
+    return pl.col(col).cast(pl.Utf8)
+
+
+def _as_date(schema: pl.Schema, col: str) -> pl.Expr:
+    """`col` en instant Europe/Paris, qu'elle soit déjà typée ou encore en texte."""
+    dtype = schema[col]
+    if isinstance(dtype, pl.Datetime):
+        expr = pl.col(col)
+        expr = expr.dt.replace_time_zone(TIME_ZONE) if dtype.time_zone is None else expr.dt.convert_time_zone(TIME_ZONE)
+        return expr.cast(DATE_TYPE)
+    if dtype == pl.Date:
+        return pl.col(col).cast(pl.Datetime('us')).dt.replace_time_zone(TIME_ZONE, ambiguous='earliest')
+    return type_expr(col, 'DateTime')
+
+
+def _as_index(schema: pl.Schema, col: str, unit: pl.Expr | None) -> pl.Expr:
+    if col not in schema:
+        return pl.lit(None, pl.Float64)
+    value = pl.col(col).cast(pl.Utf8).str.strip_chars().cast(pl.Float64, strict=False) \
+        if schema[col] in (pl.Utf8, pl.Categorical) else pl.col(col).cast(pl.Float64)
+    if unit is not None:
+        value = pl.when(unit == 'Wh').then(value / 1000).otherwise(value)
+    return value
+
+
+def index_readings(df: Frame, prefix: str = '') -> pl.LazyFrame:
+    """
+    Relevés R15, R151 ou R15_ACC au schéma commun `READING_SCHEMA`.
+
+    Les index sont exprimés en kWh : ceux dont la colonne `Unité` vaut 'Wh' sont convertis,
+    les autres sont pris tels quels. Les colonnes peuvent être typées (`typed=True`) ou non.
+
+    Parameters:
+        df: DataFrame polars ou pandas issu de `process_flux`.
+        prefix (str): Préfixe des cadrans, par exemple 'EA_Surplus_' pour le R15_ACC.
+
+    Returns:
+        pl.LazyFrame: Relevés, à passer à `consumption_intervals`.
+    """
+    lf = _lazy(df)
+    schema = lf.collect_schema()
+    calendar = next((col for col in _CALENDAR_COLUMNS if col in schema), '')
+    unit = pl.col('Unité').cast(pl.Utf8) if 'Unité' in schema else None
+    return lf.select(
+        _as_text(schema, 'pdl').alias('pdl'),
+        _as_date(schema, 'Date_Releve').alias('Date_Releve'),
+        _as_text(schema, 'Num_Compteur').alias('Num_Compteur'),
+        _as_text(schema, calendar).alias('Id_Calendrier_Distributeur'),
+        pl.lit(RELEVE, pl.Int8).alias('Ordre'),
+        *[_as_index(schema, prefix + cadran, unit).alias(cadran) for cadran in CADRANS],
+    ).filter(pl.col('pdl').is_not_null() & pl.col('Date_Releve').is_not_null())
+
+
+def c15_readings(df: Frame) -> pl.LazyFrame:
+    """
+    Relevés `Avant_` et `Après_` des évènements C15, au schéma commun `READING_SCHEMA`.
+
+    Le compteur d'un C15 est celui en place après l'évènement : il n'est attribué qu'aux
+    relevés `Après_`, les relevés `Avant_` clôturant le segment en cours quel que soit son compteur.
+    """
+    lf = _lazy(df)
+    schema = lf.collect_schema()
+    sides = []
+    for prefix, position in (('Avant_', AVANT), ('Après_', APRES)):
+        if f'{prefix}Date_Releve' not in schema:
+            continue
+        sides.append(lf.select(
+            _as_text(schema, 'pdl').alias('pdl'),
+            _as_date(schema, f'{prefix}Date_Releve').alias('Date_Releve'),
+            (_as_text(schema, 'Num_Compteur') if position == APRES else pl.lit(None, pl.Utf8)).alias('Num_Compteur'),
+            _as_text(schema, f'{prefix}Id_Calendrier_Distributeur').alias('Id_Calendrier_Distributeur'),
+            pl.lit(position, pl.Int8).alias('Ordre'),
+            *[_as_index(schema, prefix + cadran, None).alias(cadran) for cadran in CADRANS],
+        ).filter(pl.col('pdl').is_not_null() & pl.col('Date_Releve').is_not_null()))
+    if not sides:
+        return pl.LazyFrame(schema=READING_SCHEMA)
+    return pl.concat(sides)
+
+
+def _by_prm(df: pl.DataFrame, *dates: str | pl.Expr) -> list[str | pl.Expr]:
+    """
+    Clés de tri par PRM puis `dates`.
+
+    Des PRM de même longueur et faits de chiffres seulement (les PRM Enedis en ont 14) sont
+    triés comme entiers, dans le même ordre et bien plus vite que comme chaînes.
+    """
+    pdl = pl.col('pdl')
+    length = pdl.str.len_bytes()
+    # Le cast accepte un signe '+' : écarté à part, plus rapide qu'une expression régulière
+    numeric = df.select((length.min() == length.max()) & (length.max() <= 19)
+                        & (pdl.cast(pl.UInt64, strict=False).null_count() == pdl.null_count())
+                        & ~pdl.str.starts_with('+').any()).item()
+    return [pdl.cast(pl.UInt64) if numeric else pdl, *dates]
+
+
+def _known(col: str) -> pl.Expr:
+    """Dernière valeur connue de `col` pour le même PRM, sur une trame triée par `pdl`."""
+    # Sans fenêtre `over('pdl')` : on remplit sur toute la trame, puis on écarte les valeurs
+    # venues d'un autre PRM
+    owner = pl.when(pl.col(col).is_not_null()).then(pl.col('pdl')).forward_fill()
+    return pl.when(owner == pl.col('pdl')).then(pl.col(col).forward_fill())
+
+
+def _changed(col: str) -> pl.Expr:
+    # Valeur connue différente de la dernière valeur connue du PRM
+    return (pl.col(col).is_not_null() & (_known(col) != _known(col).shift(1))).fill_null(False)
+
+
+def consumption_intervals(*readings: Frame, rollover_margin: float = ROLLOVER_MARGIN) -> pl.DataFrame:
+    """
+    Consommation par cadran entre relevés consécutifs d'un même segment de comptage.
+
+    Parameters:
+        readings: Relevés de `index_readings` et/ou `c15_readings`, concaténés ici.
+        rollover_margin (float): Voir `ROLLOVER_MARGIN` ; 0 pour ne jamais supposer de tour de compteur.
+
+    Returns:
+        pl.DataFrame: Une ligne par intervalle, triée par `pdl` et `Date_Debut` :
+            pdl, Date_Debut, Date_Fin, Num_Compteur, Id_Calendrier_Distributeur (ceux en fin
+            d'intervalle), la consommation de chaque cadran (null si l'un des deux index manque)
+            et Tour_Compteur (au moins un cadran a fait le tour du compteur).
+            Les consommations négatives restantes (index rectifiés) sont conservées.
+    """
+    readings = pl.concat([_lazy(r).select(list(READING_SCHEMA)).cast(READING_SCHEMA) for r in readings]).collect()
+    # Relevé C15 `Avant_`, relevé ordinaire puis relevé `Après_` à la même date : une seule clé
+    instant = pl.col('Date_Releve').dt.epoch('us') * 4 + pl.col('Ordre')
+    lf = readings.sort(_by_prm(readings, instant)).lazy()
+    new_segment = ((pl.col('pdl') != pl.col('pdl').shift(1)).fill_null(True)
+                   | (pl.col('Ordre') == APRES)
+                   | _changed('Num_Compteur')
+                   | _changed('Id_Calendrier_Distributeur'))
+
+    # Index précédent ramené à la capacité du compteur : un tour de compteur donne un écart
+    # négatif proche de cette capacité
+    capacity = {cadran: pl.lit(10.0).pow(pl.col(cadran).shift(1).log10().floor() + 1) for cadran in CADRANS}
+    rollover = {cadran: (pl.col(f'_delta_{cadran}') < (rollover_margin - 1) * pl.col(f'_capacite_{cadran}')).fill_null(False)
+                for cadran in CADRANS}
+
+    # Étapes séparées : chaque écart et chaque capacité ne sont calculés qu'une fois
+    return lf.with_columns(
+        new_segment.alias('_debut'),
+        pl.col('Date_Releve').shift(1).alias('Date_Debut'),
+        _known('Num_Compteur'),
+        _known('Id_Calendrier_Distributeur'),
+        *[(pl.col(cadran) - pl.col(cadran).shift(1)).alias(f'_delta_{cadran}') for cadran in CADRANS],
+        *[capacity[cadran].alias(f'_capacite_{cadran}') for cadran in CADRANS],
+    ).filter(~pl.col('_debut')).select(
+        'pdl', 'Date_Debut', pl.col('Date_Releve').alias('Date_Fin'),
+        'Num_Compteur', 'Id_Calendrier_Distributeur',
+        *[pl.when(rollover[cadran]).then(pl.col(f'_capacite_{cadran}') + pl.col(f'_delta_{cadran}'))
+          .otherwise(pl.col(f'_delta_{cadran}')).alias(cadran) for cadran in CADRANS],
+        pl.any_horizontal(rollover.values()).alias('Tour_Compteur'),
+    ).collect()
+
+
+# Clé de `join_asof` : numéro du PRM dans les bits de poids fort, secondes depuis 1970 (décalées
+# pour rester positives) dans les 34 bits de poids faible
+_PRM_SHIFT = 1 << 34
+_EPOCH_OFFSET = 1 << 33
+
+
+def _asof_key(date: str) -> pl.Expr:
+    return pl.col('_prm').cast(pl.Int64) * _PRM_SHIFT + pl.col(date).dt.epoch('s') + _EPOCH_OFFSET
+
+
+def _cumulated(intervals: pl.DataFrame, columns: list[str]) -> pl.DataFrame:
+    """
+    Intervalles triés par PRM et date, avec le cumul de chaque colonne avant leur début
+    (`_avant_<col>`), le numéro du PRM (`_prm`) et la clé de `join_asof` (`_cle`).
+    """
+    previous = pl.col('pdl').shift(1)
+    disordered = (pl.col('pdl') < previous) | ((pl.col('pdl') == previous) & (
+        (pl.col('Date_Debut') < pl.col('Date_Debut').shift(1))
+        | ((pl.col('Date_Debut') == pl.col('Date_Debut').shift(1)) & (pl.col('Date_Fin') < pl.col('Date_Fin').shift(1)))))
+    # Le résultat de `consumption_intervals` est déjà trié : le vérifier coûte moins qu'un tri
+    if intervals.select(disordered.any()).item():
+        intervals = intervals.sort(_by_prm(intervals, 'Date_Debut', 'Date_Fin'))
+    first = (pl.col('pdl') != previous).fill_null(True)
+    before = []
+    for col in columns:
+        total = pl.col(col).fill_null(0).cum_sum() - pl.col(col).fill_null(0)
+        before.append((total - pl.when(first).then(total).forward_fill()).alias(f'_avant_{col}'))
+    return intervals.with_columns(*before, first.cum_sum().alias('_prm')).with_columns(_asof_key('Date_Debut').alias('_cle'))
+
+
+def _at(bounds: pl.DataFrame, cumulated: pl.DataFrame, date: str, columns: list[str]) -> pl.DataFrame:
+    """
+    Cumul de chaque colonne à l'instant `date` de chaque ligne de `bounds` (triées par `_periode`),
+    interpolé dans l'intervalle en cours ; 0 avant le premier intervalle du PRM.
+    """
+    # Un seul entier trié plutôt que `by='pdl'` : la clé de `cumulated` est déjà croissante
+    matched = bounds.with_columns(_asof_key(date).alias('_cle')).sort('_cle').join_asof(
+        cumulated.select('_cle', pl.col('_prm').alias('_prm_intervalle'), pl.col('Date_Debut').alias('_debut'),
+                         pl.col('Date_Fin').alias('_fin'), *columns, *[f'_avant_{col}' for col in columns]),
+        on='_cle', strategy='backward', check_sortedness=False,
+    )
+    span = (pl.col('_fin') - pl.col('_debut')).dt.total_microseconds()
+    elapsed = (pl.col(date) - pl.col('_debut')).dt.total_microseconds()
+    share = pl.when(span > 0).then((elapsed / span).clip(0, 1)).otherwise(1.0)
+    # Intervalle trouvé sur un autre PRM : aucun relevé avant `date` pour ce PRM
+    same = pl.col('_prm_intervalle') == pl.col('_prm')
+    return matched.sort('_periode').select(
+        *[pl.when(same).then(pl.col(f'_avant_{col}') + pl.col(col).fill_null(0) * share).fill_null(0).alias(col)
+          for col in columns],
+    )
+
+
+def prorate(intervals: pl.DataFrame | pl.LazyFrame, periods: Frame) -> pl.DataFrame:
+    """
+    Consommation de chaque cadran sur des périodes de facturation, au prorata du temps.
+
+    Chaque intervalle de `consumption_intervals` est supposé consommer uniformément entre ses
+    deux relevés. Les périodes peuvent se chevaucher et ne pas coïncider avec les relevés.
+
+    Parameters:
+        intervals: Résultat de `consumption_intervals`.
+        periods: Colonnes Date_Debut et Date_Fin, et `pdl` pour des périodes propres à chaque PRM ;
+            sans `pdl`, chaque période s'applique à tous les PRM de `intervals`. Les autres
+            colonnes sont conservées.
+
+    Returns:
+        pl.DataFrame: Les colonnes de `periods` (et `pdl`), la consommation de chaque cadran
+            (null pour un cadran jamais relevé sur le PRM) et Couverture, la part de la période
+            couverte par des intervalles connus (entre 0 et 1).
+    """
+    intervals = intervals.lazy().collect()
+    periods = _lazy(periods)
+    schema = periods.collect_schema()
+    periods = periods.with_columns(_as_date(schema, 'Date_Debut').alias('Date_Debut'),
+                                   _as_date(schema, 'Date_Fin').alias('Date_Fin'))
+    if 'pdl' not in schema:
+        periods = intervals.lazy().select(pl.col('pdl').unique(maintain_order=True)).join(periods, how='cross')
+    periods = periods.collect()
+
+    columns = [*CADRANS, '_duree']
+    cumulated = _cumulated(intervals.with_columns(
+        (pl.col('Date_Fin') - pl.col('Date_Debut')).dt.total_microseconds().cast(pl.Float64).alias('_duree')),
+        columns)
+    # Numéro de PRM et cadrans relevés au moins une fois, par PRM
+    prms = cumulated.group_by('pdl', maintain_order=True).agg(
+        pl.col('_prm').first(), *[pl.col(cadran).is_not_null().any().alias(f'_releve_{cadran}') for cadran in CADRANS])
+    bounds = periods.select('pdl', 'Date_Debut', 'Date_Fin').with_row_index('_periode').join(
+        prms, on='pdl', how='left', maintain_order='left')
+    end = _at(bounds, cumulated, 'Date_Fin', columns)
+    start = _at(bounds, cumulated, 'Date_Debut', columns)
+
+    length = (pl.col('Date_Fin') - pl.col('Date_Debut')).dt.total_microseconds()
+    return pl.concat([periods, bounds.select(pl.col(f'_releve_{c}').fill_null(False) for c in CADRANS),
+                      end, start.rename(lambda col: f'{col}_debut')], how='horizontal').select(
+        *[col for col in periods.columns if col not in CADRANS],
+        *[pl.when(pl.col(f'_releve_{cadran}')).then(pl.col(cadran) - pl.col(f'{cadran}_debut')).alias(cadran)
+          for cadran in CADRANS],
+        pl.when(length > 0).then((pl.col('_duree') - pl.col('_duree_debut')) / length).alias('Couverture'),
+    )
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Index inversé PRM -> (fichier, position) sur l'archive des flux.
+
+Pour chaque fichier indexé, on enregistre la position en octets des blocs XML
+contenant les lignes de chaque PRM : l'élément `row_level` lui-même (C15, R15...)
+ou, lorsque des champs remontent vers les parents ('../' dans `data_fields`,
+ex. F12/F15), l'ancêtre qui porte ce contexte. Une recherche relit directement
+ces quelques blocs et les extrait avec le plan compilé habituel.
+
+L'index est une base SQLite, mise à jour incrémentalement : seuls les fichiers
+nouveaux ou modifiés (ou dont la configuration a changé) sont réindexés.
+"""
+
+import os
+import json
+import sqlite3
+import logging
+from pathlib import Path
+
+import pandas as pd
+from lxml import etree as ET
+
+from electriflux.plan import DEFAULT_CONFIG_PATH, FluxPlan, compile_flux, load_flux_config
+from electriflux.rowscan import element_spans, wrap_fragment
+from electriflux.simple_reader import find_xml_files
+
+_logger = logging.getLogger(__name__)
+
+PRM_FIELD = 'pdl'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    flux TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    fingerprint TEXT NOT NULL,
+    encoding TEXT,
+    meta TEXT NOT NULL,
+    UNIQUE (flux, path)
+);
+CREATE TABLE IF NOT EXISTS blocks (
+    pdl TEXT NOT NULL,
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS blocks_pdl ON blocks (pdl);
+CREATE INDEX IF NOT EXISTS blocks_file ON blocks (file_id);
+"""
+
+
+def _block_positions(xml_path: Path, plan: FluxPlan) -> tuple[list[tuple[str, int, int]], dict[str, str], str | None]:
+    """
+    Parse un fichier et renvoie les blocs (pdl, offset, longueur), les métadonnées et l'encodage.
+    """
+    tree = ET.parse(str(xml_path))
+    root = tree.getroot()
+    rows = root.findall(plan.row_level)
+    if not rows:
+        return [], plan.extract_metadata(root), tree.docinfo.encoding
+
+    def block_of(row: ET._Element) -> ET._Element:
+        for _ in range(plan.depth):
+            parent = row.getparent()
+            if parent is None or parent is root:
+                break
+            row = parent
+        return row
+
+    extract = plan.row_extractor()
+    blocks: dict[ET._Element, set[str]] = {}
+    for row in rows:
+        pdl = extract(row).get(PRM_FIELD)
+        if pdl is not None:
+            blocks.setdefault(block_of(row), set()).add(pdl)
+
+    # Le n-ième élément d'une balise dans l'arbre est le n-ième repéré dans les octets
+    with open(xml_path, 'rb') as f:
+        content = f.read()
+    positions = []
+    for tag in {block.tag for block in blocks}:
+        order = {elem: i for i, elem in enumerate(e for e in root.iter(tag) if e.getparent() is not None)}
+        spans = element_spans(content, tag)
+        if len(spans) != len(order):
+            raise ValueError(f"{xml_path}: {len(order)} éléments {tag} dans l'arbre, {len(spans)} dans le fichier")
+        for block, prms in blocks.items():
+            if block.tag == tag:
+                offset, length = spans[order[block]]
+                positions.extend((pdl, offset, length) for pdl in prms)
+    return positions, plan.extract_metadata(root), tree.docinfo.encoding
+
+
+class PrmIndex:
+    """
+    Index persistant des PRM de l'archive.
+
+    Parameters:
+        path (Path): Base SQLite de l'index (créée si besoin).
+        config_path (Path, optional): Configuration YAML des flux.
+    """
+
+    def __init__(self, path: Path, config_path: Path | None = None):
+        self.path = Path(path)
+        self.config_path = config_path or DEFAULT_CONFIG_PATH
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path)
+        self._conn.execute('PRAGMA foreign_keys = ON')
+        self._conn.execute('PRAGMA journal_mode = WAL')
+        self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def __enter__(self) -> 'PrmIndex':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def update(self, flux_type: str, xml_files: list[Path]) -> int:
+        """
+        Indexe les fichiers nouveaux ou modifiés d'un flux ; oublie ceux qui ont disparu.
+
+        Returns:
+            int: Nombre de fichiers (ré)indexés.
+        """
+        plan = compile_flux(flux_type, self.config_path)
+        known = {path: (file_id, size, mtime, fingerprint) for file_id, path, size, mtime, fingerprint in
+                 self._conn.execute('SELECT id, path, size, mtime_ns, fingerprint FROM files WHERE flux = ?', (flux_type,))}
+        present = {str(Path(f).resolve()): f for f in xml_files}
+
+        with self._conn:
+            for path in set(known) - set(present):
+                self._conn.execute('DELETE FROM files WHERE id = ?', (known[path][0],))
+
+        indexed = 0
+        for path, xml_file in present.items():
+            stat = os.stat(xml_file)
+            previous = known.get(path)
+            if previous is not None and previous[1:] == (stat.st_size, stat.st_mtime_ns, plan.fingerprint):
+                continue
+            try:
+                positions, meta, encoding = _block_positions(xml_file, plan)
+            except Exception as e:
+                _logger.error(f"Indexation impossible de {xml_file}: {e}")
+                continue
+            # Un fichier par transaction : une interruption ne perd que le fichier en cours
+            with self._conn:
+                if previous is not None:
+                    self._conn.execute('DELETE FROM files WHERE id = ?', (previous[0],))
+                cursor = self._conn.execute(
+                    'INSERT INTO files (flux, path, size, mtime_ns, fingerprint, encoding, meta) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (flux_type, path, stat.st_size, stat.st_mtime_ns, plan.fingerprint, encoding, json.dumps(meta)))
+                self._conn.executemany('INSERT INTO blocks (pdl, file_id, offset, length) VALUES (?, ?, ?, ?)',
+                                       [(pdl, cursor.lastrowid, offset, length) for pdl, offset, length in positions])
+            indexed += 1
+        _logger.info(f"Index {flux_type} : {indexed} fichiers indexés sur {len(present)}")
+        return indexed
+
+    def update_dir(self, flux_type: str, xml_dir: Path) -> int:
+        """Indexe les fichiers d'un dossier correspondant au `file_regex` du flux."""
+        config = load_flux_config(flux_type, self.config_path)
+        return self.update(flux_type, find_xml_files(xml_dir, config.get('file_regex', None)))
+
+    def locate(self, pdl: str, fluxes: list[str] | None = None) -> list[tuple[str, str, int, int, str | None, str]]:
+        """Blocs (flux, fichier, offset, longueur, encodage, métadonnées) contenant ce PRM."""
+        query = ('SELECT f.flux, f.path, b.offset, b.length, f.encoding, f.meta '
+                 'FROM blocks b JOIN files f ON f.id = b.file_id WHERE b.pdl = ?')
+        params: list = [pdl]
+        if fluxes is not None:
+            query += f" AND f.flux IN ({', '.join('?' * len(fluxes))})"
+            params.extend(fluxes)
+        return self._conn.execute(query + ' ORDER BY f.flux, f.id, b.offset', params).fetchall()
+
+    def lookup(self, pdl: str, fluxes: list[str] | None = None) -> dict[str, pd.DataFrame]:
+        """
+        Lignes d'un PRM, par flux, relues directement aux positions indexées.
+
+        Returns:
+            dict[str, pd.DataFrame]: Un DataFrame par flux où le PRM apparaît, construit comme
+            par `xml_to_dataframe` (champs de la configuration puis métadonnées).
+        """
+        rows: dict[str, list[dict]] = {}
+        handles: dict[str, object] = {}
+        try:
+            for flux_type, path, offset, length, encoding, meta in self.locate(pdl, fluxes):
+                plan = compile_flux(flux_type, self.config_path)
+                f = handles.get(path)
+                if f is None:
+                    f = handles[path] = open(path, 'rb')
+                f.seek(offset)
+                fragment = ET.fromstring(wrap_fragment(f.read(length), encoding))
+                extract = plan.row_extractor()
+                meta = json.loads(meta)
+                for row in fragment.findall(plan.row_level):
+                    row_data = extract(row)
+                    if row_data.get(PRM_FIELD) == pdl:
+                        rows.setdefault(flux_type, []).append(row_data | meta)
+        finally:
+            for f in handles.values():
+                f.close()
+        return {flux_type: pd.DataFrame(flux_rows) for flux_type, flux_rows in rows.items()}
+
+
+def lookup_prm(pdl: str, index_path: Path, fluxes: list[str] | None = None,
+               config_path: Path | None = None) -> dict[str, pd.DataFrame]:
+    """
+    Historique complet d'un PRM dans les flux indexés (voir `PrmIndex`).
+
+    Parameters:
+        pdl (str): Identifiant du PRM.
+        index_path (Path): Base SQLite de l'index, construite avec `PrmIndex.update_dir`.
+        fluxes (list[str], optional): Flux à interroger (ex. ['C15', 'R15']), tous par défaut.
+    """
+    with PrmIndex(index_path, config_path) as index:
+        return index.lookup(pdl, fluxes)
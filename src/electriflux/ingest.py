@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Ingestion de plusieurs flux en un seul passage, sur un pool de processus partagé.
+
+Plutôt qu'un `process_flux` par flux, chacun parcourant son dossier puis lisant ses
+fichiers sur un seul cœur, `ingest_fluxes` :
+ - parcourt une seule fois l'arborescence racine ;
+ - attribue chaque fichier XML à un flux (`route_file`) : d'abord par `file_regex`, puis,
+   si plusieurs flux restent possibles, par l'élément racine du document (`root_element`
+   dans la configuration, le nom du flux par défaut). Le routage considère tous les flux
+   de la configuration, puis ne garde que les flux demandés : un F12 n'est jamais lu comme
+   un F15, même si seul F15 est demandé ;
+ - lit les fichiers de tous les flux sur un seul pool de processus, sans le vider entre
+   deux flux (voir `map_grouped_pairs`) ;
+ - écrit le résultat dans un seul stockage Parquet (voir electriflux.store), par lots.
+   Les fichiers déjà inscrits au manifeste ne sont pas relus.
+
+Usage : `electriflux ingest` (voir electriflux.cli), ou
+
+    ingest_fluxes(Path('~/data/flux_enedis').expanduser(), ['C15', 'F12', 'F15', 'R151'])
+"""
+
+import os
+import re
+import logging
+import functools
+from pathlib import Path
+from typing import Any, Iterator, NamedTuple
+
+from lxml import etree as ET
+
+from electriflux.metrics import Metrics, timed
+from electriflux.parallel import FileError, map_grouped_pairs, process_pool, resolve_workers
+from electriflux.plan import DEFAULT_CONFIG_PATH, load_configs
+from electriflux.rollup import update_rollups
+from electriflux.simple_reader import xml_to_dataframe
+from electriflux.store import processed_files, write_parsed
+
+_logger = logging.getLogger(__name__)
+
+
+class Route(NamedTuple):
+    """Règles d'attribution d'un fichier à un flux."""
+    flux: str
+    pattern: re.Pattern | None
+    root: str
+
+
+def flux_routes(configs: dict[str, Any]) -> list[Route]:
+    """Une règle par flux de la configuration, dans l'ordre du fichier YAML."""
+    return [Route(flux, re.compile(config['file_regex']) if config.get('file_regex') else None,
+                  config.get('root_element', flux))
+            for flux, config in configs.items()]
+
+
+def root_tag(path: Path) -> str | None:
+    """Nom local de l'élément racine, sans lire le reste du document ; None si illisible."""
+    try:
+        with open(path, 'rb') as file:
+            for _, elem in ET.iterparse(file, events=('start',)):
+                return ET.QName(elem).localname
+    except (OSError, ET.XMLSyntaxError) as e:
+        _logger.debug(f"Racine illisible pour {path} : {e}")
+    return None
+
+
+def route_file(path: Path, routes: list[Route]) -> str | None:
+    """
+    Flux d'un fichier XML, ou None s'il ne correspond à aucun flux.
+
+    Un seul flux dont le `file_regex` (ou l'absence de `file_regex`) accepte le nom : ce flux.
+    Sinon l'élément racine départage les candidats.
+    """
+    candidates = [route for route in routes if route.pattern is None or route.pattern.search(path.name)]
+    if len(candidates) <= 1:
+        return candidates[0].flux if candidates else None
+    tag = root_tag(path)
+    matches = [route.flux for route in candidates if route.root == tag]
+    if len(matches) > 1:
+        _logger.warning(f"{path} : racine <{tag}> commune à {matches}, fichier ignoré")
+        return None
+    return matches[0] if matches else None
+
+
+def _walk(root: Path, suffix: str) -> Iterator[Path]:
+    # os.scandir : le type de chaque entrée est connu sans appel à stat
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError as e:
+            _logger.warning(f"Dossier illisible {directory} : {e}")
+            continue
+        subdirs = []
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(Path(entry.path))
+            elif entry.name.endswith(suffix):
+                yield Path(entry.path)
+        # Sous-dossiers parcourus dans l'ordre alphabétique
+        stack.extend(reversed(subdirs))
+
+
+def discover_files(root: Path,
+                   routes: list[Route],
+                   fluxes: list[str],
+                   exclude: dict[str, set[str]] | None = None) -> dict[str, list[Path]]:
+    """
+    Fichiers XML de `root` attribués à chacun des `fluxes`, en un seul parcours.
+
+    Parameters:
+        routes (list[Route]): Règles de tous les flux connus (voir `flux_routes`).
+        fluxes (list[str]): Flux retenus ; les fichiers des autres flux sont ignorés.
+        exclude (dict[str, set[str]], optional): Noms de fichiers déjà traités, par flux.
+            Un fichier n'est écarté que si son nom figure parmi ceux de son propre flux ; il
+            n'est pas ouvert si son nom figure parmi ceux de tous les flux retenus qu'il peut
+            désigner (F12 et F15 partagent le même `file_regex`).
+
+    Returns:
+        dict[str, list[Path]]: Fichiers de chaque flux, dans l'ordre du parcours.
+    """
+    exclude = exclude or {}
+    found: dict[str, list[Path]] = {flux: [] for flux in fluxes}
+    seen = ignored = 0
+    for path in _walk(root, '.xml'):
+        seen += 1
+        candidates = [route.flux for route in routes
+                      if route.flux in found and (route.pattern is None or route.pattern.search(path.name))]
+        if candidates and all(path.name in exclude.get(flux, ()) for flux in candidates):
+            continue
+        flux = route_file(path, routes)
+        if flux not in found:
+            ignored += 1
+        elif path.name not in exclude.get(flux, ()):
+            found[flux].append(path)
+    _logger.info(f"{seen} fichiers XML parcourus sous {root} : "
+                 + ', '.join(f"{flux} {len(paths)}" for flux, paths in found.items())
+                 + f", {ignored} ignorés")
+    return found
+
+
+def _batches(found: dict[str, list[Path]], batch_files: int) -> Iterator[dict[str, list[Path]]]:
+    pending = [(flux, path) for flux, paths in found.items() for path in paths]
+    for start in range(0, len(pending), batch_files):
+        batch: dict[str, list[Path]] = {}
+        for flux, path in pending[start:start + batch_files]:
+            batch.setdefault(flux, []).append(path)
+        yield batch
+
+
+def ingest_fluxes(root: Path,
+                  fluxes: list[str] | None = None,
+                  store_dir: Path | None = None,
+                  config_path: Path | str | None = None,
+                  workers: int | None = None,
+                  batch_files: int = 1024,
+                  stream: bool = False,
+                  backend: str = 'rows',
+                  errors: list[FileError] | None = None,
+                  metrics: Metrics | None = None) -> dict[str, int]:
+    """
+    Lit les nouveaux fichiers de plusieurs flux sous `root` et les écrit dans le stockage Parquet.
+
+    Parameters:
+        root (Path): Racine parcourue (sous-dossiers compris).
+        fluxes (list[str], optional): Flux à ingérer, tous ceux de la configuration par défaut.
+        store_dir (Path, optional): Stockage Parquet, `root/store` par défaut.
+        workers (int | None): Processus du pool partagé ; None ou 0 pour tous les cœurs.
+        batch_files (int): Fichiers lus entre deux écritures, tous flux confondus : borne la mémoire.
+        stream, backend: Voir `simple_reader.xml_to_dataframe`.
+        errors (list[FileError], optional): Reçoit les fichiers en erreur, qui ne sont pas inscrits
+            au manifeste et seront retentés au prochain passage.
+        metrics (Metrics, optional): Mesures par étape ('discovery', étapes de lecture, 'store').
+
+    Returns:
+        dict[str, int]: Nombre de lignes écrites par flux.
+    """
+    configs = load_configs(config_path or DEFAULT_CONFIG_PATH)
+    fluxes = list(configs) if fluxes is None else list(fluxes)
+    unknown = [flux for flux in fluxes if flux not in configs]
+    if unknown:
+        raise ValueError(f"Unknown flux type: {', '.join(unknown)}")
+    store_dir = Path(store_dir) if store_dir is not None else Path(root) / 'store'
+
+    with timed(metrics, 'discovery'):
+        exclude = {flux: processed_files(store_dir, flux) for flux in fluxes}
+        found = discover_files(Path(root), flux_routes(configs), fluxes, exclude)
+
+    parsers = {flux: functools.partial(xml_to_dataframe, row_level=configs[flux]['row_level'],
+                                       metadata_fields=configs[flux]['metadata_fields'],
+                                       data_fields=configs[flux]['data_fields'],
+                                       nested_fields=configs[flux]['nested_fields'],
+                                       stream=stream, backend=backend)
+               for flux in fluxes}
+    total = sum(len(paths) for paths in found.values())
+    workers = min(resolve_workers(workers), max(1, total))
+    executor = process_pool(workers) if workers > 1 else None
+    rows = {flux: 0 for flux in fluxes}
+    try:
+        for batch in _batches(found, batch_files):
+            parsed = map_grouped_pairs(parsers, batch, executor, workers, errors, metrics)
+            for flux, pairs in parsed.items():
+                with timed(metrics, 'store'):
+                    rows[flux] += write_parsed(store_dir, flux, pairs, configs[flux].get('partition_field'))
+                with timed(metrics, 'rollup'):
+                    update_rollups(store_dir, flux, configs[flux].get('rollups'))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    _logger.info("Lignes écrites : " + ', '.join(f"{flux} {n}" for flux, n in rows.items()))
+    return rows
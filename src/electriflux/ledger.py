@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Registre des fichiers déjà traités, en ajout seul et résistant aux interruptions.
+
+Remplace les fichiers `processed_zips.csv` (téléchargements) et `history.csv`
+(lectures incrémentales), qui étaient réécrits en entier à chaque exécution et
+seulement à la fin de celle-ci. Le registre est une base SQLite en mode WAL :
+chaque fichier est enregistré dans sa propre transaction dès qu'il est traité,
+une interruption ne perd donc que le fichier en cours.
+
+Une même base héberge plusieurs registres, distingués par un espace de noms
+(ex. 'processed_zips', 'history'). Un ancien CSV présent à côté de la base est
+importé automatiquement, puis de nouveau s'il est modifié.
+"""
+
+import os
+import sqlite3
+import logging
+import datetime
+from pathlib import Path
+from typing import Iterable
+
+import pandas as pd
+
+_logger = logging.getLogger(__name__)
+
+LEDGER_NAME = 'ledger.db'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    namespace TEXT NOT NULL,
+    name TEXT NOT NULL,
+    flux TEXT,
+    processed_at TEXT NOT NULL,
+    PRIMARY KEY (namespace, name)
+);
+CREATE TABLE IF NOT EXISTS imports (
+    namespace TEXT NOT NULL,
+    source TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    PRIMARY KEY (namespace, source)
+);
+"""
+
+
+class Ledger:
+    """
+    Registre d'un espace de noms : ensemble de noms de fichiers traités.
+
+    Parameters:
+        path (Path): Base SQLite (créée si besoin).
+        namespace (str): Registre à utiliser dans cette base.
+        legacy_csv (Path, optional): Ancien registre CSV à importer. Sa première colonne
+            porte les noms ('zip_name' ou 'file'), les colonnes 'flux' et 'processed_at'
+            sont reprises si présentes.
+
+    Les noms déjà enregistrés sont gardés en mémoire : `name in ledger` ne fait pas
+    de requête.
+    """
+
+    def __init__(self, path: Path, namespace: str, legacy_csv: Path | None = None):
+        self.path = Path(path)
+        self.namespace = namespace
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path)
+        self._conn.execute('PRAGMA journal_mode = WAL')
+        # Une transaction validée survit à un arrêt du processus ; seule une coupure
+        # d'alimentation peut perdre les dernières, sans jamais corrompre la base
+        self._conn.execute('PRAGMA synchronous = NORMAL')
+        self._conn.executescript(_SCHEMA)
+        if legacy_csv is not None:
+            self._import_csv(Path(legacy_csv))
+        self._names = {name for name, in self._conn.execute(
+            'SELECT name FROM entries WHERE namespace = ?', (namespace,))}
+
+    def _import_csv(self, csv_path: Path) -> None:
+        if not csv_path.exists():
+            return
+        mtime = os.stat(csv_path).st_mtime_ns
+        row = self._conn.execute('SELECT mtime_ns FROM imports WHERE namespace = ? AND source = ?',
+                                 (self.namespace, str(csv_path.resolve()))).fetchone()
+        if row is not None and row[0] == mtime:
+            return
+        df = pd.read_csv(csv_path, dtype=str)
+        if df.empty or len(df.columns) == 0:
+            names = []
+        else:
+            names = df.iloc[:, 0].tolist()
+        flux = df['flux'].tolist() if 'flux' in df.columns else [None] * len(names)
+        now = datetime.datetime.now().isoformat()
+        processed_at = df['processed_at'].fillna(now).tolist() if 'processed_at' in df.columns else [now] * len(names)
+        with self._conn:
+            self._conn.executemany(
+                'INSERT OR IGNORE INTO entries (namespace, name, flux, processed_at) VALUES (?, ?, ?, ?)',
+                [(self.namespace, n, f, p) for n, f, p in zip(names, flux, processed_at) if isinstance(n, str)])
+            self._conn.execute('INSERT OR REPLACE INTO imports (namespace, source, mtime_ns) VALUES (?, ?, ?)',
+                               (self.namespace, str(csv_path.resolve()), mtime))
+        _logger.info(f"{len(names)} entrées importées de {csv_path} dans le registre {self.namespace}")
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._names
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def names(self) -> set[str]:
+        return set(self._names)
+
+    def add(self, name: str, flux: str | None = None) -> None:
+        """Enregistre un fichier traité (transaction immédiatement validée)."""
+        self.add_many([name], flux)
+
+    def add_many(self, names: Iterable[str], flux: str | None = None) -> None:
+        """Enregistre plusieurs fichiers, dans une seule transaction."""
+        now = datetime.datetime.now().isoformat()
+        rows = [(self.namespace, name, flux, now) for name in names]
+        with self._conn:
+            self._conn.executemany(
+                'INSERT OR IGNORE INTO entries (namespace, name, flux, processed_at) VALUES (?, ?, ?, ?)', rows)
+        self._names.update(name for _, name, _, _ in rows)
+
+    def entries(self) -> pd.DataFrame:
+        """Entrées du registre (name, flux, processed_at), dans l'ordre d'enregistrement."""
+        return pd.read_sql_query(
+            'SELECT name, flux, processed_at FROM entries WHERE namespace = ? ORDER BY rowid',
+            self._conn, params=(self.namespace,))
+
+    def reset(self) -> None:
+        """Vide ce registre (les anciens CSV déjà importés ne sont pas réimportés)."""
+        with self._conn:
+            self._conn.execute('DELETE FROM entries WHERE namespace = ?', (self.namespace,))
+        self._names.clear()
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def __enter__(self) -> 'Ledger':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
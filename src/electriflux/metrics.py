@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Mesures par étape de la chaîne de traitement.
+
+Un objet `Metrics`, passé en paramètre `metrics` (comme `errors`), collecte :
+ - le temps passé dans chaque étape : recherche des fichiers ('discovery'), analyse
+   XML ('parse'), extraction des champs ('extract'), construction des DataFrame
+   ('frame'), concaténation ('concat'), typage ('types'), écriture dans le stockage
+   Parquet ('store'), et pour les téléchargements 'download', 'decrypt' et 'unzip' ;
+ - par fichier, le nombre de lignes et d'octets lus ;
+ - les erreurs de traitement ;
+ - les octets téléchargés et déchiffrés.
+
+Chaque mesure est aussi transmise aux `Hooks` fournis, au fil de l'eau. `Metrics.report()`
+en donne une synthèse structurée (dictionnaire sérialisable en JSON).
+
+Sans objet `Metrics`, rien n'est mesuré : le code instrumenté ne fait qu'un test à None.
+Les étapes internes à un fichier ('parse', 'extract', 'frame') sont mesurées dans le
+processus qui le traite et renvoyées avec son résultat.
+"""
+
+import os
+import time
+import logging
+import threading
+import contextlib
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator, TypeVar
+
+_logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+# Étapes mesurées dans le processus qui traite un fichier (voir `file_stages`)
+_local = threading.local()
+
+
+@dataclass
+class FileMetrics:
+    """Mesures d'un fichier traité."""
+    file: str
+    rows: int
+    bytes: int
+    seconds: float
+    stages: dict[str, float] = field(default_factory=dict)
+
+
+class Hooks:
+    """
+    Points d'extension appelés au fil du traitement ; les méthodes à redéfinir ne font rien par défaut.
+    Les appels peuvent provenir de plusieurs threads (téléchargements en parallèle).
+    """
+
+    def on_stage(self, stage: str, seconds: float, file: str | None = None) -> None:
+        """Fin d'une étape (pour un fichier donné pour les étapes internes à un fichier)."""
+
+    def on_file(self, metrics: FileMetrics) -> None:
+        """Fichier traité avec succès."""
+
+    def on_error(self, file: str, error_type: str, message: str) -> None:
+        """Fichier en erreur."""
+
+    def on_transfer(self, kind: str, name: str, n_bytes: int) -> None:
+        """
+        Octets transférés : kind vaut 'downloaded' ou 'decrypted', ou, pour les octets
+        économisés par la synchronisation (voir electriflux.sync), 'resumed' (repris d'un
+        transfert interrompu) et 'unchanged' (fichiers à jour non retransférés).
+        """
+
+
+class LoggingHooks(Hooks):
+    """Journalise chaque mesure au niveau DEBUG."""
+
+    def on_stage(self, stage: str, seconds: float, file: str | None = None) -> None:
+        _logger.debug(f"{stage} : {seconds:.3f} s" + (f" ({file})" if file else ""))
+
+    def on_file(self, metrics: FileMetrics) -> None:
+        _logger.debug(f"{metrics.file} : {metrics.rows} lignes, {metrics.bytes} octets, {metrics.seconds:.3f} s")
+
+    def on_error(self, file: str, error_type: str, message: str) -> None:
+        _logger.debug(f"{file} : {error_type} {message}")
+
+    def on_transfer(self, kind: str, name: str, n_bytes: int) -> None:
+        _logger.debug(f"{name} : {n_bytes} octets ({kind})")
+
+
+class Metrics(Hooks):
+    """
+    Collecteur des mesures, qui les relaie aux `hooks`.
+
+    Parameters:
+        hooks (Hooks | Iterable[Hooks]): Destinataires des mesures au fil de l'eau.
+        keep_files (bool): Conserver les mesures de chaque fichier pour le rapport.
+    """
+
+    def __init__(self, hooks: Hooks | Iterable[Hooks] = (), keep_files: bool = True):
+        self.hooks = [hooks] if isinstance(hooks, Hooks) else list(hooks)
+        self.keep_files = keep_files
+        self.stages: dict[str, float] = {}
+        self.stage_calls: dict[str, int] = {}
+        self.files: list[FileMetrics] = []
+        self.file_count = 0
+        self.rows = 0
+        self.bytes_read = 0
+        self.errors: list[tuple[str, str, str]] = []
+        self.transferred: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def stage(self, stage: str) -> Iterator[None]:
+        """Mesure le bloc englobé comme une étape."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.on_stage(stage, time.perf_counter() - start)
+
+    def on_stage(self, stage: str, seconds: float, file: str | None = None) -> None:
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+            self.stage_calls[stage] = self.stage_calls.get(stage, 0) + 1
+        for hook in self.hooks:
+            hook.on_stage(stage, seconds, file)
+
+    def on_file(self, metrics: FileMetrics) -> None:
+        with self._lock:
+            self.file_count += 1
+            self.rows += metrics.rows
+            self.bytes_read += metrics.bytes
+            if self.keep_files:
+                self.files.append(metrics)
+        for stage, seconds in metrics.stages.items():
+            self.on_stage(stage, seconds, metrics.file)
+        for hook in self.hooks:
+            hook.on_file(metrics)
+
+    def on_error(self, file: str, error_type: str, message: str) -> None:
+        with self._lock:
+            self.errors.append((file, error_type, message))
+        for hook in self.hooks:
+            hook.on_error(file, error_type, message)
+
+    def on_transfer(self, kind: str, name: str, n_bytes: int) -> None:
+        with self._lock:
+            self.transferred[kind] = self.transferred.get(kind, 0) + n_bytes
+        for hook in self.hooks:
+            hook.on_transfer(kind, name, n_bytes)
+
+    def report(self) -> dict[str, Any]:
+        """Synthèse des mesures, sérialisable en JSON."""
+        with self._lock:
+            return {
+                'stages': {stage: {'seconds': seconds, 'calls': self.stage_calls[stage]}
+                           for stage, seconds in self.stages.items()},
+                'files': self.file_count,
+                'rows': self.rows,
+                'bytes': self.bytes_read,
+                'errors': len(self.errors),
+                'error_details': [{'file': f, 'error_type': t, 'message': m} for f, t, m in self.errors],
+                'transferred': dict(self.transferred),
+                'per_file': [asdict(f) for f in self.files],
+            }
+
+
+def file_stages() -> dict[str, float] | None:
+    """Étapes du fichier en cours de traitement dans ce processus, None si rien n'est mesuré."""
+    return getattr(_local, 'stages', None)
+
+
+def lap(stages: dict[str, float], stage: str, start: float) -> float:
+    """Ajoute le temps écoulé depuis `start` à l'étape et renvoie l'instant présent."""
+    now = time.perf_counter()
+    stages[stage] = stages.get(stage, 0.0) + now - start
+    return now
+
+
+def measured_call(func: Callable[[Path], T], path: Path) -> tuple[T, dict[str, float], float]:
+    """
+    Appelle `func(path)` en mesurant ses étapes internes (picklable avec `functools.partial`).
+
+    Returns:
+        tuple: (résultat, étapes, durée totale en secondes).
+    """
+    _local.stages = stages = {}
+    start = time.perf_counter()
+    try:
+        result = func(path)
+    finally:
+        _local.stages = None
+    return result, stages, time.perf_counter() - start
+
+
+def record_file(metrics: Metrics, path: Path, result: Any, stages: dict[str, float], seconds: float) -> None:
+    """Transmet les mesures d'un fichier traité (lignes : `len(result)`)."""
+    try:
+        size = os.stat(path).st_size
+    except OSError:
+        size = 0
+    metrics.on_file(FileMetrics(str(path), len(result) if result is not None else 0, size, seconds, stages))
+
+
+_UNMEASURED = contextlib.nullcontext()
+
+
+def timed(metrics: Metrics | None, stage: str) -> contextlib.AbstractContextManager:
+    """`metrics.stage(stage)`, ou un contexte vide sans objet `Metrics`."""
+    return _UNMEASURED if metrics is None else metrics.stage(stage)
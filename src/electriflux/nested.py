@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Linéarisation vectorisée des champs imbriqués (`nested_fields`).
+
+En mode table longue, l'extraction ne produit pas les colonnes préfixe + Id_Classe_Temporelle
+ligne à ligne : chaque enfant imbriqué (ex. Classe_Temporelle_Distributeur) devient une ligne
+d'une table longue, avec le numéro de la ligne parente et les champs lus sur l'enfant
+(Id_Classe_Temporelle, Valeur, Classe_Mesure, Code_Qualification...). Voir
+`FluxPlan.record_extractor`.
+
+Les conditions, préfixes et `additional_fields` de chaque bloc sont ensuite appliqués ici,
+en polars : un filtre par bloc, puis un pivot vers les colonnes larges. Le résultat est
+identique à la linéarisation ligne à ligne : mêmes colonnes, dans le même ordre, et mêmes
+règles en cas de doublon (la dernière valeur d'un identifiant l'emporte, le premier
+`additional_fields` trouvé est conservé).
+"""
+
+import logging
+
+import polars as pl
+
+from electriflux.plan import FluxPlan
+
+_logger = logging.getLogger(__name__)
+
+_CELL_SCHEMA = {
+    'row': pl.UInt32,
+    'column': pl.Utf8,
+    'value': pl.Utf8,
+    'group': pl.UInt32,
+    'block': pl.UInt32,
+    'position': pl.UInt32,
+    'rank': pl.UInt32,
+    'additional': pl.Boolean,
+}
+
+
+def nested_cells(records: pl.DataFrame, plan: FluxPlan) -> pl.DataFrame:
+    """
+    Applique conditions et préfixes : une ligne par cellule (ligne parente, colonne large, valeur).
+
+    Une condition dont l'élément est absent (null) est ignorée, comme en lecture ligne à ligne.
+    """
+    cells = []
+    block = 0
+    for group_id, group in enumerate(plan.nested_groups):
+        children = records.filter(pl.col('group') == group_id)
+        for nested in group.nested:
+            keep = pl.col(nested.id_column).is_not_null() & pl.col(nested.value_column).is_not_null()
+            for column, value in nested.condition_columns:
+                keep &= pl.col(column).is_null() | (pl.col(column) == value)
+            matched = children.filter(keep)
+            key = pl.col(nested.id_column)
+            cells.append(matched.select(
+                'row',
+                # Élément identifiant vide : même nom de colonne qu'en lecture ligne à ligne
+                column=pl.lit(nested.prefix) + pl.when(key == '').then(pl.lit('None')).otherwise(key),
+                value=pl.col(nested.value_column),
+                group=pl.lit(group_id, pl.UInt32),
+                block=pl.lit(block, pl.UInt32),
+                position='position',
+                rank=pl.lit(0, pl.UInt32),
+                additional=pl.lit(False),
+            ))
+            for rank, (name, column) in enumerate(nested.additional_columns, start=1):
+                # Premier enfant retenu portant ce champ
+                cells.append(matched.filter(pl.col(column).is_not_null()).unique('row', keep='first', maintain_order=True).select(
+                    'row',
+                    column=pl.lit(name),
+                    value=pl.col(column),
+                    group=pl.lit(group_id, pl.UInt32),
+                    block=pl.lit(block, pl.UInt32),
+                    position='position',
+                    rank=pl.lit(rank, pl.UInt32),
+                    additional=pl.lit(True),
+                ))
+            block += 1
+    if not cells:
+        return pl.DataFrame(schema=_CELL_SCHEMA)
+    cells = pl.concat(cells, how='vertical')
+    # Un champ additionnel déjà renseigné par un groupe précédent n'est pas remplacé
+    return cells.filter(~pl.col('additional') | (pl.col('group') == pl.col('group').min().over('row', 'column')))
+
+
+def pivot_records(records: pl.DataFrame, plan: FluxPlan, n_rows: int) -> pl.DataFrame:
+    """
+    Colonnes larges des champs imbriqués, une ligne par ligne parente (`n_rows` lignes).
+
+    Les colonnes sont dans leur ordre de première apparition, comme `ColumnBuilder.append_dynamic`.
+    """
+    cells = nested_cells(records, plan).sort('row', 'group', 'block', 'position', 'rank')
+    if cells.is_empty():
+        return pl.DataFrame()
+    columns = cells.unique('column', keep='first', maintain_order=True)['column'].to_list()
+    # La dernière valeur d'une colonne l'emporte ; "" code un élément présent mais vide
+    values = cells.unique(['row', 'column'], keep='last', maintain_order=True).select(
+        'row', 'column', value=pl.when(pl.col('value') != '').then(pl.col('value')))
+    wide = values.pivot(on='column', index='row', values='value')
+    rows = pl.DataFrame({'row': pl.arange(0, n_rows, dtype=pl.UInt32, eager=True)})
+    return rows.join(wide, on='row', how='left', maintain_order='left').select(columns)
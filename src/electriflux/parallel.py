@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Traitement parallèle des fichiers de flux sur un pool de processus.
+"""
+
+import os
+import logging
+import functools
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Hashable, Iterable, Iterator, NamedTuple, TypeVar
+
+from electriflux.metrics import Metrics, measured_call, record_file
+
+_logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+K = TypeVar('K', bound=Hashable)
+
+
+class FileError(NamedTuple):
+    """Erreur rencontrée lors du traitement d'un fichier."""
+    file: Path
+    error_type: str
+    message: str
+
+
+def _safe_call(func: Callable[[Path], T], path: Path) -> tuple[T | None, FileError | None]:
+    # Les exceptions sont renvoyées plutôt que levées, pour ne pas interrompre le pool
+    try:
+        return func(path), None
+    except Exception as e:
+        return None, FileError(path, type(e).__name__, str(e))
+
+
+def resolve_workers(workers: int | None) -> int:
+    """None ou une valeur <= 0 désignent tous les cœurs disponibles."""
+    if workers is None or workers <= 0:
+        return os.cpu_count() or 1
+    return workers
+
+
+def process_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Pool de `workers` processus démarrés par 'spawn'.
+
+    Un processus créé par fork hérite des verrous des threads de polars et de pyarrow
+    dans l'état où ils étaient : après le moindre calcul polars dans le processus parent,
+    les processus du pool peuvent rester bloqués indéfiniment. Les processus démarrés par
+    'spawn' réimportent le module principal : un script doit protéger son point d'entrée
+    par `if __name__ == '__main__':`.
+    """
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
+
+def chunk_size(n_files: int, workers: int) -> int:
+    """
+    Taille des lots envoyés à chaque processus : environ quatre lots par processus,
+    pour amortir le coût IPC sur les nombreux petits fichiers tout en équilibrant la charge.
+    """
+    return max(1, min(256, n_files // (workers * 4)))
+
+
+def map_file_pairs(func: Callable[[Path], T],
+                   files: list[Path],
+                   workers: int | None = 1,
+                   errors: list[FileError] | None = None,
+                   metrics: Metrics | None = None) -> list[tuple[Path, T]]:
+    """
+    Applique `func` à chaque fichier, éventuellement sur un pool de processus.
+
+    L'ordre des résultats est celui de `files`, quel que soit le nombre de processus.
+    Les fichiers en erreur sont journalisés, ajoutés à `errors` si fourni, et omis des résultats.
+
+    Parameters:
+        func (Callable): Fonction picklable (fonction de module ou `functools.partial`).
+        files (list[Path]): Fichiers à traiter.
+        workers (int | None): Nombre de processus ; 1 pour un traitement séquentiel,
+            None pour utiliser tous les cœurs.
+        errors (list[FileError], optional): Liste complétée avec les erreurs rencontrées.
+        metrics (Metrics, optional): Reçoit les mesures de chaque fichier (étapes, lignes, octets).
+
+    Returns:
+        list[tuple[Path, T]]: Couples (fichier, résultat) des fichiers traités avec succès.
+    """
+    workers = min(resolve_workers(workers), max(1, len(files)))
+    if workers == 1:
+        return _collect(files, map(_call(func, metrics), files), errors, metrics)
+    executor = process_pool(workers)
+    try:
+        return _collect(files, _submit(executor, func, files, workers, metrics), errors, metrics)
+    finally:
+        executor.shutdown()
+
+
+def map_grouped_pairs(funcs: dict[K, Callable[[Path], T]],
+                      groups: dict[K, list[Path]],
+                      executor: Executor | None = None,
+                      workers: int = 1,
+                      errors: list[FileError] | None = None,
+                      metrics: Metrics | None = None) -> dict[K, list[tuple[Path, T]]]:
+    """
+    Comme `map_file_pairs` pour plusieurs groupes de fichiers, chacun avec sa fonction
+    (`funcs[clé]` pour `groups[clé]`).
+
+    Tous les groupes sont soumis à `executor` avant que le premier résultat ne soit lu :
+    un seul pool traite l'ensemble, sans se vider entre deux groupes. Sans `executor`,
+    les fichiers sont traités séquentiellement. L'exécuteur n'est pas arrêté ici ; `workers`
+    (son nombre de processus) sert à dimensionner les lots.
+
+    Returns:
+        dict: Couples (fichier, résultat) par groupe, dans l'ordre de chaque groupe.
+    """
+    if executor is None:
+        return {key: _collect(files, map(_call(funcs[key], metrics), files), errors, metrics)
+                for key, files in groups.items()}
+    outcomes = {key: _submit(executor, funcs[key], files, workers, metrics) for key, files in groups.items()}
+    return {key: _collect(files, outcomes[key], errors, metrics) for key, files in groups.items()}
+
+
+def _call(func: Callable[[Path], T], metrics: Metrics | None) -> Callable[[Path], tuple]:
+    if metrics is not None:
+        func = functools.partial(measured_call, func)
+    return functools.partial(_safe_call, func)
+
+
+def _submit(executor: Executor, func: Callable[[Path], T], files: list[Path],
+            workers: int, metrics: Metrics | None) -> Iterator[tuple]:
+    # Executor.map soumet toutes les tâches immédiatement ; seule la lecture est paresseuse
+    return executor.map(_call(func, metrics), files, chunksize=chunk_size(len(files), workers))
+
+
+def _collect(files: list[Path], outcomes: Iterable[tuple],
+             errors: list[FileError] | None, metrics: Metrics | None) -> list[tuple[Path, T]]:
+    results = []
+    for path, (result, error) in zip(files, outcomes):
+        if error is not None:
+            _logger.error(f"Error processing {error.file}: {error.message}")
+            if errors is not None:
+                errors.append(error)
+            if metrics is not None:
+                metrics.on_error(str(error.file), error.error_type, error.message)
+        elif metrics is not None:
+            result, stages, seconds = result
+            record_file(metrics, path, result, stages, seconds)
+            results.append((path, result))
+        else:
+            results.append((path, result))
+    return results
+
+
+def map_files(func: Callable[[Path], T],
+              files: list[Path],
+              workers: int | None = 1,
+              errors: list[FileError] | None = None,
+              metrics: Metrics | None = None) -> list[T]:
+    """Comme `map_file_pairs`, mais ne renvoie que les résultats."""
+    return [result for _, result in map_file_pairs(func, files, workers, errors, metrics)]
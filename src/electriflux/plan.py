@@ -0,0 +1,460 @@
+#!/usr/bin/env python3
+"""
+Compilation des configurations de flux (simple_flux.yaml) en plans d'extraction.
+
+Un plan regroupe, pour un flux donné, les chemins de `data_fields`,
+`metadata_fields` et `nested_fields` précompilés en objets `etree.XPath`.
+Il est construit une seule fois puis réutilisé pour chaque ligne de chaque fichier,
+au lieu de réinterpréter les chaînes XPath à chaque appel de `find`.
+"""
+
+import copy
+import dataclasses
+import functools
+import hashlib
+import json
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable
+
+import yaml
+from lxml import etree as ET
+
+from electriflux.columnar import ColumnBuilder, RecordBuilder
+from electriflux.streaming import parent_depth
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_CONFIG_PATH = Path(__file__).parent / 'simple_flux.yaml'
+
+
+@functools.lru_cache(maxsize=8)
+def _read_configs(config_path: str, mtime_ns: int) -> dict[str, Any]:
+    with open(config_path, 'r') as file:
+        return yaml.safe_load(file)
+
+
+def load_configs(config_path: Path | str = DEFAULT_CONFIG_PATH) -> dict[str, Any]:
+    """
+    Lit le fichier YAML de configuration des flux.
+
+    Le résultat est mis en cache tant que le fichier n'est pas modifié (mtime).
+    Une copie est renvoyée, l'appelant peut donc la modifier sans risque.
+    """
+    config_path = Path(config_path)
+    return copy.deepcopy(_read_configs(str(config_path.resolve()), config_path.stat().st_mtime_ns))
+
+
+def load_flux_config(flux_type: str, config_path: Path | str = DEFAULT_CONFIG_PATH) -> dict[str, Any]:
+    configs = load_configs(config_path)
+    if flux_type not in configs:
+        raise ValueError(f"Unknown flux type: {flux_type}")
+    return configs[flux_type]
+
+
+def _first_text(xpath: ET.XPath) -> Callable[[ET._Element], str | None]:
+    def get(elem: ET._Element) -> str | None:
+        found = xpath(elem)
+        return found[0].text if found else None
+    return get
+
+
+def _split_parents(path: str) -> tuple[int, str]:
+    """Sépare 'n' niveaux '../' en tête de chemin du reste du chemin."""
+    parts = path.split('/')
+    n = 0
+    while n < len(parts) - 1 and parts[n] == '..':
+        n += 1
+    return n, '/'.join(parts[n:])
+
+
+@dataclass(frozen=True)
+class NestedPlan:
+    """Extraction d'un bloc `nested_fields`, chemins précompilés."""
+    prefix: str
+    id_step: tuple[int, Any]
+    value_step: tuple[int, Any]
+    # (chemin compilé, valeur attendue)
+    conditions: tuple[tuple[tuple[int, Any], str], ...]
+    # (colonne préfixée, chemin compilé)
+    additional_fields: tuple[tuple[str, tuple[int, Any]], ...]
+    # Colonnes correspondantes de la table longue (voir FluxPlan.record_extractor)
+    id_column: str = ''
+    value_column: str = ''
+    condition_columns: tuple[tuple[str, str], ...] = ()
+    additional_columns: tuple[tuple[str, str], ...] = ()
+
+
+@dataclass(frozen=True)
+class NestedGroup:
+    """Blocs `nested_fields` partageant le même `child_path`, parcourus en une seule passe."""
+    child_path: ET.XPath
+    nested: tuple[NestedPlan, ...]
+    # Champs lus sur chaque enfant en mode table longue : (colonne, chemin compilé)
+    record_fields: tuple[tuple[str, tuple[int, Any]], ...] = ()
+
+
+@dataclass(frozen=True)
+class FluxPlan:
+    """
+    Plan d'extraction compilé d'un flux.
+
+    Attributes:
+        row_level (str): Niveau XML de chaque ligne.
+        metadata_fields (tuple): Couples (colonne, xpath) extraits depuis la racine.
+        columns (tuple[str, ...]): Colonnes de `data_fields`, dans l'ordre de la configuration.
+        local_fields (tuple): Couples (colonne, getter) relatifs à la ligne.
+        parent_fields (tuple): Par niveau de remontée, couples (colonne, getter) relatifs à l'ancêtre.
+        nested_groups (tuple[NestedGroup, ...]): Extraction des champs imbriqués.
+        record_columns (tuple[str, ...]): Colonnes de champs de la table longue des enfants imbriqués.
+        depth (int): Nombre maximal de niveaux parents remontés par `data_fields`.
+        fingerprint (str): Empreinte (sha256) de la définition compilée ; change dès que la
+            configuration du flux change.
+    """
+    row_level: str
+    metadata_fields: tuple[tuple[str, str], ...]
+    columns: tuple[str, ...]
+    local_fields: tuple[tuple[str, Callable], ...]
+    parent_fields: tuple[tuple[int, tuple[tuple[str, Callable], ...]], ...]
+    nested_groups: tuple[NestedGroup, ...]
+    depth: int
+    fingerprint: str
+    record_columns: tuple[str, ...] = ()
+
+    def extract_metadata(self, root: ET._Element) -> dict[str, str]:
+        meta: dict[str, str] = {}
+        for field_name, field_xpath in self.metadata_fields:
+            field_elem = root.find(field_xpath)
+            if field_elem is not None:
+                meta[field_name] = field_elem.text
+        return meta
+
+    def row_extractor(self) -> Callable[[ET._Element], dict[str, str | None]]:
+        """
+        Renvoie une fonction d'extraction ligne -> dict.
+
+        Les champs remontants ('../') sont mémorisés par ancêtre : toutes les lignes
+        d'un même bloc (ex. les Element_Valorise d'un PRM) les partagent, ils ne sont
+        donc évalués qu'une fois par bloc. Une fonction par fichier, pour ne pas garder
+        de référence vers l'arbre au-delà.
+        """
+        memo: dict[int, tuple[ET._Element, dict[str, str | None]]] = {}
+        columns = self.columns
+        local_fields = self.local_fields
+        parent_fields = self.parent_fields
+        nested_groups = self.nested_groups
+
+        def extract(row: ET._Element) -> dict[str, str | None]:
+            row_data = dict.fromkeys(columns)
+            for name, get in local_fields:
+                row_data[name] = get(row)
+            for up, fields in parent_fields:
+                row_data.update(_parent_values(memo, row, up, fields))
+            if nested_groups:
+                row_data.update(_extract_nested(row, nested_groups))
+            return row_data
+
+        return extract
+
+    def column_extractor(self, builder: ColumnBuilder) -> Callable[[ET._Element], None]:
+        """
+        Renvoie une fonction qui ajoute directement les valeurs d'une ligne dans `builder`,
+        sans construire de dict intermédiaire pour les `data_fields`.
+
+        `builder` doit avoir été créé avec les colonnes du plan : `ColumnBuilder(plan.columns)`.
+        """
+        memo: dict[int, tuple[ET._Element, dict[str, str | None]]] = {}
+        columns = builder.columns
+        local_fields = [(columns[name], get) for name, get in self.local_fields]
+        parent_fields = [(up, fields, [(columns[name], name) for name, _ in fields])
+                         for up, fields in self.parent_fields]
+        nested_groups = self.nested_groups
+
+        def extract(row: ET._Element) -> None:
+            for column, get in local_fields:
+                column.append(get(row))
+            for up, fields, targets in parent_fields:
+                values = _parent_values(memo, row, up, fields)
+                for column, name in targets:
+                    column.append(values.get(name))
+            if nested_groups:
+                builder.append_dynamic(_extract_nested(row, nested_groups))
+            builder.end_row()
+
+        return extract
+
+    def record_extractor(self, builder: ColumnBuilder, records: RecordBuilder) -> Callable[[ET._Element], None]:
+        """
+        Comme `column_extractor`, mais les enfants imbriqués ne sont pas linéarisés :
+        chaque enfant de chaque `child_path` devient une ligne de `records` (numéro de
+        ligne, groupe, position, puis les champs dont dépendent les blocs du groupe).
+        Conditions, préfixes et pivot sont ensuite appliqués par `electriflux.nested`.
+
+        `records` doit avoir été créé avec `RecordBuilder(plan.record_columns)`.
+        """
+        extract_row = dataclasses.replace(self, nested_groups=()).column_extractor(builder)
+        rows, group_ids, positions = records.keys
+        columns = dict(zip(records.columns, records.values))
+        groups = []
+        for group in self.nested_groups:
+            # Champs de l'enfant, de son parent (lus une fois par parent) et chemins XPath complets
+            own, parent, xpath = [], [], []
+            for name, (mode, arg) in group.record_fields:
+                {_OWN: own, _PARENT: parent, _XPATH: xpath}[mode].append((columns[name], arg))
+            used = {name for name, _ in group.record_fields}
+            missing = [column for name, column in columns.items() if name not in used]
+            own_index = {tag: i for i, (_, tag) in enumerate(own)}
+            groups.append((group.child_path, own, own_index, parent, xpath, missing))
+
+        def extract(row: ET._Element) -> None:
+            row_id = builder.n_rows
+            for group_id, (child_path, own, own_index, parent_fields, xpath, missing) in enumerate(groups):
+                parent = None
+                parent_values: list[str | None] = []
+                for position, nr in enumerate(child_path(row)):
+                    rows.append(row_id)
+                    group_ids.append(group_id)
+                    positions.append(position)
+                    # Élément présent mais vide : "" (distinct d'un élément absent, None)
+                    if own:
+                        values: list[str | None] = [None] * len(own)
+                        for child in nr:
+                            i = own_index.get(child.tag)
+                            if i is not None and values[i] is None:
+                                values[i] = child.text or ''
+                        for (column, _), value in zip(own, values):
+                            column.append(value)
+                    if parent_fields:
+                        nr_parent = nr.getparent()
+                        if nr_parent is not parent:
+                            parent = nr_parent
+                            children = _children_by_tag(parent) if parent is not None else {}
+                            parent_values = [elem.text or '' if (elem := children.get(tag)) is not None else None
+                                             for _, tag in parent_fields]
+                        for (column, _), value in zip(parent_fields, parent_values):
+                            column.append(value)
+                    for column, path in xpath:
+                        found = path(nr)
+                        column.append((found[0].text or '') if found else None)
+                    for column in missing:
+                        column.append(None)
+            extract_row(row)
+
+        return extract
+
+
+def _parent_values(memo: dict[int, tuple[ET._Element, dict[str, str | None]]],
+                   row: ET._Element, up: int,
+                   fields: tuple[tuple[str, Callable], ...]) -> dict[str, str | None]:
+    """Valeurs des champs relatifs à l'ancêtre de niveau `up`, calculées une fois par ancêtre."""
+    anc = row
+    for _ in range(up):
+        anc = anc.getparent()
+        if anc is None:
+            break
+    cached = memo.get(up)
+    if cached is None or cached[0] is not anc:
+        values = {name: get(anc) for name, get in fields} if anc is not None else {}
+        cached = (anc, values)
+        memo[up] = cached
+    return cached[1]
+
+
+def _children_by_tag(elem: ET._Element) -> dict[str, ET._Element]:
+    """Premier enfant de chaque balise, équivalent de `elem.find(tag)` pour un chemin simple."""
+    children: dict[str, ET._Element] = {}
+    for child in elem:
+        children.setdefault(child.tag, child)
+    return children
+
+
+def _extract_nested(row: ET._Element, groups: tuple[NestedGroup, ...]) -> dict[str, str]:
+    nested_data: dict[str, str] = {}
+    for group in groups:
+        # Un dict par bloc, fusionnés dans l'ordre de la configuration
+        outputs: list[dict[str, str]] = [{} for _ in group.nested]
+        parent = None
+        parent_children: dict[str, ET._Element] = {}
+        for nr in group.child_path(row):
+            own = _children_by_tag(nr)
+            nr_parent = nr.getparent()
+            if nr_parent is not parent:
+                parent = nr_parent
+                parent_children = _children_by_tag(parent) if parent is not None else {}
+
+            for nested, out in zip(group.nested, outputs):
+                # Une condition dont l'élément est absent est ignorée
+                if not all(elem.text == value
+                           for step, value in nested.conditions
+                           if (elem := _resolve(step, nr, own, parent_children)) is not None):
+                    continue
+                key_elem = _resolve(nested.id_step, nr, own, parent_children)
+                value_elem = _resolve(nested.value_step, nr, own, parent_children)
+                if key_elem is None or value_elem is None:
+                    continue
+                out[f"{nested.prefix}{key_elem.text}"] = value_elem.text
+                # On évite d'aller chercher plusieurs fois la même info, on prend juste la première
+                for add_name, step in nested.additional_fields:
+                    if add_name not in out and add_name not in nested_data:
+                        add_elem = _resolve(step, nr, own, parent_children)
+                        if add_elem is not None:
+                            out[add_name] = add_elem.text
+        for out in outputs:
+            nested_data.update(out)
+    return nested_data
+
+
+_OWN, _PARENT, _XPATH = 0, 1, 2
+
+
+def _compile_step(path: str) -> tuple[int, Any]:
+    """
+    Compile un chemin relatif à un enfant imbriqué.
+
+    Les chemins d'un seul niveau ('Balise' ou '../Balise'), de loin les plus courants,
+    sont résolus via le dictionnaire des enfants de l'élément (ou de son parent) ;
+    les autres via un `etree.XPath` précompilé.
+    """
+    up, rest = _split_parents(path)
+    if up <= 1 and rest and not any(c in rest for c in '/[]@*.'):
+        return (_PARENT if up else _OWN), rest
+    return _XPATH, ET.XPath(path)
+
+
+def _resolve(step: tuple[int, Any], nr: ET._Element,
+             own: dict[str, ET._Element], parent_children: dict[str, ET._Element]) -> ET._Element | None:
+    mode, arg = step
+    if mode == _OWN:
+        return own.get(arg)
+    if mode == _PARENT:
+        return parent_children.get(arg)
+    found = arg(nr)
+    return found[0] if found else None
+
+
+def _normalize_nested(nested: dict | tuple | list) -> dict:
+    if isinstance(nested, dict):
+        return nested
+    # Forme historique du polars_reader : (prefix, child_path, id_field, value_field)
+    prefix, child_path, id_field, value_field = nested
+    return {'prefix': prefix, 'child_path': child_path, 'id_field': id_field, 'value_field': value_field}
+
+
+def _compile_nested(nested: dict) -> NestedPlan:
+    prefix = nested.get('prefix', '') or ''
+    conditions = tuple((_compile_step(cond['xpath']), str(cond['value']))
+                       for cond in nested.get('conditions', None) or [])
+    additional_fields = tuple((f"{prefix}{name}", _compile_step(xpath))
+                              for name, xpath in (nested.get('additional_fields', None) or {}).items())
+    return NestedPlan(prefix, _compile_step(nested['id_field']), _compile_step(nested['value_field']),
+                      conditions, additional_fields)
+
+
+def _record_column(path: str) -> str:
+    """Nom de colonne de la table longue : dernière balise du chemin ('../Code_Qualification' -> 'Code_Qualification')."""
+    return path.rstrip('/').rsplit('/', 1)[-1]
+
+
+def _with_record_columns(child_path: str, specs: list[dict], plans: list[NestedPlan]) -> NestedGroup:
+    """Groupe de blocs, avec les colonnes de la table longue de ses enfants."""
+    paths: dict[str, str] = {}
+
+    def column(path: str) -> str:
+        if path not in paths:
+            name = _record_column(path)
+            # Deux chemins de même balise finale : le second garde son chemin complet
+            paths[path] = name if name not in paths.values() else path
+        return paths[path]
+
+    named = []
+    for spec, plan in zip(specs, plans):
+        named.append(dataclasses.replace(
+            plan,
+            id_column=column(spec['id_field']),
+            value_column=column(spec['value_field']),
+            condition_columns=tuple((column(cond['xpath']), str(cond['value']))
+                                    for cond in spec.get('conditions', None) or []),
+            additional_columns=tuple((name, column(xpath)) for (name, _), xpath in
+                                     zip(plan.additional_fields, (spec.get('additional_fields', None) or {}).values())),
+        ))
+    return NestedGroup(ET.XPath(child_path), tuple(named),
+                       tuple((name, _compile_step(path)) for path, name in paths.items()))
+
+
+def _group_nested(nested_fields: list) -> tuple[NestedGroup, ...]:
+    """
+    Regroupe les blocs consécutifs de même `child_path` (et de préfixes distincts)
+    afin de ne parcourir les enfants qu'une fois.
+    """
+    groups: list[tuple[str, list[dict], list[NestedPlan]]] = []
+    for nested in map(_normalize_nested, nested_fields):
+        plan = _compile_nested(nested)
+        if (groups and groups[-1][0] == nested['child_path']
+                and all(p.prefix != plan.prefix for p in groups[-1][2])):
+            groups[-1][1].append(nested)
+            groups[-1][2].append(plan)
+        else:
+            groups.append((nested['child_path'], [nested], [plan]))
+    return tuple(_with_record_columns(*group) for group in groups)
+
+
+@functools.lru_cache(maxsize=64)
+def _compile(definition: str) -> FluxPlan:
+    # La définition est sérialisée en JSON pour servir de clé de cache (l'ordre des clés est conservé)
+    row_level, metadata_fields, data_fields, nested_fields = json.loads(definition)
+    local_fields = []
+    parent_fields: dict[int, list] = {}
+    for name, xpath in data_fields.items():
+        up, rest = _split_parents(xpath)
+        getter = _first_text(ET.XPath(rest if up else xpath))
+        if up:
+            parent_fields.setdefault(up, []).append((name, getter))
+        else:
+            local_fields.append((name, getter))
+
+    nested_groups = _group_nested(nested_fields)
+    return FluxPlan(
+        row_level=row_level,
+        metadata_fields=tuple(metadata_fields.items()),
+        columns=tuple(data_fields),
+        local_fields=tuple(local_fields),
+        parent_fields=tuple((up, tuple(fields)) for up, fields in sorted(parent_fields.items())),
+        nested_groups=nested_groups,
+        depth=parent_depth(data_fields),
+        fingerprint=hashlib.sha256(definition.encode()).hexdigest(),
+        record_columns=tuple(dict.fromkeys(name for group in nested_groups for name, _ in group.record_fields)),
+    )
+
+
+def compile_plan(row_level: str,
+                 metadata_fields: dict[str, str] = {},
+                 data_fields: dict[str, str] = {},
+                 nested_fields: list = []) -> FluxPlan:
+    """
+    Compile une définition de flux en plan d'extraction réutilisable.
+
+    Les plans sont mis en cache : compiler plusieurs fois la même définition
+    renvoie le même objet.
+
+    Parameters:
+        row_level (str): XPath du niveau des lignes.
+        metadata_fields (dict[str, str]): Champs extraits depuis la racine.
+        data_fields (dict[str, str]): Champs extraits relativement à chaque ligne.
+        nested_fields (list): Blocs imbriqués, au format dict du YAML
+            ou tuples (prefix, child_path, id_field, value_field).
+
+    Returns:
+        FluxPlan: Le plan compilé.
+    """
+    return _compile(json.dumps([row_level, metadata_fields or {}, data_fields or {},
+                                [_normalize_nested(n) for n in nested_fields or []]]))
+
+
+def compile_flux(flux_type: str, config_path: Path | str | None = None) -> FluxPlan:
+    """
+    Compile le flux `flux_type` (C15, F12, F15, R15, R151, R15_ACC...) de la configuration YAML.
+    """
+    config = load_flux_config(flux_type, config_path or DEFAULT_CONFIG_PATH)
+    return compile_plan(config['row_level'], config.get('metadata_fields', {}),
+                        config.get('data_fields', {}), config.get('nested_fields', []))
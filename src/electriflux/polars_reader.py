@@ -1,13 +1,26 @@
 #!/usr/bin/env python3
 
 import re
-import yaml
+import time
+import functools
 import polars as pl
+from polars.io.plugins import register_io_source
 
 from pathlib import Path
+from typing import Iterator
 from lxml import etree as ET
 import logging
 
+from electriflux.cache import ParseCache, cached_parse
+from electriflux.columnar import ColumnBuilder, RecordBuilder
+from electriflux.metrics import Metrics, file_stages, lap, timed
+from electriflux.nested import pivot_records
+from electriflux.parallel import FileError, map_file_pairs, resolve_workers
+from electriflux.plan import compile_plan, load_flux_config
+from electriflux.schema import apply_types, column_exprs
+from electriflux.stats import file_stats, load_stats, merge_stats, predicate_constraints, prune_files, save_stats, stale_files
+from electriflux.streaming import iter_rows
+
 _logger = logging.getLogger(__name__)
 
 def get_consumption_names() -> list[str]:
@@ -16,74 +29,98 @@ def get_consumption_names() -> list[str]:
 def xml_to_dataframe(xml_path: Path, row_level: str, 
                      metadata_fields: dict[str, str] = {}, 
                      data_fields: dict[str, str] = {},
-                     nested_fields: list[tuple[str, str, str, str]] = {}) -> pl.DataFrame:
-    tree = ET.parse(xml_path)
-    root = tree.getroot()
-    
+                     nested_fields: list[dict] = {},
+                     stream: bool = False,
+                     nested: str = 'long') -> pl.DataFrame:
+    """
+    Extrait un fichier XML en DataFrame polars (colonnes Utf8).
+
+    `nested` choisit la linéarisation des `nested_fields` : 'long' (table longue des
+    enfants imbriqués, filtrée puis pivotée en polars, voir electriflux.nested) ou 'rows'
+    (ligne à ligne en Python, comme simple_reader). Le résultat est identique.
+    """
+    if nested not in ('long', 'rows'):
+        raise ValueError(f"Unknown nested mode: {nested}")
+    plan = compile_plan(row_level, metadata_fields, data_fields, nested_fields)
+
+    # Mesures par étape, seulement si l'appelant les collecte (voir electriflux.metrics)
+    stages = file_stages()
+    if stages is not None:
+        start = time.perf_counter()
+
     meta = {}
-    for field_name, field_xpath in metadata_fields.items():
-        field_elem = root.find(field_xpath)
-        if field_elem is not None:
-            meta[field_name] = field_elem.text
-    
-    all_rows = []
-    for row in root.findall(row_level):
-        row_data = {field_name: row.find(field_xpath)
-                    for field_name, field_xpath in data_fields.items()}
-        row_data = {k: v.text if hasattr(v, 'text') else v for k, v in row_data.items()}
-        
-        nested_data = {}
-        for p, r, k, v in nested_fields:
-            for nr in row.findall(r):
-                key_elem = nr.find(k)
-                value_elem = nr.find(v)
-                if key_elem is not None and value_elem is not None:
-                    nested_data[p + key_elem.text] = value_elem.text
-                else:
-                    _logger.error(f"Key or value element not found for {r}/{k} or {r}/{v}")   
-        
-        all_rows.append(row_data | nested_data)
-    
-    df = pl.DataFrame(all_rows).with_columns([pl.all().cast(pl.Utf8)])
-    for k, v in meta.items():
-        df = df.with_columns(pl.lit(v).cast(pl.Utf8).alias(k))
+    if stream:
+        # Lecture incrémentale : chaque ligne est libérée une fois extraite
+        # (analyse et extraction sont alors comptées ensemble dans 'extract')
+        rows = iter_rows(xml_path, row_level, metadata_fields, plan.depth, meta)
+    else:
+        tree = ET.parse(xml_path)
+        root = tree.getroot()
+        meta = plan.extract_metadata(root)
+        rows = root.findall(row_level)
+        if stages is not None:
+            start = lap(stages, 'parse', start)
     
+    # Les valeurs sont ajoutées directement colonne par colonne, déjà en Utf8
+    builder = ColumnBuilder(plan.columns)
+    long = nested == 'long' and plan.nested_groups
+    if long:
+        records = RecordBuilder(plan.record_columns)
+        extract = plan.record_extractor(builder, records)
+    else:
+        extract = plan.column_extractor(builder)
+    for row in rows:
+        extract(row)
+    if stages is not None:
+        start = lap(stages, 'extract', start)
+
+    df = builder.to_polars(meta)
+    if long:
+        wide = pivot_records(records.to_polars(), plan, builder.n_rows)
+        if wide.width:
+            # Même ordre de colonnes qu'en mode 'rows' : data_fields, champs imbriqués, métadonnées
+            df = df.hstack(wide).select(list(dict.fromkeys([*plan.columns, *wide.columns, *meta])))
+    if stages is not None:
+        lap(stages, 'frame', start)
     return df
 
-def enforce_expected_types(df: pl.DataFrame, expected_types: dict[str, str]) -> pl.DataFrame:
+def xml_to_records(xml_path: Path, row_level: str,
+                   metadata_fields: dict[str, str] = {},
+                   data_fields: dict[str, str] = {},
+                   nested_fields: list[dict] = {},
+                   stream: bool = False) -> tuple[pl.DataFrame, pl.DataFrame]:
     """
-    Enforce expected types on a DataFrame after processing.
+    Extrait un fichier XML sans linéariser les champs imbriqués.
+
+    Returns:
+        tuple[pl.DataFrame, pl.DataFrame]: Les lignes (`data_fields` et métadonnées, sans
+            colonnes imbriquées) et la table longue de leurs enfants imbriqués : numéro de
+            ligne ('row'), groupe de `nested_fields` de même `child_path` ('group'), position
+            de l'enfant ('position'), puis les champs lus sur chaque enfant
+            (Id_Classe_Temporelle, Valeur, Classe_Mesure, Code_Qualification...).
     """
-    type_mapping = {
-        "String": pl.Utf8,
-        "Float64": pl.Float64,
-        "Int64": pl.Int64,
-        "Date": pl.Date,
-        "DateTime": pl.Datetime
-    }
-    
-    for col, dtype in expected_types.items():
-        if col in df.columns and dtype in type_mapping:
-            if dtype in ["Date", "Datetime"]:
-                df = df.with_columns(
-                    pl.col(col)
-                    .str.strip_chars().str.strptime(type_mapping[dtype], strict=False).dt.replace_time_zone('Europe/Paris')
-                )
-            else:
-                df = df.with_columns(
-                    pl.col(col)
-                    .replace("", None)  # Remplacer les chaînes vides par null
-                    .cast(type_mapping[dtype], strict=False)  # Casting en mode tolérant
-                )
-    return df
+    plan = compile_plan(row_level, metadata_fields, data_fields, nested_fields)
+    meta = {}
+    if stream:
+        rows = iter_rows(xml_path, row_level, metadata_fields, plan.depth, meta)
+    else:
+        root = ET.parse(xml_path).getroot()
+        meta = plan.extract_metadata(root)
+        rows = root.findall(row_level)
+    builder = ColumnBuilder(plan.columns)
+    records = RecordBuilder(plan.record_columns)
+    extract = plan.record_extractor(builder, records)
+    for row in rows:
+        extract(row)
+    return builder.to_polars(meta), records.to_polars()
 
-def process_xml_files(directory: Path,  
-                      row_level: str, 
-                      metadata_fields: dict[str, str] = {}, 
-                      data_fields: dict[str, str] = {},
-                      nested_fields: list[tuple[str, str, str, str]] = {},
-                      file_pattern: str | None=None) -> pl.DataFrame:
-    all_data = []
+def enforce_expected_types(df: pl.DataFrame, expected_types: dict[str, str | list[str]]) -> pl.DataFrame:
+    """
+    Type les colonnes selon `expected_types` (voir electriflux.schema), en un seul `with_columns`.
+    """
+    return apply_types(df, expected_types)
+
+def find_xml_files(directory: Path, file_pattern: str | None = None) -> list[Path]:
     xml_files = [f for f in directory.rglob('*.xml')]
     
     if file_pattern is not None:
@@ -91,40 +128,92 @@ def process_xml_files(directory: Path,
         xml_files = [f for f in xml_files if regex_pattern.search(f.name)]
     
     _logger.info(f"Found {len(xml_files)} files matching pattern {file_pattern}")
-    for xml_file in xml_files:
-        try:
-            df = xml_to_dataframe(xml_file, row_level, metadata_fields, data_fields, nested_fields)
-            all_data.append(df)
-        except Exception as e:
-            _logger.error(f"Error processing {xml_file}: {e}")
-    
+    return xml_files
+
+def parse_xml_files(xml_files: list[Path],
+                    row_level: str,
+                    metadata_fields: dict[str, str] = {},
+                    data_fields: dict[str, str] = {},
+                    nested_fields: list[dict] = {},
+                    stream: bool = False,
+                    workers: int | None = 1,
+                    errors: list[FileError] | None = None,
+                    cache: ParseCache | None = None,
+                    metrics: Metrics | None = None) -> list[tuple[Path, pl.DataFrame]]:
+    """
+    Extrait chaque fichier séparément, renvoie les couples (fichier, DataFrame) dans l'ordre de `xml_files`.
+    """
+    # Les fichiers sont répartis sur `workers` processus, l'ordre des résultats est conservé
+    parse = functools.partial(xml_to_dataframe, row_level=row_level, metadata_fields=metadata_fields,
+                              data_fields=data_fields, nested_fields=nested_fields, stream=stream)
+    if cache is None:
+        return map_file_pairs(parse, xml_files, workers, errors, metrics)
+    # Les fichiers déjà extraits avec la même définition de flux sont relus depuis le cache
+    plan = compile_plan(row_level, metadata_fields, data_fields, nested_fields)
+    return cached_parse(xml_files, lambda files: map_file_pairs(parse, files, workers, errors, metrics),
+                        cache, f'polars_reader:{plan.fingerprint}', pl.DataFrame.to_arrow, pl.from_arrow)
+
+def align_frame(df: pl.DataFrame, columns: list[str],
+                expected_types: dict[str, str | list[str]] | None = None) -> pl.DataFrame:
+    """
+    Un seul select : colonnes dans l'ordre de `columns`, typées selon `expected_types`.
+    Les colonnes absentes valent "" si elles ne sont pas typées, null sinon.
+    """
+    return df.select(column_exprs(columns, expected_types or {}, set(df.columns)))
+
+def process_xml_files(directory: Path,  
+                      row_level: str, 
+                      metadata_fields: dict[str, str] = {}, 
+                      data_fields: dict[str, str] = {},
+                      nested_fields: list[dict] = {},
+                      file_pattern: str | None=None,
+                      stream: bool = False,
+                      workers: int | None = 1,
+                      errors: list[FileError] | None = None,
+                      cache: ParseCache | None = None,
+                      metrics: Metrics | None = None,
+                      expected_types: dict[str, str | list[str]] | None = None) -> pl.DataFrame:
+    """
+    Extrait et concatène les fichiers de `directory`.
+
+    Chaque fichier est aligné sur les colonnes communes et typé selon `expected_types`
+    dès son extraction : les DataFrame Utf8 sont libérés au fur et à mesure et le
+    DataFrame concaténé est directement typé.
+    """
+    with timed(metrics, 'discovery'):
+        xml_files = find_xml_files(directory, file_pattern)
+    parsed = parse_xml_files(xml_files, row_level, metadata_fields, data_fields, nested_fields,
+                             stream, workers, errors, cache, metrics)
+    all_data = [df for _, df in parsed]
+    del parsed
+
     if not all_data:
         return pl.DataFrame()
     
-    all_columns = set(col for df in all_data for col in df.columns)
-    standardized_data = [df.with_columns([pl.lit("").cast(pl.Utf8).alias(col) for col in all_columns if col not in df.columns]) for df in all_data]
-    
-    return pl.concat(standardized_data, how="diagonal").with_columns([pl.all().cast(pl.Utf8)])
+    # Ordre des colonnes déterministe : ordre de première apparition
+    all_columns = list(dict.fromkeys(col for df in all_data for col in df.columns))
+    with timed(metrics, 'types'):
+        for i, df in enumerate(all_data):
+            all_data[i] = align_frame(df, all_columns, expected_types)
+        del df
+    with timed(metrics, 'concat'):
+        return pl.concat(all_data, how="vertical")
 
-def load_flux_config(flux_type, config_path='flux_configs.yaml'):
-    with open(config_path, 'r') as file:
-        configs = yaml.safe_load(file)
-    
-    if flux_type not in configs:
-        raise ValueError(f"Unknown flux type: {flux_type}")
-    
-    return configs[flux_type]
+def process_flux(flux_type: str, xml_dir: Path, config_path: Path | None = None, stream: bool = False,
+                 workers: int | None = 1, errors: list[FileError] | None = None,
+                 cache: ParseCache | None = None, metrics: Metrics | None = None) -> pl.DataFrame:
+    """
+    Extrait tous les fichiers d'un flux en un DataFrame polars typé selon `expected_types`.
 
-def process_flux(flux_type: str, xml_dir: Path, config_path: Path | None = None) -> pl.DataFrame:
+    `metrics` (voir electriflux.metrics) reçoit, si fourni, la durée de chaque étape
+    et le nombre de lignes et d'octets de chaque fichier.
+    """
     if config_path is None:
         config_path = Path(__file__).parent / 'simple_flux.yaml'
     
     config = load_flux_config(flux_type, config_path)
     
-    nested_fields = [
-        (item['prefix'], item['child_path'], item['id_field'], item['value_field'])
-        for item in config['nested_fields']
-    ]
+    nested_fields = config['nested_fields']
     file_regex = config.get('file_regex', None)
     expected_types = config.get('expected_types', {})
     
@@ -134,13 +223,91 @@ def process_flux(flux_type: str, xml_dir: Path, config_path: Path | None = None)
         config['metadata_fields'],
         config['data_fields'],
         nested_fields,
-        file_regex
+        file_regex,
+        stream,
+        workers,
+        errors,
+        cache,
+        metrics,
+        expected_types,
     )
-    
-    df = enforce_expected_types(df, expected_types)
-    
     return df
 
+def scan_flux(flux_type: str, xml_dir: Path, config_path: Path | None = None,
+              stats_path: Path | None = None, workers: int | None = 1,
+              cache: ParseCache | None = None) -> pl.LazyFrame:
+    """
+    Équivalent paresseux de `process_flux`, avec élagage des fichiers.
+
+    Un fichier de statistiques (colonnes, PRM présents, dates min/max par fichier) est tenu
+    à jour à chaque appel : seuls les fichiers nouveaux ou modifiés sont lus pour cela.
+    Les filtres de la requête portant sur `pdl`, `Date_Facture`, `Date_Releve`,
+    `Date_Debut`/`Date_Fin` ou `Date_Evenement` sont ensuite utilisés pour n'ouvrir que
+    les fichiers pouvant contenir des lignes correspondantes.
+
+    Exemple :
+        scan_flux('F15', xml_dir).filter(pl.col('pdl') == '14000000000000').collect()
+
+    Parameters:
+        stats_path (Path, optional): Fichier de statistiques,
+            `xml_dir / '.electriflux' / f'{flux_type}_stats.parquet'` par défaut.
+        workers (int | None): Processus utilisés pour lire les fichiers retenus.
+        cache (ParseCache, optional): Cache d'extraction partagé avec `process_flux`.
+
+    Returns:
+        pl.LazyFrame: Mêmes lignes et colonnes que `process_flux`.
+    """
+    if config_path is None:
+        config_path = Path(__file__).parent / 'simple_flux.yaml'
+    config = load_flux_config(flux_type, config_path)
+    if stats_path is None:
+        stats_path = xml_dir / '.electriflux' / f'{flux_type}_stats.parquet'
+
+    parse = functools.partial(parse_xml_files, row_level=config['row_level'],
+                              metadata_fields=config['metadata_fields'], data_fields=config['data_fields'],
+                              nested_fields=config['nested_fields'], workers=workers, cache=cache)
+    xml_files = find_xml_files(xml_dir, config.get('file_regex', None))
+
+    stats = load_stats(stats_path)
+    previous_height = stats.height
+    stale = stale_files(stats, xml_files)
+    if stale:
+        _logger.info(f"Calcul des statistiques de {len(stale)} fichiers")
+    new_stats = [file_stats(path, df) for path, df in parse(stale)]
+    stats = merge_stats(stats, new_stats, xml_files)
+    if stale or stats.height != previous_height:
+        save_stats(stats_path, stats)
+
+    # Schéma commun : colonnes par ordre de première apparition, comme process_flux
+    known = {file: columns for file, columns in stats.select('file', 'columns').iter_rows()}
+    xml_files = [f for f in xml_files if str(f) in known]
+    all_columns = list(dict.fromkeys(col for f in xml_files for col in known[str(f)]))
+    expected_types = config.get('expected_types', {})
+    schema = align_frame(pl.DataFrame(), all_columns, expected_types).schema
+    batch_files = max(1, resolve_workers(workers) * 8)
+
+    def source(with_columns: list[str] | None, predicate: pl.Expr | None,
+               n_rows: int | None, batch_size: int | None) -> Iterator[pl.DataFrame]:
+        candidates = set(prune_files(stats, predicate_constraints(predicate)))
+        selected = [f for f in xml_files if str(f) in candidates]
+        _logger.info(f"scan_flux {flux_type} : {len(selected)}/{len(xml_files)} fichiers à lire")
+        remaining = n_rows
+        for start in range(0, len(selected), batch_files):
+            for _, df in parse(selected[start:start + batch_files]):
+                df = align_frame(df, all_columns, expected_types)
+                if predicate is not None:
+                    df = df.filter(predicate)
+                if with_columns is not None:
+                    df = df.select(with_columns)
+                if remaining is not None:
+                    df = df.head(remaining)
+                    remaining -= df.height
+                yield df
+                if remaining == 0:
+                    return
+
+    return register_io_source(source, schema=schema)
+
 def main():
     df = process_flux('C15', Path('~/data/flux_enedis_v2/C15').expanduser())
     df.write_csv('C15.csv')
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Agrégats de facturation (F12, F15) tenus à jour au fil de l'ingestion.
+
+Les tableaux de bord somment `Montant_HT` et `Quantite` par facture, par PRM et par mois,
+par code d'élément valorisé... Plutôt que de relire tout l'historique à chaque fois, chaque
+agrégat déclaré sous la clé `rollups` de la configuration du flux est matérialisé à côté
+des fragments du stockage (voir `electriflux.store`) :
+
+    store_dir/
+        F15/
+            _manifest.jsonl
+            _rollups/
+                facture.parquet
+                prm_mois.parquet
+                ev.parquet
+
+La clé `Mois` désigne la partition du fragment (mois du `partition_field`). Chaque table
+retient dans ses métadonnées le nombre d'entrées du manifeste déjà intégrées : `update_rollups`
+n'agrège que les fragments écrits depuis, et ne modifie que les groupes qu'ils touchent.
+Une mise à jour interrompue (arrêt entre l'écriture des fragments et celle des agrégats)
+est rattrapée à la suivante, sans double compte, la table étant remplacée d'un bloc.
+
+`reconcile_rollups` recalcule les agrégats depuis les lignes de détail et signale les
+groupes qui divergent, en réparant les tables au besoin.
+"""
+
+import json
+import logging
+from pathlib import Path
+from typing import Any, Mapping, Sequence
+
+import pandas as pd
+import polars as pl
+import pyarrow.parquet as pq
+
+from electriflux.store import flux_dir, load_manifest
+
+_logger = logging.getLogger(__name__)
+
+ROLLUP_DIR = '_rollups'
+MONTH = 'Mois'
+MEASURES = ('Montant_HT', 'Quantite')
+COUNT = 'Lignes'
+
+# Métadonnées Parquet de chaque table
+APPLIED_KEY = b'electriflux.manifest_entries'
+KEYS_KEY = b'electriflux.rollup_keys'
+
+# Écart toléré par `reconcile_rollups`, relatif au-delà de 1 : le cumul incrémental
+# n'additionne pas les montants dans le même ordre que le recalcul
+TOLERANCE = 1e-6
+
+Rollups = Mapping[str, Sequence[str]]
+
+
+def rollup_path(store_dir: Path, flux_type: str, name: str) -> Path:
+    return flux_dir(store_dir, flux_type) / ROLLUP_DIR / f'{name}.parquet'
+
+
+def _empty(keys: Sequence[str]) -> pl.DataFrame:
+    return pl.DataFrame(schema={**{key: pl.Utf8 for key in keys},
+                                **{measure: pl.Float64 for measure in MEASURES},
+                                COUNT: pl.Int64})
+
+
+def _sum(frame: pl.DataFrame, keys: Sequence[str]) -> pl.DataFrame:
+    """Somme des mesures et du nombre de lignes d'agrégats partiels, par groupe."""
+    return (frame.group_by(list(keys), maintain_order=True)
+            .agg([pl.col(measure).sum() for measure in MEASURES] + [pl.col(COUNT).sum()]))
+
+
+def _aggregate(root: Path, entries: Sequence[dict[str, Any]], rollups: Rollups) -> dict[str, pl.DataFrame]:
+    """
+    Agrégats des fragments référencés par `entries`, chaque fragment n'étant lu qu'une fois
+    pour toutes les tables et seulement pour les colonnes utiles.
+    """
+    wanted = list(dict.fromkeys(c for keys in rollups.values() for c in keys if c != MONTH))
+    wanted += [measure for measure in MEASURES if measure not in wanted]
+    partials: dict[str, list[pl.DataFrame]] = {name: [] for name in rollups}
+    for entry in entries:
+        if not entry['fragment']:
+            continue
+        path = root / entry['fragment']
+        present = set(pq.read_schema(path).names)
+        rows = pl.from_arrow(pq.read_table(path, columns=[c for c in wanted if c in present]))
+        # Colonne absente d'un fragment : nulle, comme dans `read_store_table`
+        rows = rows.with_columns(
+            [pl.lit(None, pl.Utf8).alias(c) for c in wanted if c not in present]
+            + [pl.lit(entry['partition'], pl.Utf8).alias(MONTH)]
+            + [pl.col(measure).cast(pl.Float64, strict=False) for measure in MEASURES])
+        for name, keys in rollups.items():
+            partials[name].append(
+                rows.group_by(list(keys), maintain_order=True)
+                .agg([pl.col(measure).sum() for measure in MEASURES] + [pl.len().cast(pl.Int64).alias(COUNT)]))
+    return {name: _sum(pl.concat(frames), rollups[name]) if frames else _empty(rollups[name])
+            for name, frames in partials.items()}
+
+
+def _load(path: Path, keys: Sequence[str]) -> tuple[pl.DataFrame, int]:
+    """Table matérialisée et nombre d'entrées du manifeste qu'elle intègre (0 si à reconstruire)."""
+    if not path.exists():
+        return _empty(keys), 0
+    table = pq.read_table(path)
+    metadata = table.schema.metadata or {}
+    if json.loads(metadata.get(KEYS_KEY, b'null')) != list(keys):
+        _logger.info(f"Clés de {path.name} modifiées, agrégat reconstruit")
+        return _empty(keys), 0
+    return pl.from_arrow(table), int(metadata[APPLIED_KEY])
+
+
+def _save(path: Path, frame: pl.DataFrame, keys: Sequence[str], applied: int) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    table = frame.to_arrow()
+    table = table.replace_schema_metadata({APPLIED_KEY: str(applied).encode(),
+                                           KEYS_KEY: json.dumps(list(keys)).encode()})
+    tmp = path.with_suffix('.parquet.tmp')
+    # Écriture puis renommage : la table et son compteur changent ensemble
+    pq.write_table(table, tmp)
+    tmp.replace(path)
+
+
+def update_rollups(store_dir: Path, flux_type: str, rollups: Rollups | None) -> int:
+    """
+    Intègre aux agrégats matérialisés les fragments écrits depuis leur dernière mise à jour.
+
+    Seuls les groupes présents dans ces fragments changent ; sans nouveau fragment,
+    les tables ne sont pas réécrites.
+
+    Parameters:
+        store_dir (Path): Racine du stockage.
+        flux_type (str): Type de flux.
+        rollups (Mapping[str, Sequence[str]], optional): Colonnes de regroupement par nom
+            d'agrégat (clé `rollups` de la configuration). Sans elles, rien n'est fait.
+
+    Returns:
+        int: Nombre de nouvelles entrées du manifeste intégrées.
+    """
+    if not rollups:
+        return 0
+    entries = load_manifest(store_dir, flux_type)
+    current = {name: _load(rollup_path(store_dir, flux_type, name), keys) for name, keys in rollups.items()}
+    by_start: dict[int, list[str]] = {}
+    for name, (_, applied) in current.items():
+        if applied > len(entries):
+            _logger.warning(f"Agrégat {name} de {flux_type} en avance sur le manifeste, reconstruit")
+            current[name] = (_empty(rollups[name]), 0)
+            applied = 0
+        if applied < len(entries):
+            by_start.setdefault(applied, []).append(name)
+    if not by_start:
+        return 0
+
+    root = flux_dir(store_dir, flux_type)
+    for start, names in by_start.items():
+        partials = _aggregate(root, entries[start:], {name: rollups[name] for name in names})
+        for name in names:
+            keys = rollups[name]
+            merged = _sum(pl.concat([current[name][0], partials[name]]), keys)
+            _save(rollup_path(store_dir, flux_type, name), merged, keys, len(entries))
+    added = len(entries) - min(by_start)
+    _logger.info(f"Agrégats {', '.join(rollups)} de {flux_type} mis à jour ({added} entrées du manifeste)")
+    return added
+
+
+def read_rollup(store_dir: Path, flux_type: str, name: str) -> pd.DataFrame:
+    """Agrégat matérialisé `name` d'un flux, tel qu'écrit par `update_rollups`."""
+    return pq.read_table(rollup_path(store_dir, flux_type, name)).to_pandas()
+
+
+def reconcile_rollups(store_dir: Path,
+                      flux_type: str,
+                      rollups: Rollups,
+                      repair: bool = False) -> dict[str, pd.DataFrame]:
+    """
+    Compare les agrégats matérialisés à leur recalcul depuis les lignes de détail.
+
+    Les fragments pas encore intégrés le sont d'abord (`update_rollups`) : un écart
+    restant signale une table corrompue ou modifiée hors de ce module.
+
+    Parameters:
+        store_dir (Path): Racine du stockage.
+        flux_type (str): Type de flux.
+        rollups (Mapping[str, Sequence[str]]): Colonnes de regroupement par nom d'agrégat.
+        repair (bool): Remplace les tables divergentes par leur recalcul.
+
+    Returns:
+        dict[str, pd.DataFrame]: Groupes divergents par agrégat, avec les mesures matérialisées
+            et recalculées (suffixe `_detail`) ; un groupe absent d'un côté y a des mesures nulles.
+    """
+    update_rollups(store_dir, flux_type, rollups)
+    entries = load_manifest(store_dir, flux_type)
+    detail = _aggregate(flux_dir(store_dir, flux_type), entries, rollups)
+    differences = {}
+    for name, keys in rollups.items():
+        path = rollup_path(store_dir, flux_type, name)
+        materialized, _ = _load(path, keys)
+        expected = detail[name]
+        both = (pl.concat([materialized.with_columns(pl.lit(True).alias('_rollup')),
+                           expected.with_columns(pl.lit(False).alias('_rollup'))])
+                .group_by(list(keys), maintain_order=True)
+                .agg([pl.col(c).filter(pl.col('_rollup')).first().alias(c) for c in (*MEASURES, COUNT)]
+                     + [pl.col(c).filter(~pl.col('_rollup')).first().alias(f'{c}_detail')
+                        for c in (*MEASURES, COUNT)]))
+        diverging = pl.any_horizontal(
+            [(pl.col(m) - pl.col(f'{m}_detail')).abs() > TOLERANCE * pl.max_horizontal(1, pl.col(f'{m}_detail').abs())
+             for m in MEASURES]
+            + [pl.col(COUNT) != pl.col(f'{COUNT}_detail'),
+               pl.col(COUNT).is_null() | pl.col(f'{COUNT}_detail').is_null()])
+        mismatches = both.filter(diverging)
+        differences[name] = mismatches.to_pandas()
+        if mismatches.height:
+            _logger.warning(f"Agrégat {name} de {flux_type} : {mismatches.height} groupes divergents"
+                            + (", table reconstruite" if repair else ""))
+            if repair:
+                _save(path, expected, keys, len(entries))
+    return differences
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Repérage des éléments XML directement dans les octets du fichier.
+
+Permet de connaître la position (offset, longueur) de chaque élément d'une balise
+donnée sans construire d'arbre, par exemple pour relire un seul élément plus tard
+ou découper un gros fichier en morceaux indépendants.
+"""
+
+import re
+from typing import Iterator
+
+
+def _tag_pattern(tag: str) -> re.Pattern:
+    # <Tag>, <Tag attr="...">, <Tag/> et </Tag>, mais pas <TagSuffixe>
+    return re.compile(rb'<(/?)' + re.escape(tag.encode()) + rb'(?:\s[^>]*?)?(/?)>')
+
+
+def iter_element_spans(buf: bytes | memoryview, tag: str, start: int = 0, end: int | None = None) -> Iterator[tuple[int, int]]:
+    """
+    Itère sur les éléments `tag` les plus externes de `buf`, dans l'ordre du document.
+
+    Parameters:
+        buf: Contenu du fichier (bytes ou mmap).
+        tag (str): Nom de la balise, sans espace de noms.
+        start, end (int): Zone de `buf` à parcourir.
+
+    Yields:
+        tuple[int, int]: (offset, longueur) en octets de chaque élément, balises incluses.
+    """
+    pattern = _tag_pattern(tag)
+    depth = 0
+    opened = 0
+    for match in pattern.finditer(buf, start, len(buf) if end is None else end):
+        closing, self_closing = match.group(1), match.group(2)
+        if closing:
+            if depth == 0:
+                continue
+            depth -= 1
+            if depth == 0:
+                yield opened, match.end() - opened
+        elif self_closing:
+            if depth == 0:
+                yield match.start(), match.end() - match.start()
+        else:
+            if depth == 0:
+                opened = match.start()
+            depth += 1
+
+
+def element_spans(buf: bytes | memoryview, tag: str) -> list[tuple[int, int]]:
+    """Liste des (offset, longueur) des éléments `tag` les plus externes de `buf`."""
+    return list(iter_element_spans(buf, tag))
+
+
+def wrap_fragment(fragment: bytes, encoding: str | None = None, root_tag: str = 'Fragment') -> bytes:
+    """
+    Enveloppe un ou plusieurs éléments dans une racine synthétique, pour pouvoir les parser seuls.
+    L'encodage d'origine est redéclaré, les extraits n'ayant plus de déclaration XML.
+    """
+    declaration = f'<?xml version="1.0" encoding="{encoding or "UTF-8"}"?>'.encode()
+    return declaration + f'<{root_tag}>'.encode() + fragment + f'</{root_tag}>'.encode()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Typage des colonnes extraites, selon la section `expected_types` de simple_flux.yaml.
+
+Les colonnes sont extraites en Utf8 ; chaque type déclaré devient une expression polars,
+et toutes les colonnes d'un DataFrame sont typées en un seul `select` :
+ - 'String' : inchangée ;
+ - 'Float64', 'Int64' : nombres, les valeurs vides ou invalides deviennent null ;
+ - 'Date' : date sans fuseau (AAAA-MM-JJ) ;
+ - 'DateTime' : instant dans le fuseau Europe/Paris. Les valeurs avec décalage horaire
+   (ex. 2024-06-01T12:00:00+02:00) sont converties, les valeurs sans décalage (date seule
+   ou date et heure) sont lues comme heure locale de Paris ;
+ - 'Categorical' : chaînes dictionnaire-encodées, pour les colonnes à faible cardinalité ;
+ - une liste de valeurs : Enum de ces valeurs, les autres valeurs deviennent null.
+
+Les chaînes vides, produites pour les colonnes absentes d'un fichier, deviennent null
+pour tous les types autres que 'String'.
+"""
+
+import logging
+from typing import Any
+
+import pandas as pd
+import polars as pl
+
+_logger = logging.getLogger(__name__)
+
+TIME_ZONE = 'Europe/Paris'
+
+TYPE_MAPPING = {
+    'String': pl.Utf8,
+    'Float64': pl.Float64,
+    'Int64': pl.Int64,
+    'Date': pl.Date,
+    'DateTime': pl.Datetime('us', TIME_ZONE),
+    'Categorical': pl.Categorical,
+}
+
+# Heures inexistantes (passage à l'heure d'été) : null ; heures ambiguës : première occurrence
+_LOCAL = {'ambiguous': 'earliest', 'non_existent': 'null'}
+
+
+def polars_type(spec: str | list[str]) -> pl.DataType:
+    """Type polars d'une déclaration de `expected_types`."""
+    if isinstance(spec, list):
+        return pl.Enum(spec)
+    if spec not in TYPE_MAPPING:
+        raise ValueError(f"Unknown type in expected_types: {spec}")
+    return TYPE_MAPPING[spec]
+
+
+def _datetime_expr(text: pl.Expr) -> pl.Expr:
+    return pl.coalesce(
+        text.str.to_datetime('%Y-%m-%dT%H:%M:%S%#z', strict=False).dt.convert_time_zone(TIME_ZONE),
+        text.str.to_datetime('%Y-%m-%dT%H:%M:%S', strict=False).dt.replace_time_zone(TIME_ZONE, **_LOCAL),
+        text.str.to_date('%Y-%m-%d', strict=False).cast(pl.Datetime('us')).dt.replace_time_zone(TIME_ZONE, **_LOCAL),
+    )
+
+
+def type_expr(col: str, spec: str | list[str]) -> pl.Expr:
+    """Expression convertissant la colonne Utf8 `col` vers le type déclaré."""
+    dtype = polars_type(spec)
+    text = pl.col(col).cast(pl.Utf8)
+    if spec == 'String':
+        return text
+    text = text.str.strip_chars()
+    text = pl.when(text != '').then(text)
+    if spec == 'DateTime':
+        expr = _datetime_expr(text)
+    elif spec == 'Date':
+        expr = text.str.slice(0, 10).str.to_date('%Y-%m-%d', strict=False)
+    else:
+        expr = text.cast(dtype, strict=False)
+    return expr.alias(col)
+
+
+def column_exprs(columns: list[str], expected_types: dict[str, Any],
+                 present: set[str] | None = None) -> list[pl.Expr]:
+    """
+    Expressions produisant `columns` dans cet ordre, typées selon `expected_types`.
+
+    Les colonnes hors de `present` (toutes présentes par défaut) sont créées :
+    null du type déclaré, ou "" si elles ne sont pas typées.
+    """
+    exprs = []
+    for col in columns:
+        spec = expected_types.get(col)
+        if present is not None and col not in present:
+            exprs.append(pl.lit(None if spec not in (None, 'String') else '',
+                                pl.Utf8 if spec is None else polars_type(spec)).alias(col))
+        elif spec is None:
+            exprs.append(pl.col(col))
+        else:
+            exprs.append(type_expr(col, spec))
+    return exprs
+
+
+def apply_types(df: pl.DataFrame, expected_types: dict[str, Any]) -> pl.DataFrame:
+    """Type les colonnes présentes de `df` en un seul passage ; les autres sont inchangées."""
+    typed = {col: spec for col, spec in expected_types.items() if col in df.columns}
+    if not typed:
+        return df
+    return df.with_columns([type_expr(col, spec) for col, spec in typed.items()])
+
+
+def apply_pandas_types(df: pd.DataFrame, expected_types: dict[str, Any]) -> pd.DataFrame:
+    """
+    Équivalent de `apply_types` pour un DataFrame pandas (mêmes règles de conversion).
+
+    Nombres en float64 (Int64 nullable pour 'Int64'), dates en datetime64 (Europe/Paris
+    pour 'DateTime'), catégories et Enum en `category`.
+    """
+    typed = {col: spec for col, spec in expected_types.items() if col in df.columns and spec != 'String'}
+    if not typed or df.empty:
+        return df
+    df = df.copy(deep=False)
+    # Colonne par colonne, pour ne jamais dupliquer plus d'une colonne à la fois
+    for col, spec in typed.items():
+        source = pl.from_pandas(df[col]).cast(pl.Utf8).to_frame(col)
+        series = source.select(type_expr(col, spec)).to_series().to_pandas()
+        if spec == 'Int64':
+            series = series.astype('Int64')
+        series.index = df.index
+        df[col] = series
+    return df
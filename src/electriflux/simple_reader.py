@@ -1,13 +1,29 @@
 #!/usr/bin/env python3
 
 import re
-import yaml
+import zipfile
 import pandas as pd
+import pyarrow as pa
+import time
 import datetime
+import functools
 from pathlib import Path
 from lxml import etree as ET
 import logging
-from typing import Optional
+from typing import IO, Iterator, Optional
+
+from electriflux.cache import ParseCache, cached_parse
+from electriflux.columnar import ColumnBuilder
+from electriflux.ledger import LEDGER_NAME, Ledger
+from electriflux.metrics import Metrics, file_stages, lap, timed
+from electriflux.parallel import FileError, map_file_pairs
+from electriflux.plan import compile_plan, load_flux_config
+from electriflux.rollup import update_rollups
+from electriflux.schema import apply_pandas_types
+from electriflux.sink import DEFAULT_BATCH_ROWS, TableSink
+from electriflux.split import map_split_file_pairs
+from electriflux.store import processed_files, read_store, to_string_table, write_parsed
+from electriflux.streaming import iter_rows
 
 _logger = logging.getLogger(__name__)
 def get_consumption_names() -> list[str]:
@@ -22,7 +38,9 @@ def get_consumption_names() -> list[str]:
 def xml_to_dataframe(xml_path: Path, row_level: str, 
                      metadata_fields: dict[str, str] = {}, 
                      data_fields: dict[str, str] = {},
-                     nested_fields: list[dict] = {}) -> pd.DataFrame:
+                     nested_fields: list[dict] = {},
+                     stream: bool = False,
+                     backend: str = 'rows') -> pd.DataFrame:
     """
     Convert an XML structure to a Pandas DataFrame, handling nested structures and multiple conditions.
 
@@ -32,59 +50,59 @@ def xml_to_dataframe(xml_path: Path, row_level: str,
         metadata_fields (Dict[str, str]): Dictionary of metadata fields with keys as field names and values as XPath-like strings.
         data_fields (Dict[str, str]): Dictionary of data fields with keys as field names and values as XPath-like strings.
         nested_fields: list[dict]: List of dictionaries that define how to extract nested fields with optional conditions.
+        stream (bool): If True, parse the file incrementally with `iterparse` and free each row once extracted,
+            keeping memory bounded on large files (row_level must be of the form './/Tag').
+        backend (str): 'rows' builds one dict per row (object columns). 'arrow' appends values straight
+            into per-column builders and returns Arrow-backed columns (pd.ArrowDtype(pa.string())).
 
     Returns:
         pd.DataFrame: DataFrame representation of the XML data.
     """
-    tree = ET.parse(xml_path)
-    root = tree.getroot()
+    if backend not in ('rows', 'arrow'):
+        raise ValueError(f"Unknown backend: {backend}")
+    # Compiled once per definition (cached), then reused for every row
+    plan = compile_plan(row_level, metadata_fields, data_fields, nested_fields)
+
+    # Stage timings, only when the caller collects metrics (see electriflux.metrics)
+    stages = file_stages()
+    if stages is not None:
+        start = time.perf_counter()
 
     meta: dict[str, str] = {}
-    # Extract metadata fields
-    for field_name, field_xpath in metadata_fields.items():
-        field_elem = root.find(field_xpath)
-        if field_elem is not None:
-            meta[field_name] = field_elem.text
-
-    all_rows = []
-    for row in root.findall(row_level):
-        # Extract data fields
-        row_data = {field_name: row.find(field_xpath)
-                    for field_name, field_xpath in data_fields.items()}
-        row_data = {k: v.text if hasattr(v, 'text') else v for k, v in row_data.items()}
-        
-        # Extract nested fields with multiple conditions
-        nested_data = {}
-        for nested in nested_fields:
-            prefix = nested.get('prefix', '')
-            child_path = nested['child_path']
-            id_field = nested['id_field']
-            value_field = nested['value_field']
-            conditions = nested.get('conditions', [])
-
-            for nr in row.findall(child_path):
-                key_elem = nr.find(id_field)
-                value_elem = nr.find(value_field)
-
-                # Collect all condition results
-                condition_results = [nr.find(cond['xpath']).text == cond['value'] for cond in conditions if nr.find(cond['xpath']) is not None]
-                if all(condition_results):
-                    if key_elem is not None and value_elem is not None:
-                        nested_data[f"{prefix}{key_elem.text}"] = value_elem.text
-                
-                        additional_fields = nested.get('additional_fields', {})
-                        # Extract additional fields.
-                        for add_field_name, add_field_xpath in additional_fields.items():
-                            if f"{prefix}{add_field_name}" not in nested_data: # On évite d'aller cherche plusieurs fois là même info, on prend juste la première
-                                add_elem = nr.find(add_field_xpath)
-                                if add_elem is not None:
-                                    nested_data[f"{prefix}{add_field_name}"] = add_elem.text
-
-        all_rows.append(row_data | nested_data)
+    if stream:
+        # Parsing happens while rows are extracted: both are counted as 'extract'
+        rows = iter_rows(xml_path, row_level, metadata_fields, plan.depth, meta)
+    else:
+        tree = ET.parse(xml_path)
+        root = tree.getroot()
+        meta = plan.extract_metadata(root)
+        rows = root.findall(row_level)
+        if stages is not None:
+            start = lap(stages, 'parse', start)
+
+    if backend == 'arrow':
+        builder = ColumnBuilder(plan.columns)
+        extract = plan.column_extractor(builder)
+        for row in rows:
+            extract(row)
+        if stages is not None:
+            start = lap(stages, 'extract', start)
+        df = builder.to_pandas(meta)
+        if stages is not None:
+            lap(stages, 'frame', start)
+        return df
+
+    # Extract data fields and nested fields with multiple conditions
+    extract = plan.row_extractor()
+    all_rows = [extract(row) for row in rows]
+    if stages is not None:
+        start = lap(stages, 'extract', start)
 
     df = pd.DataFrame(all_rows)
     for k, v in meta.items():
         df[k] = v
+    if stages is not None:
+        lap(stages, 'frame', start)
     return df
 
 def find_xml_files(
@@ -119,37 +137,108 @@ def find_xml_files(
     _logger.info(f"Trouvé {len(xml_files)} fichiers XML après filtrage")
     return xml_files
 
+def parse_xml_files(xml_files: list[Path],
+                    row_level: str,
+                    metadata_fields: dict[str, str] = {},
+                    data_fields: dict[str, str] = {},
+                    nested_fields: list[dict] = {},
+                    stream: bool = False,
+                    workers: int | None = 1,
+                    errors: list[FileError] | None = None,
+                    backend: str = 'rows',
+                    cache: ParseCache | None = None,
+                    metrics: Metrics | None = None,
+                    split_bytes: int | None = None) -> list[tuple[Path, pd.DataFrame]]:
+    """
+    Parse a list of XML files, one DataFrame per file, in the order of `xml_files`.
+
+    Files that fail are logged, reported in `errors` if given, and left out of the result.
+    With a `cache`, files already extracted with the same flux definition are read back
+    from it instead of being parsed again. Files of at least `split_bytes` bytes are cut into
+    row chunks parsed by all `workers` at once (see electriflux.split).
+
+    Returns:
+        list[tuple[Path, pd.DataFrame]]: (file, DataFrame) pairs for every file parsed successfully.
+    """
+    parse = functools.partial(xml_to_dataframe, row_level=row_level, metadata_fields=metadata_fields,
+                              data_fields=data_fields, nested_fields=nested_fields, stream=stream,
+                              backend=backend)
+    if split_bytes is None:
+        map_parse = functools.partial(map_file_pairs, parse, workers=workers, errors=errors, metrics=metrics)
+    else:
+        map_parse = functools.partial(map_split_file_pairs, parse, split_bytes=split_bytes, row_level=row_level,
+                                      metadata_fields=metadata_fields, data_fields=data_fields,
+                                      nested_fields=nested_fields, backend=backend, workers=workers,
+                                      errors=errors, metrics=metrics)
+    if cache is None:
+        return map_parse(xml_files)
+
+    plan = compile_plan(row_level, metadata_fields, data_fields, nested_fields)
+    return cached_parse(
+        xml_files,
+        map_parse,
+        cache,
+        f'simple_reader:{backend}:{plan.fingerprint}',
+        to_string_table,
+        functools.partial(_frame_from_table, backend=backend),
+    )
+
+def _frame_from_table(table: pa.Table, backend: str) -> pd.DataFrame:
+    if backend == 'arrow':
+        return table.to_pandas(types_mapper=pd.ArrowDtype)
+    # Same construction as the 'rows' backend: python objects, missing values as None
+    return pd.DataFrame({name: table.column(name).to_pylist() for name in table.column_names})
+
 def process_xml_files(xml_files: list[Path],  
                       row_level: str, 
                       metadata_fields: dict[str, str] = {}, 
                       data_fields: dict[str, str] = {},
-                      nested_fields: list[tuple[str, str, str, str]] = {}) -> pd.DataFrame:
-    all_data = []
-
-    # # Use glob to find all XML files matching the pattern in the directory
-    for xml_file in xml_files:
-        try:
-            df = xml_to_dataframe(xml_file, row_level, metadata_fields, data_fields, nested_fields)
-            all_data.append(df)
-        except Exception as e:
-            _logger.error(f"Error processing {xml_file}: {e}")
+                      nested_fields: list[tuple[str, str, str, str]] = {},
+                      stream: bool = False,
+                      workers: int | None = 1,
+                      errors: list[FileError] | None = None,
+                      backend: str = 'rows',
+                      cache: ParseCache | None = None,
+                      metrics: Metrics | None = None,
+                      split_bytes: int | None = None) -> pd.DataFrame:
+    """
+    Parse a list of XML files and concatenate the results, in the order of `xml_files`.
+
+    Parameters:
+        workers (int | None): Number of processes used to parse the files; 1 parses them
+            sequentially, None uses every available core.
+        errors (list[FileError], optional): If given, receives one FileError per file that failed.
+        cache (ParseCache, optional): On-disk cache of per-file results, see electriflux.cache.
+        metrics (Metrics, optional): Collects per-stage timings and per-file counts, see electriflux.metrics.
+        split_bytes (int, optional): Files of at least this size are split into row chunks and
+            parsed by all `workers` together, see electriflux.split.
+    """
+    parsed = parse_xml_files(xml_files, row_level, metadata_fields, data_fields, nested_fields,
+                             stream, workers, errors, backend, cache, metrics, split_bytes)
+    all_data = [df for _, df in parsed]
+
     # Combine all dataframes
     if all_data:
-        combined_df = pd.concat(all_data, ignore_index=True)
+        with timed(metrics, 'concat'):
+            combined_df = pd.concat(all_data, ignore_index=True)
         return combined_df
     else:
         return pd.DataFrame()
     
-def load_flux_config(flux_type, config_path='flux_configs.yaml'):
-    with open(config_path, 'r') as file:
-        configs = yaml.safe_load(file)
-    
-    if flux_type not in configs:
-        raise ValueError(f"Unknown flux type: {flux_type}")
-    
-    return configs[flux_type]
+def process_flux(flux_type:str, xml_dir:Path, config_path:Path|None=None, stream:bool=False,
+                 workers:int|None=1, errors:list[FileError]|None=None, backend:str='rows',
+                 cache:ParseCache|None=None, metrics:Metrics|None=None, typed:bool=False,
+                 split_bytes:int|None=None):
+    """
+    Parse every file of a flux into a single DataFrame.
 
-def process_flux(flux_type:str, xml_dir:Path, config_path:Path|None=None):
+    By default every column holds strings. With `typed=True`, the columns declared in the
+    flux `expected_types` are converted, as in polars_reader: numbers, Europe/Paris
+    datetimes and `category` columns (see electriflux.schema).
+
+    With `split_bytes`, a single file at least that large (a monthly C15 or R15) is cut
+    into row chunks parsed by all `workers` at once, instead of by one core.
+    """
 
     if config_path is None:
         # Build the path to the YAML file relative to the script's location
@@ -159,28 +248,146 @@ def process_flux(flux_type:str, xml_dir:Path, config_path:Path|None=None):
     
     # Use a default file_regex if not specified in the config
     file_regex = config.get('file_regex', None)
-    xml_files = find_xml_files(xml_dir, file_regex)
+    with timed(metrics, 'discovery'):
+        xml_files = find_xml_files(xml_dir, file_regex)
     df = process_xml_files(
         xml_files,
         config['row_level'],
         config['metadata_fields'],
         config['data_fields'],
         config['nested_fields'],
+        stream,
+        workers,
+        errors,
+        backend,
+        cache,
+        metrics,
+        split_bytes,
     )
+    if typed:
+        with timed(metrics, 'types'):
+            df = apply_pandas_types(df, config.get('expected_types', {}))
     return df
 
+def process_flux_to(flux_type:str, xml_dir:Path, sink:Path|TableSink, batch_rows:int=DEFAULT_BATCH_ROWS,
+                    format:str|None=None, config_path:Path|None=None, stream:bool=False,
+                    workers:int|None=1, errors:list[FileError]|None=None, backend:str='rows',
+                    cache:ParseCache|None=None, metrics:Metrics|None=None,
+                    split_bytes:int|None=None, batch_files:int=64) -> int:
+    """
+    Parse every file of a flux straight into a Parquet, Arrow IPC or CSV file, batch by batch.
+
+    Unlike `process_flux`, the flux is never held in memory as a whole: files are parsed
+    `batch_files` at a time and their rows written as soon as `batch_rows` are pending
+    (see electriflux.sink). Every column holds strings, and the output schema is the union
+    of the columns of all files, as with `process_flux`.
+
+    Parameters:
+        sink (Path | TableSink): Output file, its format taken from the suffix (.parquet,
+            .arrow/.ipc/.feather, .csv) unless `format` is given. An open TableSink is
+            written to and left open.
+        batch_rows (int): Rows per written batch (Parquet row group, IPC record batch).
+        batch_files (int): Files parsed between two writes.
+        Other parameters: see `process_flux`.
+
+    Returns:
+        int: Number of rows written.
+    """
+    if config_path is None:
+        config_path = Path(__file__).parent / 'simple_flux.yaml'
+    config = load_flux_config(flux_type, config_path)
+    with timed(metrics, 'discovery'):
+        xml_files = find_xml_files(xml_dir, config.get('file_regex', None))
+
+    owned = not isinstance(sink, TableSink)
+    if owned:
+        sink = TableSink(Path(sink), format, batch_rows)
+    start = sink.received
+    try:
+        for i in range(0, len(xml_files), batch_files):
+            parsed = parse_xml_files(xml_files[i:i + batch_files], config['row_level'], config['metadata_fields'],
+                                     config['data_fields'], config['nested_fields'], stream, workers, errors,
+                                     backend, cache, metrics, split_bytes)
+            with timed(metrics, 'sink'):
+                for _, df in parsed:
+                    sink.write(df)
+    except BaseException:
+        if owned:
+            sink.abort()
+        raise
+    if owned:
+        with timed(metrics, 'sink'):
+            sink.close()
+    return sink.received - start
+
+def zip_to_dataframes(zip_file: Path | IO[bytes],
+                      flux_type: str,
+                      config_path: Path | None = None,
+                      xml_dir: Path | None = None,
+                      stream: bool = False,
+                      backend: str = 'rows',
+                      errors: list[FileError] | None = None) -> Iterator[tuple[str, pd.DataFrame]]:
+    """
+    Parse the XML members of a (decrypted) zip archive without extracting it, one DataFrame per member.
+
+    Members are read straight from the archive, which can be a path or any seekable binary
+    file object (e.g. an in-memory or spooled buffer). Only the members that `process_flux`
+    would pick up are parsed: '*.xml' files matching the flux `file_regex`. A member that
+    fails is logged, reported in `errors` if given, and skipped: the other members are still
+    yielded.
+
+    Parameters:
+        zip_file (Path | IO[bytes]): Zip archive.
+        flux_type (str): Flux type, as in `simple_flux.yaml`.
+        xml_dir (Path, optional): If given, every member is also written there (as `extractall`
+            would) and parsed from that copy.
+        stream, backend: See `xml_to_dataframe`.
+        errors (list[FileError], optional): Receives one FileError (member name) per member that failed.
+
+    Yields:
+        tuple[str, pd.DataFrame]: (member name, DataFrame), in archive order.
+    """
+    config = load_flux_config(flux_type, config_path or Path(__file__).parent / 'simple_flux.yaml')
+    pattern = re.compile(config['file_regex']) if config.get('file_regex') else None
+    parse = functools.partial(xml_to_dataframe, row_level=config['row_level'],
+                              metadata_fields=config['metadata_fields'], data_fields=config['data_fields'],
+                              nested_fields=config['nested_fields'], stream=stream, backend=backend)
+    with zipfile.ZipFile(zip_file) as zf:
+        for info in zf.infolist():
+            if info.is_dir():
+                continue
+            try:
+                if xml_dir is not None:
+                    extracted = Path(zf.extract(info, xml_dir))
+                name = Path(info.filename).name
+                if not name.endswith('.xml') or (pattern is not None and not pattern.search(name)):
+                    continue
+                if xml_dir is not None:
+                    df = parse(extracted)
+                else:
+                    with zf.open(info) as member:
+                        df = parse(member)
+            except Exception as e:
+                _logger.error(f"Error processing {info.filename}: {e}")
+                if errors is not None:
+                    errors.append(FileError(Path(info.filename), type(e).__name__, str(e)))
+                continue
+            yield info.filename, df
+
+def _history_ledger(path:Path) -> Ledger:
+    # history.csv is replaced by the 'history' register of ledger.db, next to it (imported once if present)
+    return Ledger(path.with_name(LEDGER_NAME), path.stem, legacy_csv=path)
+
 def load_history(path:Path):
-    if not path.exists():
-        return pd.DataFrame(columns=['file', 'processed_at'])
-    return pd.read_csv(path)
+    with _history_ledger(path) as ledger:
+        entries = ledger.entries()
+    return entries.rename(columns={'name': 'file'})[['file', 'processed_at']]
 
 def append_to_history(path:Path, new_files:list[Path]):
-    old_history = load_history(path)
-    new_history = pd.DataFrame({
-        'file': [file.name for file in new_files],
-        'processed_at': datetime.datetime.now().isoformat()
-    })
-    pd.concat([old_history, new_history], ignore_index=True).to_csv(path, index=False)
+    with _history_ledger(path) as ledger:
+        # One commit per file: an interrupted run keeps what it has recorded
+        for file in new_files:
+            ledger.add(file.name)
 
 
 def load_data(path:Path):
@@ -199,29 +406,96 @@ def reset_flux(flux_type:str, path:Path):
         (path/f'{flux_type}.csv').unlink()
     if (path/'history.csv').exists():
         (path/'history.csv').unlink()
+    if (path/LEDGER_NAME).exists():
+        with _history_ledger(path/'history.csv') as ledger:
+            ledger.reset()
+
+def iterative_process_flux(flux_type:str, xml_dir:Path, config_path:Path|None=None, stream:bool=False,
+                           workers:int|None=1, errors:list[FileError]|None=None,
+                           backend:str='rows', storage:str='csv', store_dir:Path|None=None,
+                           cache:ParseCache|None=None, metrics:Metrics|None=None,
+                           read_all:bool=False)->pd.DataFrame:
+    """
+    Process only the XML files not seen by a previous run and add them to the stored data.
 
-def iterative_process_flux(flux_type:str, xml_dir:Path, config_path:Path|None=None)->pd.DataFrame:
+    Parameters:
+        storage (str): 'csv' rewrites `{flux_type}.csv` in `xml_dir`, records the files read in
+            its ledger (see electriflux.ledger) and returns all the data.
+            'parquet' appends new Parquet fragments, partitioned by month, to `store_dir`
+            (see electriflux.store) and returns only the rows of the new files, so a run
+            only costs the time of its new files.
+        store_dir (Path, optional): Root of the Parquet store, `xml_dir / 'parquet'` by default.
+        read_all (bool): With 'parquet' storage, read back and return the whole store
+            (`read_store`) instead of the new rows.
+        metrics (Metrics, optional): Collects per-stage timings and per-file counts, see electriflux.metrics.
+    """
     if config_path is None:
         # Build the path to the YAML file relative to the script's location
         config_path = Path(__file__).parent / 'simple_flux.yaml'
     config = load_flux_config(flux_type, config_path)
-    file_history: pd.DataFrame = load_history(xml_dir / Path('history.csv'))
+    if storage == 'parquet':
+        return _iterative_process_flux_parquet(flux_type, xml_dir, config, store_dir or xml_dir / 'parquet',
+                                               stream, workers, errors, backend, cache, metrics, read_all)
+    if storage != 'csv':
+        raise ValueError(f"Unknown storage: {storage}")
+    with _history_ledger(xml_dir / Path('history.csv')) as ledger:
+        seen_files = ledger.names()
 
     # Use a default file_regex if not specified in the config
     file_regex = config.get('file_regex', None)
-    xml_files = find_xml_files(xml_dir, file_regex, set(file_history['file']))
+    with timed(metrics, 'discovery'):
+        xml_files = find_xml_files(xml_dir, file_regex, seen_files)
 
-    df = process_xml_files(
+    parsed = parse_xml_files(
         xml_files,
         config['row_level'],
         config['metadata_fields'],
         config['data_fields'],
         config['nested_fields'],
+        stream,
+        workers,
+        errors,
+        backend,
+        cache,
+        metrics,
     )
+    with timed(metrics, 'concat'):
+        df = pd.concat([part for _, part in parsed], ignore_index=True) if parsed else pd.DataFrame()
     data = append_to_data(xml_dir / Path(f'{flux_type}.csv'), df)
-    append_to_history(xml_dir / Path('history.csv'), xml_files)
+    # Only the files actually read: those that failed are retried on the next run
+    append_to_history(xml_dir / Path('history.csv'), [file for file, _ in parsed])
     return data
 
+def _iterative_process_flux_parquet(flux_type:str, xml_dir:Path, config:dict, store_dir:Path,
+                                    stream:bool, workers:int|None, errors:list[FileError]|None,
+                                    backend:str, cache:ParseCache|None,
+                                    metrics:Metrics|None, read_all:bool)->pd.DataFrame:
+    # The store manifest doubles as the file history
+    with timed(metrics, 'discovery'):
+        xml_files = find_xml_files(xml_dir, config.get('file_regex', None), processed_files(store_dir, flux_type))
+    parsed = parse_xml_files(
+        xml_files,
+        config['row_level'],
+        config['metadata_fields'],
+        config['data_fields'],
+        config['nested_fields'],
+        stream,
+        workers,
+        errors,
+        backend,
+        cache,
+        metrics,
+    )
+    with timed(metrics, 'store'):
+        write_parsed(store_dir, flux_type, parsed, config.get('partition_field'))
+    with timed(metrics, 'rollup'):
+        update_rollups(store_dir, flux_type, config.get('rollups'))
+    if read_all:
+        return read_store(store_dir, flux_type)
+    frames = [df for _, df in parsed if not df.empty]
+    with timed(metrics, 'concat'):
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
 def main():
     from icecream import ic
     # reset_flux('F15', Path('~/data/flux_enedis_v2/F15').expanduser())
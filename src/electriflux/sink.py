@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Écriture par lots d'un flux dans un fichier Parquet, Arrow IPC ou CSV.
+
+`process_flux` construit tout le DataFrame en mémoire avant d'écrire quoi que ce soit.
+`TableSink` reçoit au contraire les DataFrames fichier par fichier et écrit un lot dès que
+`batch_rows` lignes sont en attente : la mémoire dépend de la taille d'un lot, pas de
+celle de l'historique.
+
+Toutes les colonnes sont des chaînes (voir `store.to_string_table`) et le schéma est l'union
+des colonnes rencontrées, dans l'ordre d'apparition. Une colonne apparue en cours de route
+(champ imbriqué absent des premiers fichiers) ouvre un nouveau segment ; à la fermeture, les
+segments sont recopiés lot par lot dans le fichier final avec le schéma complet, les colonnes
+absentes d'un segment étant nulles. Le fichier n'apparaît sous son nom qu'une fois complet.
+
+    with TableSink(Path('F15.parquet')) as sink:
+        for path, df in parse_xml_files(...):
+            sink.write(df)
+"""
+
+import logging
+from pathlib import Path
+from typing import Iterator
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+from electriflux.store import to_string_table
+
+_logger = logging.getLogger(__name__)
+
+FORMATS = {'.parquet': 'parquet', '.arrow': 'ipc', '.ipc': 'ipc', '.feather': 'ipc', '.csv': 'csv'}
+DEFAULT_BATCH_ROWS = 100_000
+
+
+def sink_format(path: Path) -> str:
+    """Format de sortie ('parquet', 'ipc' ou 'csv') déduit de l'extension de `path`."""
+    try:
+        return FORMATS[path.suffix.lower()]
+    except KeyError:
+        raise ValueError(f"Format de sortie inconnu pour {path.name} ({', '.join(FORMATS)}), préciser `format`")
+
+
+def _open_writer(path: Path, schema: pa.Schema, format: str):
+    if format == 'parquet':
+        return pq.ParquetWriter(path, schema)
+    if format == 'ipc':
+        return pa.ipc.new_file(path, schema)
+    return pa_csv.CSVWriter(path, schema)
+
+
+def _read_batches(path: Path, schema: pa.Schema, format: str) -> Iterator[pa.RecordBatch]:
+    """Relit un segment lot par lot, sans le charger en entier."""
+    if format == 'parquet':
+        yield from pq.ParquetFile(path).iter_batches()
+    elif format == 'ipc':
+        with pa.memory_map(str(path)) as source:
+            reader = pa.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                yield reader.get_batch(i)
+    else:
+        # Le CSV écrit les nulls sans guillemets et les chaînes vides entre guillemets
+        options = pa_csv.ConvertOptions(column_types=schema, strings_can_be_null=True,
+                                        quoted_strings_can_be_null=False)
+        yield from pa_csv.open_csv(path, convert_options=options)
+
+
+class TableSink:
+    """
+    Fichier de sortie alimenté par lots de DataFrames (voir le module).
+
+    Parameters:
+        path (Path): Fichier produit.
+        format (str, optional): 'parquet', 'ipc' ou 'csv' ; déduit de l'extension par défaut.
+        batch_rows (int): Lignes en attente au-delà desquelles un lot est écrit.
+    """
+
+    def __init__(self, path: Path, format: str | None = None, batch_rows: int = DEFAULT_BATCH_ROWS):
+        self.path = Path(path)
+        self.format = format or sink_format(self.path)
+        if self.format not in FORMATS.values():
+            raise ValueError(f"Format de sortie inconnu : {self.format}")
+        self.batch_rows = batch_rows
+        self.columns: list[str] = []
+        # Lignes reçues par `write`, et lignes déjà écrites
+        self.received = 0
+        self.rows = 0
+        # Lignes en attente, déjà converties en Arrow : plus compactes que les DataFrames lus
+        self._pending: list[pa.Table] = []
+        self._pending_rows = 0
+        self._segments: list[tuple[Path, pa.Schema]] = []
+        self._writer = None
+
+    def __enter__(self) -> 'TableSink':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def write(self, df: pd.DataFrame) -> None:
+        """Ajoute les lignes de `df`, écrites dès que `batch_rows` lignes sont en attente."""
+        known = set(self.columns)
+        self.columns += [str(col) for col in df.columns if str(col) not in known]
+        if len(df):
+            self.received += len(df)
+            self._pending.append(to_string_table(df))
+            self._pending_rows += len(df)
+        if self._pending_rows >= self.batch_rows:
+            self.flush()
+
+    def flush(self) -> None:
+        """Écrit les lignes en attente."""
+        if not self._pending:
+            return
+        table = pa.concat_tables(self._pending, promote_options='default')
+        self._pending, self._pending_rows = [], 0
+        table = pa.table([table.column(col) if col in table.column_names else pa.nulls(table.num_rows, pa.string())
+                          for col in self.columns],
+                         schema=pa.schema([(col, pa.string()) for col in self.columns]))
+        if self._writer is None or not self._segments[-1][1].equals(table.schema):
+            self._open_segment(table.schema)
+        self._writer.write_table(table)
+        self.rows += table.num_rows
+
+    def _open_segment(self, schema: pa.Schema) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            _logger.debug(f"{self.path.name} : nouvelle colonne, segment {len(self._segments) + 1} ouvert")
+        segment = self.path.with_name(f'{self.path.name}.{len(self._segments)}.tmp')
+        self._writer = _open_writer(segment, schema, self.format)
+        self._segments.append((segment, schema))
+
+    def close(self) -> int:
+        """
+        Écrit les dernières lignes et produit le fichier final.
+
+        Returns:
+            int: Nombre de lignes écrites.
+        """
+        self.flush()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        schema = pa.schema([(col, pa.string()) for col in self.columns])
+        if not self._segments:
+            # Aucune ligne : un fichier vide mais valide, avec les colonnes vues
+            self._open_segment(schema)
+            self._writer.close()
+            self._writer = None
+        if len(self._segments) == 1:
+            self._segments[0][0].replace(self.path)
+        else:
+            tmp = self.path.with_name(self.path.name + '.tmp')
+            writer = _open_writer(tmp, schema, self.format)
+            try:
+                for segment, segment_schema in self._segments:
+                    for batch in _read_batches(segment, segment_schema, self.format):
+                        writer.write_batch(pa.RecordBatch.from_arrays(
+                            [batch.column(col) if col in segment_schema.names else pa.nulls(batch.num_rows, pa.string())
+                             for col in schema.names], schema=schema))
+            finally:
+                writer.close()
+            tmp.replace(self.path)
+            for segment, _ in self._segments:
+                segment.unlink()
+            _logger.info(f"{self.path.name} : {len(self._segments)} segments réunis")
+        self._segments = []
+        _logger.info(f"{self.path.name} : {self.rows} lignes, {len(self.columns)} colonnes")
+        return self.rows
+
+    def abort(self) -> None:
+        """Abandonne l'écriture : les segments sont supprimés, `path` n'est pas créé."""
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        for segment, _ in self._segments:
+            segment.unlink(missing_ok=True)
+        self._segments, self._pending, self._pending_rows = [], [], 0
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Lecture parallèle d'un seul gros fichier XML, découpé en morceaux de lignes.
+
+La parallélisation par fichier (`workers` de `process_flux`) ne sert à rien pour un C15
+ou un R15 mensuel de plusieurs centaines de Mo : un seul cœur le lit. Ici :
+ - le fichier est projeté en mémoire (mmap) et les éléments `row_level` (ex. `<PRM>`)
+   sont repérés directement dans les octets (voir electriflux.rowscan) ;
+ - les lignes sont réparties en morceaux de tailles équilibrées. Un morceau n'est qu'une
+   liste de plages d'octets : chaque processus projette lui-même le fichier, rien n'est
+   copié ni transmis d'un processus à l'autre à part les plages et les lignes extraites ;
+ - chaque processus enveloppe ses plages dans une racine synthétique, les parse et leur
+   applique le plan compilé du flux ;
+ - les métadonnées ne sont lues qu'une fois, sur le squelette du fichier (en-têtes, premier
+   élément ligne et tout ce qui n'est pas une ligne), puis ajoutées à toutes les lignes.
+
+Le résultat est identique, ligne à ligne et colonne à colonne, à celui de
+`simple_reader.xml_to_dataframe`. Le découpage n'est possible que si le `row_level` est de
+la forme './/Tag' et qu'aucun champ ne remonte au-dessus de la ligne ('../') ; sinon, ou
+pour un fichier sans déclaration d'encodage compatible ASCII, le fichier est lu d'un bloc.
+"""
+
+import os
+import re
+import time
+import mmap
+import logging
+import functools
+from concurrent.futures import Executor
+from pathlib import Path
+from typing import Callable
+
+import pandas as pd
+import pyarrow as pa
+from lxml import etree as ET
+
+from electriflux.columnar import ColumnBuilder
+from electriflux.metrics import Metrics, file_stages, lap
+from electriflux.parallel import FileError, map_file_pairs, process_pool, resolve_workers
+from electriflux.plan import FluxPlan, compile_plan
+from electriflux.rowscan import element_spans
+from electriflux.streaming import row_tag
+
+_logger = logging.getLogger(__name__)
+
+# Racine synthétique des morceaux
+FRAGMENT_ROOT = 'Fragment'
+
+# Morceaux par processus : compense les écarts de densité entre lignes
+CHUNKS_PER_WORKER = 4
+
+_ENCODING = re.compile(rb'''^\s*<\?xml[^>]*?encoding\s*=\s*["']([A-Za-z0-9._-]+)["']''')
+_NAMESPACE = re.compile(rb'''\sxmlns(?::([\w.-]+))?\s*=\s*(["'])(.*?)\2''', re.S)
+_ASCII_COMPATIBLE = re.compile(r'(utf-?8|us-ascii|ascii|iso-?8859-\d+|latin-?1|windows-125\d|cp125\d)$', re.I)
+
+
+def split_tag(plan: FluxPlan) -> str | None:
+    """Balise de découpage d'un plan, ou None si ses lignes ne peuvent pas être lues séparément."""
+    if plan.depth > 0 or not plan.row_level.startswith('.//'):
+        return None
+    try:
+        return row_tag(plan.row_level)
+    except ValueError:
+        return None
+
+
+def file_encoding(head: bytes) -> str | None:
+    """
+    Encodage déclaré en tête de fichier (UTF-8 sans déclaration), ou None s'il n'est pas
+    compatible ASCII : les balises ne peuvent alors pas être repérées dans les octets.
+    """
+    if head.startswith((b'\xff\xfe', b'\xfe\xff')):
+        return None
+    match = _ENCODING.match(head.removeprefix(b'\xef\xbb\xbf'))
+    encoding = match.group(1).decode() if match else 'UTF-8'
+    return encoding if _ASCII_COMPATIBLE.match(encoding) else None
+
+
+def namespace_declarations(head: bytes) -> bytes | None:
+    """
+    Déclarations d'espaces de noms (xmlns) de l'en-tête, à reporter sur la racine synthétique
+    pour que les lignes gardent leurs espaces de noms ; None si un préfixe y est déclaré deux fois
+    avec des valeurs différentes.
+    """
+    declared: dict[bytes, bytes] = {}
+    for prefix, _, uri in _NAMESPACE.findall(head):
+        if declared.setdefault(prefix, uri) != uri:
+            return None
+    return b''.join(b' xmlns' + (b':' + prefix if prefix else b'') + b'="' + uri + b'"'
+                    for prefix, uri in declared.items())
+
+
+def balanced_chunks(spans: list[tuple[int, int]], n_chunks: int) -> list[list[tuple[int, int]]]:
+    """
+    Répartit des éléments consécutifs en au plus `n_chunks` morceaux d'octets équilibrés.
+
+    Chaque morceau est une liste de plages (début, fin), une par élément.
+    """
+    if not spans:
+        return []
+    total = sum(length for _, length in spans)
+    target = max(1, total // max(1, n_chunks))
+    chunks, current, size = [], [], 0
+    for offset, length in spans:
+        current.append((offset, offset + length))
+        size += length
+        if size >= target and len(chunks) < n_chunks - 1:
+            chunks.append(current)
+            current, size = [], 0
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _merge_runs(buf: mmap.mmap, ranges: list[tuple[int, int]]) -> list[tuple[int, int]]:
+    runs: list[tuple[int, int]] = []
+    for start, end in ranges:
+        if runs and (runs[-1][1] == start or not buf[runs[-1][1]:start].strip()):
+            runs[-1] = (runs[-1][0], end)
+        else:
+            runs.append((start, end))
+    return runs
+
+
+def _feed(buf: mmap.mmap, ranges: list[tuple[int, int]], encoding: str | None = None,
+          namespaces: bytes = b'') -> ET._Element:
+    # Les plages sont passées une à une au parseur : pas de concaténation en mémoire.
+    # Sans `encoding`, les plages forment un document complet (déclaration et racine comprises).
+    parser = ET.XMLParser()
+    if encoding is not None:
+        parser.feed(f'<?xml version="1.0" encoding="{encoding}"?><{FRAGMENT_ROOT}'.encode() + namespaces + b'>')
+    for start, end in ranges:
+        parser.feed(buf[start:end])
+    if encoding is not None:
+        parser.feed(f'</{FRAGMENT_ROOT}>'.encode())
+    return parser.close()
+
+
+def _skeleton(buf: mmap.mmap, spans: list[tuple[int, int]]) -> ET._Element:
+    # Tout le fichier sauf les lignes 2..n : en-têtes, première ligne, éléments hors lignes
+    ranges = [(0, spans[0][0] + spans[0][1])]
+    for (prev, prev_length), (offset, _) in zip(spans, spans[1:]):
+        if buf[prev + prev_length:offset].strip():
+            ranges.append((prev + prev_length, offset))
+    ranges.append((spans[-1][0] + spans[-1][1], len(buf)))
+    return _feed(buf, ranges)
+
+
+def parse_chunk(xml_path: Path,
+                runs: list[tuple[int, int]],
+                encoding: str,
+                namespaces: bytes,
+                row_level: str,
+                metadata_fields: dict[str, str] = {},
+                data_fields: dict[str, str] = {},
+                nested_fields: list[dict] = {},
+                backend: str = 'rows') -> pd.DataFrame | list[dict[str, str | None]]:
+    """
+    Lit les lignes contenues dans les plages `runs` de `xml_path`, sans les métadonnées
+    (exécuté dans un processus du pool, picklable avec `functools.partial`).
+
+    Avec le backend 'rows', renvoie les dictionnaires de lignes : le DataFrame est construit
+    une seule fois pour tout le fichier, pour que les types inférés par pandas soient ceux
+    d'une lecture d'un seul bloc (une colonne entièrement vide dans un morceau serait `object`).
+    """
+    plan = compile_plan(row_level, metadata_fields, data_fields, nested_fields)
+    with open(xml_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        root = _feed(buf, runs, encoding, namespaces)
+    rows = root.findall(row_level)
+    if backend == 'arrow':
+        builder = ColumnBuilder(plan.columns)
+        extract = plan.column_extractor(builder)
+        for row in rows:
+            extract(row)
+        return builder.to_pandas()
+    extract = plan.row_extractor()
+    return [extract(row) for row in rows]
+
+
+def split_xml_to_dataframe(xml_path: Path,
+                           row_level: str,
+                           metadata_fields: dict[str, str] = {},
+                           data_fields: dict[str, str] = {},
+                           nested_fields: list[dict] = {},
+                           backend: str = 'rows',
+                           workers: int | None = None,
+                           executor: Executor | None = None) -> pd.DataFrame:
+    """
+    Comme `simple_reader.xml_to_dataframe`, mais en répartissant les lignes d'un même fichier
+    sur un pool de processus.
+
+    Parameters:
+        workers (int | None): Processus utilisés ; None ou 0 pour tous les cœurs.
+        executor (Executor, optional): Pool déjà démarré (de `workers` processus), par exemple
+            partagé entre plusieurs fichiers ; il n'est pas arrêté ici.
+
+    Returns:
+        pd.DataFrame: Les mêmes lignes, colonnes et valeurs qu'une lecture d'un seul bloc.
+    """
+    from electriflux.simple_reader import xml_to_dataframe
+
+    whole = functools.partial(xml_to_dataframe, xml_path, row_level, metadata_fields, data_fields,
+                              nested_fields, backend=backend)
+    plan = compile_plan(row_level, metadata_fields, data_fields, nested_fields)
+    tag = split_tag(plan)
+    workers = resolve_workers(workers)
+    if tag is None or workers == 1:
+        return whole()
+
+    stages = file_stages()
+    if stages is not None:
+        started = time.perf_counter()
+    with open(xml_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        encoding = file_encoding(buf[:1024])
+        spans = element_spans(buf, tag) if encoding is not None else []
+        head = buf[:spans[0][0]] if spans else b''
+        namespaces = namespace_declarations(head)
+        # Entités déclarées dans un DOCTYPE : les morceaux ne seraient pas lus à l'identique
+        if len(spans) < 2 or namespaces is None or b'<!DOCTYPE' in head:
+            _logger.info(f"{xml_path} : découpage impossible, lecture d'un seul bloc")
+            return whole()
+        meta = plan.extract_metadata(_skeleton(buf, spans))
+        chunks = [_merge_runs(buf, chunk) for chunk in balanced_chunks(spans, workers * CHUNKS_PER_WORKER)]
+    if stages is not None:
+        started = lap(stages, 'parse', started)
+
+    parse = functools.partial(parse_chunk, xml_path, encoding=encoding, namespaces=namespaces, row_level=row_level,
+                              metadata_fields=metadata_fields, data_fields=data_fields,
+                              nested_fields=nested_fields, backend=backend)
+    if executor is None:
+        with process_pool(min(workers, len(chunks))) as pool:
+            frames = list(pool.map(parse, chunks))
+    else:
+        frames = list(executor.map(parse, chunks))
+    if stages is not None:
+        started = lap(stages, 'extract', started)
+    _logger.debug(f"{xml_path} : {len(spans)} éléments {tag} lus en {len(chunks)} morceaux")
+
+    # Les colonnes imbriquées d'un morceau s'ajoutent dans leur ordre d'apparition, comme en lecture d'un bloc
+    if backend == 'arrow':
+        df = pd.concat(frames, ignore_index=True)
+    else:
+        df = pd.DataFrame([row for rows in frames for row in rows])
+    for k, v in meta.items():
+        # Même type que `ColumnBuilder.to_pandas` avec le backend 'arrow'
+        df[k] = pd.Series(v, index=df.index, dtype=pd.ArrowDtype(pa.string())) if backend == 'arrow' else v
+    if stages is not None:
+        lap(stages, 'frame', started)
+    return df
+
+
+def map_split_file_pairs(parse: Callable[[Path], pd.DataFrame],
+                         files: list[Path],
+                         split_bytes: int,
+                         row_level: str,
+                         metadata_fields: dict[str, str] = {},
+                         data_fields: dict[str, str] = {},
+                         nested_fields: list[dict] = {},
+                         backend: str = 'rows',
+                         workers: int | None = 1,
+                         errors: list[FileError] | None = None,
+                         metrics: Metrics | None = None) -> list[tuple[Path, pd.DataFrame]]:
+    """
+    Comme `map_file_pairs(parse, files, ...)`, mais les fichiers d'au moins `split_bytes` octets
+    sont lus un par un, chacun découpé sur un pool de `workers` processus.
+
+    Les autres fichiers sont répartis entre les processus comme d'habitude. L'ordre des
+    résultats est celui de `files`.
+    """
+    if resolve_workers(workers) == 1:
+        return map_file_pairs(parse, files, workers, errors, metrics)
+    sizes = {}
+    for path in files:
+        try:
+            sizes[path] = os.path.getsize(path)
+        except OSError:
+            sizes[path] = 0
+    large = [path for path in files if sizes[path] >= split_bytes]
+    small = [path for path in files if sizes[path] < split_bytes]
+    results = dict(map_file_pairs(parse, small, workers, errors, metrics))
+    if large:
+        workers = resolve_workers(workers)
+        with process_pool(workers) as executor:
+            split = functools.partial(split_xml_to_dataframe, row_level=row_level, metadata_fields=metadata_fields,
+                                      data_fields=data_fields, nested_fields=nested_fields, backend=backend,
+                                      workers=workers, executor=executor)
+            # Un fichier à la fois dans ce processus ; ses morceaux occupent tout le pool
+            results.update(map_file_pairs(split, large, 1, errors, metrics))
+    return [(path, results[path]) for path in files if path in results]
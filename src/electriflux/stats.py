@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Statistiques par fichier et élagage des fichiers selon un prédicat polars.
+
+Pour chaque fichier XML d'un flux, on conserve dans un fichier annexe (sidecar)
+les colonnes produites, les PRM présents et les dates min/max. Un filtre sur
+`pdl` ou sur les colonnes de dates peut alors écarter les fichiers qui ne
+peuvent pas contenir de ligne correspondante, sans les ouvrir.
+
+Seuls les prédicats simples sont analysés (égalité, `is_in`, comparaisons,
+`is_between`, combinés par `&`) ; tout le reste est ignoré, ce qui est toujours
+sûr puisque le prédicat complet est appliqué ensuite aux lignes lues.
+"""
+
+import os
+import json
+import datetime
+import logging
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+from zoneinfo import ZoneInfo
+
+import polars as pl
+
+from electriflux.schema import TIME_ZONE
+
+_logger = logging.getLogger(__name__)
+
+PRM_COLUMN = 'pdl'
+DATE_COLUMNS = ('Date_Facture', 'Date_Releve', 'Date_Debut', 'Date_Fin', 'Date_Evenement')
+
+STATS_SCHEMA = {
+    'file': pl.Utf8,
+    'size': pl.Int64,
+    'mtime_ns': pl.Int64,
+    'rows': pl.Int64,
+    'columns': pl.List(pl.Utf8),
+    'pdl': pl.List(pl.Utf8),
+    **{f'{col}_{bound}': pl.Utf8 for col in DATE_COLUMNS for bound in ('min', 'max')},
+}
+
+
+def file_stats(path: Path, df: pl.DataFrame) -> dict[str, Any]:
+    """Statistiques d'un fichier à partir de son DataFrame extrait (colonnes Utf8)."""
+    stat = os.stat(path)
+    stats: dict[str, Any] = {
+        'file': str(path),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'rows': df.height,
+        'columns': df.columns,
+        'pdl': df[PRM_COLUMN].drop_nulls().unique().sort().to_list() if PRM_COLUMN in df.columns else [],
+    }
+    for col in DATE_COLUMNS:
+        if col not in df.columns:
+            # Colonne absente : elle vaudra "" une fois le fichier aligné sur le schéma commun
+            stats[f'{col}_min'] = stats[f'{col}_max'] = '' if df.height else None
+            continue
+        values = df[col].cast(pl.Utf8).drop_nulls()
+        stats[f'{col}_min'] = values.min() if len(values) else None
+        stats[f'{col}_max'] = values.max() if len(values) else None
+    return stats
+
+
+def load_stats(stats_path: Path) -> pl.DataFrame:
+    if not stats_path.exists():
+        return pl.DataFrame(schema=STATS_SCHEMA)
+    return pl.read_parquet(stats_path)
+
+
+def save_stats(stats_path: Path, stats: pl.DataFrame) -> None:
+    stats_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = stats_path.with_suffix('.tmp')
+    stats.write_parquet(tmp)
+    tmp.replace(stats_path)
+
+
+def stale_files(stats: pl.DataFrame, xml_files: list[Path]) -> list[Path]:
+    """Fichiers absents des statistiques, ou modifiés depuis leur calcul."""
+    known = {(f, s, m) for f, s, m in stats.select('file', 'size', 'mtime_ns').iter_rows()}
+    stale = []
+    for path in xml_files:
+        stat = os.stat(path)
+        if (str(path), stat.st_size, stat.st_mtime_ns) not in known:
+            stale.append(path)
+    return stale
+
+
+def merge_stats(stats: pl.DataFrame, new_stats: list[dict[str, Any]], xml_files: list[Path]) -> pl.DataFrame:
+    """Remplace les entrées recalculées et oublie les fichiers disparus."""
+    present = [str(f) for f in xml_files]
+    updated = {s['file'] for s in new_stats}
+    kept = stats.filter(pl.col('file').is_in(present) & ~pl.col('file').is_in(list(updated)))
+    if not new_stats:
+        return kept
+    return pl.concat([kept, pl.DataFrame(new_stats, schema=STATS_SCHEMA)], how='vertical')
+
+
+@dataclass
+class Constraints:
+    """Contraintes extraites d'un prédicat : ensemble de PRM et bornes de dates (incluses)."""
+    pdl: set[str] | None = None
+    ranges: dict[str, list[str | None]] = field(default_factory=dict)
+
+    def restrict_pdl(self, values: set[str]) -> None:
+        self.pdl = values if self.pdl is None else self.pdl & values
+
+    def restrict_range(self, col: str, lo: str | None, hi: str | None) -> None:
+        current = self.ranges.setdefault(col, [None, None])
+        if lo is not None and (current[0] is None or lo > current[0]):
+            current[0] = lo
+        if hi is not None and (current[1] is None or hi < current[1]):
+            current[1] = hi
+
+
+def _as_text(value: Any) -> str | None:
+    """
+    Littéral -> chaîne comparable aux dates ISO des fichiers (partie date seulement).
+
+    Les dates des fichiers sont des dates locales : un instant avec fuseau est d'abord
+    ramené à l'heure de Paris (23:30 UTC le 1er juin est déjà le 2 juin à Paris).
+    """
+    if value is None:
+        return None
+    if isinstance(value, datetime.datetime) and value.tzinfo is not None:
+        value = value.astimezone(ZoneInfo(TIME_ZONE))
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()[:10]
+    return str(value)[:10]
+
+
+def _literal_values(expr: pl.Expr) -> list[Any]:
+    values = pl.select(expr).to_series()
+    if isinstance(values.dtype, (pl.List, pl.Array)):
+        values = values.explode()
+    return values.to_list()
+
+
+def _split_operands(expr: pl.Expr) -> tuple[str, list[pl.Expr]] | None:
+    """Nom de l'unique colonne opérande et liste des littéraux, ou None si autre forme."""
+    operands = expr.meta.pop()
+    columns = [e for e in operands if e.meta.is_column()]
+    literals = [e for e in operands if not e.meta.root_names()]
+    if len(columns) != 1 or len(columns) + len(literals) != len(operands):
+        return None
+    return columns[0].meta.output_name(), literals
+
+
+_FLIP = {'Gt': 'Lt', 'GtEq': 'LtEq', 'Lt': 'Gt', 'LtEq': 'GtEq', 'Eq': 'Eq'}
+
+
+def _collect(expr: pl.Expr, node: dict, constraints: Constraints) -> None:
+    if 'BinaryExpr' in node:
+        binary = node['BinaryExpr']
+        op = binary['op']
+        if op in ('And', 'LogicalAnd'):
+            for child in expr.meta.pop():
+                _collect(child, json.loads(child.meta.serialize(format='json')), constraints)
+            return
+        if op not in _FLIP:
+            return
+        split = _split_operands(expr)
+        if split is None:
+            return
+        col, (literal,) = split
+        if 'Column' not in binary['left']:
+            op = _FLIP[op]
+        values = _literal_values(literal)
+        if len(values) != 1:
+            return
+        value = values[0]
+        if value is None:
+            return
+        if col == PRM_COLUMN and op == 'Eq':
+            constraints.restrict_pdl({str(value)})
+        elif col in DATE_COLUMNS:
+            text = _as_text(value)
+            if op == 'Eq':
+                constraints.restrict_range(col, text, text)
+            elif op in ('Gt', 'GtEq'):
+                constraints.restrict_range(col, text, None)
+            else:
+                constraints.restrict_range(col, None, text)
+        return
+
+    if 'Function' in node:
+        function = json.dumps(node['Function'].get('function'))
+        if 'IsIn' in function:
+            split = _split_operands(expr)
+            if split is None or len(split[1]) != 1:
+                return
+            col, (literal,) = split
+            values = _literal_values(literal)
+            if col == PRM_COLUMN:
+                constraints.restrict_pdl({str(v) for v in values})
+            elif col in DATE_COLUMNS and values and None not in values:
+                texts = [_as_text(v) for v in values]
+                constraints.restrict_range(col, min(texts), max(texts))
+        elif 'IsBetween' in function:
+            split = _split_operands(expr)
+            if split is None or len(split[1]) != 2 or split[0] not in DATE_COLUMNS:
+                return
+            col, literals = split
+            texts = [_as_text(_literal_values(lit)[0]) for lit in literals]
+            if None not in texts:
+                constraints.restrict_range(col, min(texts), max(texts))
+
+
+def predicate_constraints(predicate: pl.Expr | None) -> Constraints:
+    """
+    Analyse un prédicat polars et en déduit des contraintes sur `pdl` et les dates.
+
+    Toute partie non reconnue est ignorée (contrainte plus large, jamais plus stricte).
+    """
+    constraints = Constraints()
+    if predicate is None:
+        return constraints
+    try:
+        _collect(predicate, json.loads(predicate.meta.serialize(format='json')), constraints)
+    except Exception as e:
+        _logger.debug(f"Prédicat non analysé, pas d'élagage : {e}")
+        return Constraints()
+    return constraints
+
+
+def prune_files(stats: pl.DataFrame, constraints: Constraints) -> list[str]:
+    """Fichiers pouvant contenir au moins une ligne satisfaisant les contraintes."""
+    mask = pl.lit(True)
+    if constraints.pdl is not None:
+        mask = mask & pl.col('pdl').list.eval(pl.element().is_in(list(constraints.pdl))).list.any()
+    for col, (lo, hi) in constraints.ranges.items():
+        # Les bornes sont comparées sur la seule partie date, de façon inclusive
+        if lo is not None:
+            mask = mask & (pl.col(f'{col}_max').str.slice(0, 10) >= lo)
+        if hi is not None:
+            mask = mask & (pl.col(f'{col}_min').str.slice(0, 10) <= hi)
+    return stats.filter(mask.fill_null(False))['file'].to_list()
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Stockage incrémental des flux en fragments Parquet.
+
+Chaque lot de fichiers XML traités est écrit sous forme de nouveaux fragments,
+partitionnés par flux puis par mois (de facturation ou de relève selon le flux) :
+
+    store_dir/
+        F15/
+            _manifest.jsonl
+            month=2024-03/part-20240401T020000-1a2b3c4d.parquet
+            ...
+
+Le manifeste, en ajout seul (une ligne JSON par fragment), indique quels fichiers
+sources ont produit quel fragment. Un traitement incrémental ne coûte donc que
+le temps d'écrire les nouveaux fichiers, et relire le jeu complet est un simple
+scan colonne des fragments.
+"""
+
+import os
+import json
+import uuid
+import shutil
+import logging
+import datetime
+from pathlib import Path
+from typing import Any, Sequence
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+_logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = '_manifest.jsonl'
+UNKNOWN_PARTITION = 'unknown'
+
+
+def flux_dir(store_dir: Path, flux_type: str) -> Path:
+    return store_dir / flux_type
+
+
+def load_manifest(store_dir: Path, flux_type: str) -> list[dict[str, Any]]:
+    """
+    Entrées du manifeste d'un flux, dans l'ordre d'écriture.
+
+    Une dernière ligne tronquée (écriture interrompue) est ignorée.
+    """
+    path = flux_dir(store_dir, flux_type) / MANIFEST_NAME
+    if not path.exists():
+        return []
+    entries = []
+    with path.open('r') as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                _logger.warning(f"Ligne de manifeste illisible ignorée dans {path}")
+    return entries
+
+
+def processed_files(store_dir: Path, flux_type: str) -> set[str]:
+    """Noms des fichiers sources déjà présents dans le stockage."""
+    return {source for entry in load_manifest(store_dir, flux_type) for source in entry['sources']}
+
+
+def _append_manifest(store_dir: Path, flux_type: str, entries: list[dict[str, Any]]) -> None:
+    path = flux_dir(store_dir, flux_type) / MANIFEST_NAME
+    with path.open('a') as f:
+        for entry in entries:
+            f.write(json.dumps(entry) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def partition_month(values: pd.Series) -> pd.Series:
+    """Mois 'AAAA-MM' d'une colonne de dates au format ISO, `UNKNOWN_PARTITION` si absent."""
+    months = values.astype(object).where(values.notna(), None).str.slice(0, 7)
+    valid = months.str.fullmatch(r'\d{4}-\d{2}').fillna(False).astype(bool)
+    return months.where(valid, UNKNOWN_PARTITION)
+
+
+def to_string_table(df: pd.DataFrame) -> pa.Table:
+    """Table Arrow dont toutes les colonnes sont des chaînes, les valeurs manquantes étant nulles."""
+    schema = pa.schema([(str(col), pa.string()) for col in df.columns])
+    return pa.Table.from_pandas(df.astype(object), schema=schema, preserve_index=False)
+
+
+def write_batch(store_dir: Path,
+                flux_type: str,
+                df: pd.DataFrame,
+                sources: Sequence[str],
+                partition_field: str | None = None,
+                empty_sources: Sequence[str] = ()) -> list[Path]:
+    """
+    Écrit un lot de lignes sous forme de nouveaux fragments Parquet.
+
+    Parameters:
+        store_dir (Path): Racine du stockage.
+        flux_type (str): Type de flux (sous-dossier du stockage).
+        df (pd.DataFrame): Lignes à écrire.
+        sources (Sequence[str]): Nom du fichier source de chaque ligne de `df`.
+        partition_field (str, optional): Colonne de date servant au partitionnement mensuel.
+            Sans elle, tout le lot est écrit dans la partition `UNKNOWN_PARTITION`.
+        empty_sources (Sequence[str]): Fichiers traités sans produire de ligne,
+            inscrits au manifeste pour ne pas être relus.
+
+    Returns:
+        list[Path]: Chemins des fragments écrits.
+    """
+    root = flux_dir(store_dir, flux_type)
+    root.mkdir(parents=True, exist_ok=True)
+    if len(sources) != len(df):
+        raise ValueError(f"sources doit avoir une entrée par ligne ({len(sources)} != {len(df)})")
+
+    df = df.reset_index(drop=True)
+    sources = pd.Series(list(sources), dtype=object)
+    if partition_field is not None and partition_field in df.columns:
+        months = partition_month(df[partition_field])
+    else:
+        months = pd.Series(UNKNOWN_PARTITION, index=df.index, dtype=object)
+
+    stamp = datetime.datetime.now().strftime('%Y%m%dT%H%M%S')
+    written_at = datetime.datetime.now().isoformat()
+    written, entries = [], []
+    for month, idx in months.groupby(months, sort=True).groups.items():
+        part_dir = root / f'month={month}'
+        part_dir.mkdir(exist_ok=True)
+        fragment = part_dir / f'part-{stamp}-{uuid.uuid4().hex[:8]}.parquet'
+        tmp = fragment.with_suffix('.parquet.tmp')
+        # Écriture puis renommage : un fragment n'est visible qu'une fois complet
+        pq.write_table(to_string_table(df.loc[idx]), tmp)
+        tmp.replace(fragment)
+        written.append(fragment)
+        entries.append({
+            'fragment': str(fragment.relative_to(root)),
+            'partition': month,
+            'rows': len(idx),
+            'sources': list(dict.fromkeys(sources.loc[idx])),
+            'written_at': written_at,
+        })
+    if empty_sources:
+        entries.append({'fragment': None, 'partition': None, 'rows': 0,
+                        'sources': list(empty_sources), 'written_at': written_at})
+
+    # Le manifeste n'est complété qu'une fois les fragments en place
+    if entries:
+        _append_manifest(store_dir, flux_type, entries)
+    _logger.info(f"{len(written)} fragments écrits pour {flux_type} ({len(df)} lignes)")
+    return written
+
+
+def write_parsed(store_dir: Path,
+                 flux_type: str,
+                 parsed: Sequence[tuple[Path, pd.DataFrame]],
+                 partition_field: str | None = None) -> int:
+    """
+    Écrit des couples (fichier XML, DataFrame) lus par `parse_xml_files` : les lignes de tous
+    les fichiers en un seul lot, les fichiers sans ligne au manifeste seulement.
+
+    Returns:
+        int: Nombre de lignes écrites.
+    """
+    if not parsed:
+        return 0
+    frames = [df for _, df in parsed if not df.empty]
+    df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    sources = [f.name for f, part in parsed for _ in range(len(part))]
+    write_batch(store_dir, flux_type, df, sources, partition_field,
+                empty_sources=[f.name for f, part in parsed if part.empty])
+    return len(df)
+
+
+def fragment_paths(store_dir: Path, flux_type: str) -> list[Path]:
+    """Fragments référencés par le manifeste, dans l'ordre d'écriture."""
+    root = flux_dir(store_dir, flux_type)
+    return [root / entry['fragment'] for entry in load_manifest(store_dir, flux_type) if entry['fragment']]
+
+
+def read_store_table(store_dir: Path, flux_type: str, columns: list[str] | None = None) -> pa.Table:
+    """
+    Relit l'ensemble des fragments d'un flux en une table Arrow.
+
+    Les fragments n'ont pas forcément les mêmes colonnes (champs imbriqués) :
+    le schéma est unifié à partir de leurs seuls pieds de page, les colonnes absentes
+    d'un fragment étant nulles.
+    """
+    paths = fragment_paths(store_dir, flux_type)
+    if not paths:
+        return pa.table({})
+    schema = pa.unify_schemas([pq.read_schema(p) for p in paths])
+    tables = [pq.read_table(p, schema=schema, columns=columns) for p in paths]
+    return pa.concat_tables(tables)
+
+
+def read_store(store_dir: Path, flux_type: str, columns: list[str] | None = None) -> pd.DataFrame:
+    """Relit l'ensemble des fragments d'un flux en DataFrame pandas (colonnes de chaînes)."""
+    return read_store_table(store_dir, flux_type, columns).to_pandas()
+
+
+def reset_store(store_dir: Path, flux_type: str) -> None:
+    """Supprime tous les fragments et le manifeste d'un flux."""
+    root = flux_dir(store_dir, flux_type)
+    if root.exists():
+        shutil.rmtree(root)
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Lecture en flux (streaming) des fichiers XML Enedis.
+
+Plutôt que de charger tout l'arbre avec `ET.parse`, on s'appuie sur
+`lxml.etree.iterparse` : chaque élément `row_level` est émis dès qu'il est
+complet, puis libéré (ainsi que ses frères précédents) une fois extrait.
+La mémoire reste ainsi bornée à la taille d'un bloc de lignes, quelle que
+soit la taille du fichier.
+"""
+
+import logging
+from pathlib import Path
+from typing import Iterator
+
+from lxml import etree as ET
+
+_logger = logging.getLogger(__name__)
+
+
+def row_tag(row_level: str) -> str:
+    """
+    Extrait le nom de balise d'un `row_level` de la forme './/Tag' ou 'Tag'.
+
+    Raises:
+        ValueError: si le `row_level` n'est pas supporté en mode streaming.
+    """
+    tag = row_level.removeprefix('.//')
+    if not tag or any(c in tag for c in '/[]@*.'):
+        raise ValueError(f"row_level non supporté en mode streaming : {row_level!r}")
+    return tag
+
+
+def parent_depth(data_fields: dict[str, str]) -> int:
+    """
+    Nombre maximal de niveaux '..' remontés par les chemins de `data_fields`.
+
+    Les lignes ne peuvent être extraites qu'une fois cet ancêtre entièrement lu,
+    puisque les champs remontants (ex. '../Num_Sous_Lot') peuvent le suivre dans le document.
+    """
+    depth = 0
+    for xpath in data_fields.values():
+        parts = xpath.split('/')
+        n = 0
+        while n < len(parts) and parts[n] == '..':
+            n += 1
+        depth = max(depth, n)
+    return depth
+
+
+def _ancestor(elem: ET._Element, depth: int) -> ET._Element:
+    for _ in range(depth):
+        parent = elem.getparent()
+        if parent is None:
+            break
+        elem = parent
+    return elem
+
+
+def _release(elem: ET._Element) -> None:
+    """Vide un élément traité et supprime les frères précédents de toute sa lignée."""
+    elem.clear(keep_tail=True)
+    node = elem
+    while node is not None:
+        parent = node.getparent()
+        if parent is None:
+            break
+        while node.getprevious() is not None:
+            del parent[0]
+        node = parent
+
+
+def _find_metadata(root: ET._Element, metadata_fields: dict[str, str], meta: dict[str, str]) -> None:
+    for field_name, field_xpath in metadata_fields.items():
+        if field_name not in meta:
+            field_elem = root.find(field_xpath)
+            if field_elem is not None:
+                meta[field_name] = field_elem.text
+
+
+def iter_rows(xml_path: Path,
+              row_level: str,
+              metadata_fields: dict[str, str] = {},
+              depth: int = 0,
+              meta: dict[str, str] | None = None) -> Iterator[ET._Element]:
+    """
+    Itère sur les éléments `row_level` d'un fichier XML sans le charger entièrement.
+
+    Les lignes sont regroupées par ancêtre de niveau `depth` : elles ne sont émises
+    qu'une fois cet ancêtre refermé, afin que les chemins relatifs remontants
+    (voir `parent_depth`) restent résolvables. Après émission, l'ancêtre et tout ce
+    qui le précède sont libérés.
+
+    Parameters:
+        xml_path (Path): Chemin du fichier XML (ou objet fichier).
+        row_level (str): Niveau des lignes, de la forme './/Tag'.
+        metadata_fields (dict[str, str]): Champs à extraire depuis la racine.
+        depth (int): Nombre de niveaux parents nécessaires à l'extraction d'une ligne.
+        meta (dict[str, str], optional): Dictionnaire rempli avec les métadonnées trouvées.
+            Il est complet une fois l'itération terminée.
+
+    Yields:
+        ET._Element: Chaque élément ligne, valide jusqu'à la reprise de l'itération.
+    """
+    tag = row_tag(row_level)
+    direct = not row_level.startswith('.//')
+    if meta is None:
+        meta = {}
+
+    root = None
+    group = None
+    pending: list[ET._Element] = []
+    for _, elem in ET.iterparse(str(xml_path) if isinstance(xml_path, Path) else xml_path,
+                                events=('end',), tag=tag):
+        if root is None:
+            root = elem.getroottree().getroot()
+            # Les en-têtes (En_Tete_Flux, Rappel_En_Tete) précèdent les lignes :
+            # on les capture avant de libérer quoi que ce soit.
+            _find_metadata(root, metadata_fields, meta)
+        if elem is root or (direct and elem.getparent() is not root):
+            continue
+
+        anc = _ancestor(elem, depth)
+        if group is not None and anc is not group:
+            yield from pending
+            _release(group)
+            pending = []
+        group = anc
+        pending.append(elem)
+
+    if root is None:
+        return
+    yield from pending
+    # Métadonnées éventuellement placées après les lignes
+    _find_metadata(root, metadata_fields, meta)
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Synchronisation différentielle des dossiers sFTP.
+
+`download_decrypt_extract_new_files` comparait les seuls noms de `sftp.listdir` au
+registre des archives traitées : un fichier republié sous le même nom n'était jamais
+repris, et un téléchargement interrompu repartait de zéro. `RemoteSync` :
+ - liste chaque dossier avec `listdir_attr`, qui donne en un seul aller-retour la taille
+   et la date de modification de chaque fichier, et garde le résultat dans ledger.db.
+   Le dossier est relisté à chaque passage : un fichier réécrit sur place ne change
+   pas la date de son dossier ;
+ - mémorise la taille et la date de chaque fichier au moment où il a été traité : seuls les
+   fichiers nouveaux ou modifiés depuis sont transférés. Les fichiers inscrits au registre
+   par les versions précédentes (sans taille ni date) sont considérés comme à jour ;
+ - télécharge dans un fichier `.part` persistant (LOCAL/.partial) : après une interruption,
+   le transfert reprend au dernier octet reçu. Le `.part` porte la taille et la date du
+   fichier distant : s'il a été republié entre-temps, le transfert repart de zéro ;
+ - compte les octets économisés (`SyncStats`) : fichiers à jour non retransférés et octets
+   repris des `.part`.
+"""
+
+import stat
+import sqlite3
+import logging
+import datetime
+import posixpath
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+
+import paramiko
+
+from electriflux.ledger import Ledger
+from electriflux.metrics import Metrics, timed
+
+_logger = logging.getLogger(__name__)
+
+PARTIAL_DIR = '.partial'
+
+# Taille des lectures sur le canal sFTP (les requêtes sont pipelinées par `prefetch`)
+READ_SIZE = 1024 * 1024
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS remote_listing (
+    directory TEXT NOT NULL,
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    PRIMARY KEY (directory, name)
+);
+CREATE TABLE IF NOT EXISTS remote_synced (
+    namespace TEXT NOT NULL,
+    directory TEXT NOT NULL,
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    synced_at TEXT NOT NULL,
+    PRIMARY KEY (namespace, directory, name)
+);
+"""
+
+
+@dataclass(frozen=True)
+class RemoteEntry:
+    """Fichier distant, tel que listé par `listdir_attr`."""
+    directory: str
+    name: str
+    size: int
+    mtime: int
+
+    @property
+    def path(self) -> str:
+        return posixpath.join(self.directory, self.name)
+
+
+@dataclass
+class SyncStats:
+    """
+    Bilan d'une synchronisation.
+
+    Attributes:
+        listed (int): Dossiers listés sur le serveur.
+        unchanged (int), unchanged_bytes (int): Fichiers déjà traités et inchangés, non retransférés.
+        changed (int): Fichiers déjà traités mais republiés (taille ou date différente).
+        downloaded_bytes (int): Octets effectivement transférés.
+        resumed_bytes (int): Octets repris de transferts interrompus.
+    """
+    listed: int = 0
+    unchanged: int = 0
+    unchanged_bytes: int = 0
+    changed: int = 0
+    downloaded_bytes: int = 0
+    resumed_bytes: int = 0
+
+    @property
+    def saved_bytes(self) -> int:
+        """Octets non transférés : fichiers à jour et reprises."""
+        return self.unchanged_bytes + self.resumed_bytes
+
+
+class RemoteSync:
+    """
+    État de la synchronisation d'un registre (`namespace`) avec le sFTP.
+
+    Parameters:
+        path (Path): Base SQLite, la même que celle du registre (ledger.db).
+        namespace (str): Registre des archives traitées (ex. 'processed_zips').
+        partial_dir (Path): Dossier des téléchargements en cours (`.part`).
+        processed (Ledger, optional): Registre existant : ses fichiers sans taille ni date
+            connues sont considérés comme à jour.
+    """
+
+    def __init__(self, path: Path, namespace: str, partial_dir: Path, processed: Ledger | None = None):
+        self.namespace = namespace
+        self.partial_dir = Path(partial_dir)
+        self.processed = processed
+        self.stats = SyncStats()
+        self._lock = threading.Lock()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        # Les transferts se font dans d'autres threads ; les accès à la base restent sous verrou
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode = WAL')
+        self._conn.execute('PRAGMA synchronous = NORMAL')
+        self._conn.executescript(_SCHEMA)
+
+    # Listes
+
+    def list_dir(self, sftp: paramiko.SFTPClient, directory: str) -> list[RemoteEntry]:
+        """
+        Fichiers ordinaires de `directory`, avec leur taille et leur date.
+
+        La liste est gardée pour `entry` ; elle n'est jamais réutilisée d'un passage à l'autre,
+        la date d'un dossier ne changeant pas quand un fichier y est réécrit sur place.
+        """
+        attrs = sftp.listdir_attr(directory)
+        entries = [RemoteEntry(directory, a.filename, a.st_size or 0, a.st_mtime or 0) for a in attrs
+                   if a.st_mode is None or stat.S_ISREG(a.st_mode)]
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM remote_listing WHERE directory = ?', (directory,))
+            self._conn.executemany('INSERT INTO remote_listing (directory, name, size, mtime) VALUES (?, ?, ?, ?)',
+                                   [(e.directory, e.name, e.size, e.mtime) for e in entries])
+            self.stats.listed += 1
+        return entries
+
+    def entry(self, sftp: paramiko.SFTPClient, remote_file: str) -> RemoteEntry:
+        """Taille et date de `remote_file`, lues dans la liste en cache ou à défaut sur le serveur."""
+        directory, name = posixpath.split(remote_file)
+        with self._lock:
+            row = self._conn.execute('SELECT size, mtime FROM remote_listing WHERE directory = ? AND name = ?',
+                                     (directory, name)).fetchone()
+        if row is None:
+            attr = sftp.stat(remote_file)
+            row = (attr.st_size or 0, attr.st_mtime or 0)
+        return RemoteEntry(directory, name, *row)
+
+    def changed(self, sftp: paramiko.SFTPClient, directory: str, metrics: Metrics | None = None) -> list[RemoteEntry]:
+        """
+        Fichiers de `directory` jamais traités, ou modifiés depuis leur traitement.
+
+        Les octets des fichiers à jour sont comptés dans `metrics` sous 'unchanged'.
+        """
+        entries = self.list_dir(sftp, directory)
+        with self._lock:
+            synced = {name: (size, mtime) for name, size, mtime in self._conn.execute(
+                'SELECT name, size, mtime FROM remote_synced WHERE namespace = ? AND directory = ?',
+                (self.namespace, directory))}
+        pending, adopted = [], []
+        unchanged = 0
+        for entry in entries:
+            known = synced.get(entry.name)
+            if known == (entry.size, entry.mtime):
+                unchanged += entry.size
+                self.stats.unchanged += 1
+            elif known is None and self.processed is not None and entry.name in self.processed:
+                # Traité par une version antérieure : la taille et la date sont reprises telles quelles
+                adopted.append(entry)
+                unchanged += entry.size
+                self.stats.unchanged += 1
+            else:
+                if known is not None:
+                    self.stats.changed += 1
+                    _logger.info(f"{entry.path} republié ({known[0]} -> {entry.size} octets)")
+                pending.append(entry)
+        if adopted:
+            self.mark_synced(*adopted)
+        self.stats.unchanged_bytes += unchanged
+        if metrics is not None and unchanged:
+            metrics.on_transfer('unchanged', directory, unchanged)
+        return pending
+
+    def mark_synced(self, *entries: RemoteEntry) -> None:
+        """Enregistre la taille et la date des fichiers traités."""
+        now = datetime.datetime.now().isoformat()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO remote_synced (namespace, directory, name, size, mtime, synced_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                [(self.namespace, e.directory, e.name, e.size, e.mtime, now) for e in entries])
+
+    # Transferts
+
+    def _part_path(self, entry: RemoteEntry, subdir: str) -> Path:
+        return self.partial_dir / subdir / f'{entry.name}.{entry.size}-{entry.mtime}.part'
+
+    def fetch(self, sftp: paramiko.SFTPClient, entry: RemoteEntry, subdir: str,
+              metrics: Metrics | None = None) -> Path:
+        """
+        Télécharge `entry` dans LOCAL/.partial/<subdir>, en reprenant un `.part` existant.
+
+        Returns:
+            Path: Le fichier complet (à supprimer avec `discard` une fois traité).
+
+        Raises:
+            Les erreurs sFTP ou d'écriture ; le `.part` est conservé pour la reprise.
+        """
+        part = self._part_path(entry, subdir)
+        part.parent.mkdir(parents=True, exist_ok=True)
+        # Versions précédentes du même fichier, republié depuis
+        for stale in part.parent.glob(f'{entry.name}.*.part'):
+            if stale != part:
+                stale.unlink(missing_ok=True)
+        offset = part.stat().st_size if part.exists() else 0
+        if offset > entry.size:
+            part.unlink()
+            offset = 0
+
+        with timed(metrics, 'download'):
+            if offset < entry.size:
+                with sftp.open(entry.path, 'rb') as remote, open(part, 'ab') as out:
+                    remote.seek(offset)
+                    remote.prefetch(entry.size)
+                    while data := remote.read(READ_SIZE):
+                        out.write(data)
+            received = part.stat().st_size
+            if received != entry.size:
+                raise IOError(f"{entry.path} : {received} octets reçus sur {entry.size}")
+
+        if offset:
+            _logger.info(f"{entry.path} : reprise à {offset} octets sur {entry.size}")
+        with self._lock:
+            self.stats.downloaded_bytes += entry.size - offset
+            self.stats.resumed_bytes += offset
+        if metrics is not None:
+            metrics.on_transfer('downloaded', entry.path, entry.size - offset)
+            if offset:
+                metrics.on_transfer('resumed', entry.path, offset)
+        complete = part.parent / entry.name
+        part.replace(complete)
+        return complete
+
+    @staticmethod
+    def discard(path: Path) -> None:
+        """Supprime un fichier téléchargé et sa version déchiffrée (voir `decrypt_file`)."""
+        path.unlink(missing_ok=True)
+        path.with_name('decrypted_' + path.stem + '.zip').unlink(missing_ok=True)
+
+    def reset(self) -> None:
+        """Oublie les fichiers traités de ce registre."""
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM remote_synced WHERE namespace = ?', (self.namespace,))
+
+    def report(self) -> str:
+        s = self.stats
+        return (f"{s.listed} dossiers listés ; {s.unchanged} fichiers à jour, "
+                f"{s.changed} republiés ; {s.downloaded_bytes} octets transférés, "
+                f"{s.saved_bytes} économisés ({s.resumed_bytes} repris)")
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def __enter__(self) -> 'RemoteSync':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -1,51 +1,196 @@
-import os
+import queue
+import shutil
 import zipfile
 import logging
 import paramiko
 import tempfile
+import threading
 import functools
 import pandas as pd
 
 from pathlib import Path
 from Crypto.Cipher import AES
+from concurrent.futures import Future, ThreadPoolExecutor
 
-from typing import Callable
+from typing import Callable, Iterator
+
+from electriflux.ledger import LEDGER_NAME, Ledger
+from electriflux.metrics import Metrics, timed
+from electriflux.parallel import FileError
+from electriflux.simple_reader import zip_to_dataframes
+from electriflux.sync import PARTIAL_DIR, RemoteEntry, RemoteSync
 
 import logging
 logger = logging.getLogger(__name__)
 
-def decrypt_file(file_path: Path, key: bytes, iv: bytes, prefix: str="decrypted_") -> Path:
+# Streaming buffer size for AES: a multiple of the block size, large enough to amortise per-call overhead
+CHUNK_SIZE = 4 * 1024 * 1024
+
+def _read_full(f, view: memoryview) -> int:
+    """Fills view from f, stopping only at end of file. Returns the number of bytes read."""
+    filled = 0
+    while filled < len(view):
+        n = f.readinto(view[filled:])
+        if not n:
+            break
+        filled += n
+    return filled
+
+def decrypt_file(file_path: Path, key: bytes, iv: bytes, prefix: str="decrypted_", chunk_size: int = CHUNK_SIZE) -> Path:
     if file_path.stem.startswith(prefix):
         return file_path
-    
+    if chunk_size <= 0 or chunk_size % AES.block_size:
+        raise ValueError(f"chunk_size must be a positive multiple of {AES.block_size}")
+
     # Initialize the AES cipher with CBC mode
     cipher = AES.new(key, AES.MODE_CBC, iv)
     output_file = file_path.with_name(prefix + file_path.stem + ".zip")
-    # Decrypt the input file and write the decrypted content to the output file
+    # Decrypt chunk by chunk into reused buffers: memory stays constant whatever the file size.
+    # CBC chains across calls, so the output is identical to a single decrypt of the whole file.
+    buffer = bytearray(chunk_size)
+    decrypted = bytearray(chunk_size)
     with file_path.open("rb") as f_in, output_file.open("wb") as f_out:
-        decrypted_data = cipher.decrypt(f_in.read())
-        f_out.write(decrypted_data)
+        while n := _read_full(f_in, memoryview(buffer)):
+            out = memoryview(decrypted)[:n]
+            # A truncated last block raises ValueError, as for a whole-file decrypt
+            cipher.decrypt(memoryview(buffer)[:n], output=out)
+            f_out.write(out)
     return output_file
 
-def encrypt_file(file_path: Path, key: bytes, iv: bytes, prefix: str="encrypted_") -> Path:
+def encrypt_file(file_path: Path, key: bytes, iv: bytes, prefix: str="encrypted_", chunk_size: int = CHUNK_SIZE) -> Path:
     if prefix in file_path.stem:
         return file_path
+    if chunk_size <= 0 or chunk_size % AES.block_size:
+        raise ValueError(f"chunk_size must be a positive multiple of {AES.block_size}")
     # Initialize the AES cipher with CBC mode
     cipher = AES.new(key, AES.MODE_CBC, iv)
     output_file = file_path.with_name(prefix + file_path.stem + ".enc")
     # Encrypt the input file and write the encrypted content to the output file
+    buffer = bytearray(chunk_size)
+    encrypted = bytearray(chunk_size)
     with file_path.open("rb") as f_in, output_file.open("wb") as f_out:
-        while True:
-            data = f_in.read(16)
-            if len(data) == 0:
-                break
-            elif len(data) % 16!= 0:
-                data += b' ' * (16 - len(data) % 16)
-            encrypted_data = cipher.encrypt(data)
-            f_out.write(encrypted_data)
+        while n := _read_full(f_in, memoryview(buffer)):
+            if n % AES.block_size:
+                # Last block padded with spaces (format expected by the flux consumers)
+                padded = n + AES.block_size - n % AES.block_size
+                buffer[n:padded] = b' ' * (padded - n)
+                n = padded
+            out = memoryview(encrypted)[:n]
+            cipher.encrypt(memoryview(buffer)[:n], output=out)
+            f_out.write(out)
     return output_file
 
-def download_decrypt_extract(sftp: paramiko.SFTPClient, remote_file: str, output_path: Path, key: bytes, iv: bytes) -> bool:
+class DecryptingWriter:
+    """
+    Write-only file object that decrypts AES-CBC data on the fly into another file object.
+
+    Bytes can arrive in any sizes (e.g. from paramiko's `getfo`); they are decrypted as soon as
+    whole blocks are available, so the encrypted file never needs to be stored. `close` raises
+    ValueError if the data received is not a whole number of blocks.
+    """
+
+    def __init__(self, f_out, key: bytes, iv: bytes):
+        self.f_out = f_out
+        self.cipher = AES.new(key, AES.MODE_CBC, iv)
+        self.pending = bytearray()
+        self.bytes_written = 0
+
+    def write(self, data: bytes) -> int:
+        self.pending += data
+        aligned = len(self.pending) - len(self.pending) % AES.block_size
+        if aligned:
+            self.f_out.write(self.cipher.decrypt(memoryview(self.pending)[:aligned]))
+            del self.pending[:aligned]
+            self.bytes_written += aligned
+        return len(data)
+
+    def close(self) -> None:
+        if self.pending:
+            raise ValueError(f"Data must be padded to {AES.block_size} byte boundary in CBC mode")
+
+    def __enter__(self) -> 'DecryptingWriter':
+        return self
+
+    def __exit__(self, exc_type, *exc) -> None:
+        if exc_type is None:
+            self.close()
+
+def decrypt_extract(encrypted_path: Path, output_path: Path, key: bytes, iv: bytes, name: str | None = None,
+                    metrics: Metrics | None = None) -> bool:
+    """
+    Decrypts a downloaded file using decrypt_file and extracts its contents.
+
+    Args:
+    encrypted_path (Path): Local path of the encrypted file.
+    output_path (Path): Local path where extracted contents should be saved.
+    key (bytes): 16-byte key for AES decryption.
+    iv (bytes): 16-byte initialization vector for AES decryption.
+    name (str, optional): Name used in log messages (defaults to encrypted_path).
+    metrics (Metrics, optional): Receives 'decrypt' and 'unzip' timings, decrypted bytes and errors.
+
+    Returns:
+    bool: True if successful, False otherwise.
+    """
+    name = name or str(encrypted_path)
+    try:
+        # Decrypt file using decrypt_file function
+        with timed(metrics, 'decrypt'):
+            decrypted_path = decrypt_file(encrypted_path, key, iv)
+        if metrics is not None:
+            metrics.on_transfer('decrypted', name, decrypted_path.stat().st_size)
+
+        # Extract contents
+        with timed(metrics, 'unzip'), zipfile.ZipFile(decrypted_path, 'r') as zip_ref:
+            zip_ref.extractall(output_path)
+
+        logger.debug(f"Successfully processed {name}")
+        return True
+
+    except ValueError as e:
+        logger.error(f"Decryption error for {name}: {str(e)}")
+        _record_error(metrics, name, e)
+    except zipfile.BadZipFile as e:
+        logger.error(f"ZIP extraction error for {name}: {str(e)}")
+        _record_error(metrics, name, e)
+    except Exception as e:
+        logger.error(f"Unexpected error processing {name}: {str(e)}")
+        _record_error(metrics, name, e)
+
+    return False
+
+def _record_error(metrics: Metrics | None, name: str, error: Exception) -> None:
+    if metrics is not None:
+        metrics.on_error(name, type(error).__name__, str(error))
+
+def _download(sftp: paramiko.SFTPClient, remote_file: str, local_path: Path, metrics: Metrics | None = None) -> bool:
+    try:
+        with timed(metrics, 'download'):
+            sftp.get(remote_file, str(local_path))
+        if metrics is not None:
+            metrics.on_transfer('downloaded', remote_file, local_path.stat().st_size)
+        return True
+    except paramiko.SSHException as e:
+        logger.error(f"SFTP error while downloading {remote_file}: {str(e)}")
+        _record_error(metrics, remote_file, e)
+    except Exception as e:
+        logger.error(f"Unexpected error processing {remote_file}: {str(e)}")
+        _record_error(metrics, remote_file, e)
+    return False
+
+def _fetch(sftp: paramiko.SFTPClient, sync: RemoteSync, entry: RemoteEntry, subdir: str,
+           metrics: Metrics | None = None) -> Path | None:
+    try:
+        return sync.fetch(sftp, entry, subdir, metrics)
+    except paramiko.SSHException as e:
+        logger.error(f"SFTP error while downloading {entry.path}: {str(e)}")
+        _record_error(metrics, entry.path, e)
+    except Exception as e:
+        logger.error(f"Unexpected error processing {entry.path}: {str(e)}")
+        _record_error(metrics, entry.path, e)
+    return None
+
+def download_decrypt_extract(sftp: paramiko.SFTPClient, remote_file: str, output_path: Path, key: bytes, iv: bytes,
+                             metrics: Metrics | None = None) -> bool:
     """
     Downloads a file from SFTP, decrypts it using decrypt_file, extracts its contents, and cleans up temporary files.
 
@@ -55,36 +200,154 @@ def download_decrypt_extract(sftp: paramiko.SFTPClient, remote_file: str, output
     output_path (Path): Local path where extracted contents should be saved.
     key (bytes): 16-byte key for AES decryption.
     iv (bytes): 16-byte initialization vector for AES decryption.
+    metrics (Metrics, optional): Receives stage timings, transferred bytes and errors (see electriflux.metrics).
 
     Returns:
     bool: True if successful, False otherwise.
     """
     with tempfile.TemporaryDirectory() as temp_dir:
+        # Download file
+        local_encrypted_path = Path(temp_dir) / Path(remote_file).name
+        if not _download(sftp, remote_file, local_encrypted_path, metrics):
+            return False
+
+        return decrypt_extract(local_encrypted_path, output_path, key, iv, name=remote_file, metrics=metrics)
+
+def pipelined_download_decrypt_extract(
+    transport: paramiko.Transport,
+    jobs: list[tuple[str, str, Path]],
+    key: bytes,
+    iv: bytes,
+    channels: int = 4,
+    workers: int = 2,
+    on_start: Callable[[int], None] | None = None,
+    metrics: Metrics | None = None,
+    sync: RemoteSync | None = None
+) -> Iterator[tuple[int, bool]]:
+    """
+    Downloads files over a pool of SFTP channels while previous downloads are decrypted and extracted.
+
+    Each download thread owns its own SFTPClient, opened on the shared transport (an SFTPClient
+    must not be shared between threads). Decryption and extraction run in a separate pool of
+    `workers` threads (AES and zlib release the GIL). At most `channels + 2 * workers` files are
+    held locally at once, so a large backlog does not fill the temporary directory.
+
+    Args:
+    transport (paramiko.Transport): An authenticated SSH transport.
+    jobs (list[tuple[str, str, Path]]): (task_type, remote_file, output_path) for each file.
+    key (bytes): 16-byte key for AES decryption.
+    iv (bytes): 16-byte initialization vector for AES decryption.
+    channels (int): Number of concurrent SFTP channels.
+    workers (int): Number of decryption/extraction threads.
+    on_start (callable, optional): Called with the job index, in job order, when its download is scheduled.
+    metrics (Metrics, optional): Receives stage timings, transferred bytes and errors (see electriflux.metrics).
+    sync (RemoteSync, optional): Download through it into resumable .part files (see electriflux.sync)
+                                 instead of a temporary directory.
+
+    Yields:
+    tuple[int, bool]: (job index, success) for each job, in completion order.
+    """
+    channels = max(1, channels)
+    workers = max(1, workers)
+    clients: queue.Queue[paramiko.SFTPClient] = queue.Queue()
+    opened: list[paramiko.SFTPClient] = []
+    in_flight = threading.BoundedSemaphore(channels + 2 * workers)
+
+    def download(index: int, temp_dir: Path) -> Path | None:
+        # Never raises: the done callback must always hand back a result
         try:
-            # Download file
-            local_encrypted_path = Path(temp_dir) / Path(remote_file).name
-            sftp.get(remote_file, str(local_encrypted_path))
-
-            # Decrypt file using decrypt_file function
-            decrypted_path = decrypt_file(local_encrypted_path, key, iv)
-
-            # Extract contents
-            with zipfile.ZipFile(decrypted_path, 'r') as zip_ref:
-                zip_ref.extractall(output_path)
-
-            logger.debug(f"Successfully processed {remote_file}")
-            return True
-
-        except paramiko.SSHException as e:
-            logger.error(f"SFTP error while downloading {remote_file}: {str(e)}")
-        except ValueError as e:
-            logger.error(f"Decryption error for {remote_file}: {str(e)}")
-        except zipfile.BadZipFile as e:
-            logger.error(f"ZIP extraction error for {remote_file}: {str(e)}")
+            return fetch(index, temp_dir)
         except Exception as e:
-            logger.error(f"Unexpected error processing {remote_file}: {str(e)}")
+            logger.error(f"Unexpected error processing {jobs[index][1]}: {str(e)}")
+            _record_error(metrics, jobs[index][1], e)
+            return None
+
+    def fetch(index: int, temp_dir: Path) -> Path | None:
+        task_type, remote_file, _ = jobs[index]
+        if sync is not None:
+            sftp = clients.get()
+            try:
+                return _fetch(sftp, sync, sync.entry(sftp, remote_file), task_type, metrics)
+            finally:
+                clients.put(sftp)
+        # One directory per job: decrypt_file writes its output next to the downloaded file
+        job_dir = temp_dir / str(index)
+        job_dir.mkdir()
+        local_encrypted_path = job_dir / Path(remote_file).name
+        sftp = clients.get()
+        try:
+            if _download(sftp, remote_file, local_encrypted_path, metrics):
+                return local_encrypted_path
+        finally:
+            clients.put(sftp)
+        shutil.rmtree(job_dir, ignore_errors=True)
+        return None
 
-        return False
+    def process(index: int, local_encrypted_path: Path) -> bool:
+        _, remote_file, output_path = jobs[index]
+        try:
+            return decrypt_extract(local_encrypted_path, output_path, key, iv, name=remote_file, metrics=metrics)
+        finally:
+            if sync is not None:
+                sync.discard(local_encrypted_path)
+            else:
+                shutil.rmtree(local_encrypted_path.parent, ignore_errors=True)
+
+    try:
+        for _ in range(channels):
+            sftp = paramiko.SFTPClient.from_transport(transport)
+            opened.append(sftp)
+            clients.put(sftp)
+
+        # Downloads are shut down first (exit order is reversed): their callbacks submit extractions
+        with tempfile.TemporaryDirectory() as temp_dir, \
+             ThreadPoolExecutor(max_workers=workers, thread_name_prefix='extract') as extractions, \
+             ThreadPoolExecutor(max_workers=channels, thread_name_prefix='sftp') as downloads:
+            done: queue.Queue[tuple[int, bool]] = queue.Queue()
+
+            def downloaded(index: int, future: Future) -> None:
+                # concurrent.futures discards callback exceptions: without a result here,
+                # the slot would never be freed and the generator would wait forever
+                try:
+                    local_encrypted_path = future.result()
+                    if local_encrypted_path is not None:
+                        extraction = extractions.submit(process, index, local_encrypted_path)
+                        extraction.add_done_callback(functools.partial(extracted, index))
+                        return
+                except Exception as e:
+                    logger.error(f"Unexpected error processing {jobs[index][1]}: {str(e)}")
+                in_flight.release()
+                done.put((index, False))
+
+            def extracted(index: int, future: Future) -> None:
+                in_flight.release()
+                try:
+                    done.put((index, future.result()))
+                except Exception as e:
+                    logger.error(f"Unexpected error processing {jobs[index][1]}: {str(e)}")
+                    done.put((index, False))
+
+            pending = 0
+            for index in range(len(jobs)):
+                # Backpressure: every freed slot is followed by a result, so wait on results
+                while not in_flight.acquire(blocking=False):
+                    pending -= 1
+                    yield done.get()
+                if on_start:
+                    on_start(index)
+                future = downloads.submit(download, index, Path(temp_dir))
+                future.add_done_callback(functools.partial(downloaded, index))
+                pending += 1
+                while not done.empty():
+                    pending -= 1
+                    yield done.get()
+
+            while pending:
+                pending -= 1
+                yield done.get()
+    finally:
+        for sftp in opened:
+            sftp.close()
 
 def check_required(required_keys: list[str]):
     def decorator(func: Callable):
@@ -97,18 +360,154 @@ def check_required(required_keys: list[str]):
         return wrapper
     return decorator
 
+def _remote_dir(config: dict[str, str], task_type: str) -> str:
+    return '/flux_enedis/' + str(config.get(f'FTP_{task_type}_DIR', task_type))
+
+def _sequential_new_files(
+    transport: paramiko.Transport,
+    config: dict[str, str],
+    tasks: list[str],
+    local: Path,
+    processed_zips: Ledger,
+    sync: RemoteSync,
+    key: bytes,
+    iv: bytes,
+    callback: Callable[[str, int, int, str], None] | None,
+    metrics: Metrics | None
+) -> list[tuple[str, str]]:
+    sftp = paramiko.SFTPClient.from_transport(transport)
+    newly_processed_files = []
+    try:
+        for task_type in tasks:
+            distant = _remote_dir(config, task_type)
+            local_dir = local.joinpath(task_type)
+            local_dir.mkdir(parents=True, exist_ok=True)
+
+            try:
+                files_to_process = sync.changed(sftp, distant, metrics=metrics)
+                total_files = len(files_to_process)
+
+                for index, entry in enumerate(files_to_process, start=1):
+                    if callback:
+                        callback(task_type, total_files, index, entry.name)
+
+                    output_path = local_dir / entry.name.replace('.zip', '')
+
+                    encrypted_path = _fetch(sftp, sync, entry, task_type, metrics)
+                    if encrypted_path is None:
+                        continue
+                    try:
+                        success = decrypt_extract(encrypted_path, output_path, key, iv, name=entry.path, metrics=metrics)
+                    finally:
+                        sync.discard(encrypted_path)
+
+                    if success:
+                        # Committed right away: an interrupted run does not start over
+                        processed_zips.add(entry.name, task_type)
+                        sync.mark_synced(entry)
+                        newly_processed_files.append((entry.name, task_type))
+
+            except Exception as e:
+                logger.error(f"Failed to process files from {distant}: {e}")
+    finally:
+        sftp.close()
+    return newly_processed_files
+
+def _pipelined_new_files(
+    transport: paramiko.Transport,
+    config: dict[str, str],
+    tasks: list[str],
+    local: Path,
+    processed_zips: Ledger,
+    sync: RemoteSync,
+    key: bytes,
+    iv: bytes,
+    callback: Callable[[str, int, int, str], None] | None,
+    channels: int,
+    workers: int,
+    metrics: Metrics | None
+) -> list[tuple[str, str]]:
+    # List every task first, so that all files share the same pipeline
+    jobs: list[tuple[str, str, Path]] = []
+    entries: list[RemoteEntry] = []
+    positions: list[tuple[int, int, str]] = []
+    sftp = paramiko.SFTPClient.from_transport(transport)
+    try:
+        for task_type in tasks:
+            distant = _remote_dir(config, task_type)
+            local_dir = local.joinpath(task_type)
+            local_dir.mkdir(parents=True, exist_ok=True)
+            try:
+                files_to_process = sync.changed(sftp, distant, metrics=metrics)
+            except Exception as e:
+                logger.error(f"Failed to process files from {distant}: {e}")
+                continue
+            for index, entry in enumerate(files_to_process, start=1):
+                jobs.append((task_type, entry.path, local_dir / entry.name.replace('.zip', '')))
+                entries.append(entry)
+                positions.append((len(files_to_process), index, entry.name))
+    finally:
+        sftp.close()
+
+    def on_start(job: int) -> None:
+        if callback:
+            total_files, index, file_name = positions[job]
+            callback(jobs[job][0], total_files, index, file_name)
+
+    succeeded = set()
+    for job, success in pipelined_download_decrypt_extract(transport, jobs, key, iv, channels, workers,
+                                                           on_start, metrics, sync):
+        if success:
+            # Committed as soon as the file is done: an interrupted run does not start over
+            processed_zips.add(positions[job][2], jobs[job][0])
+            sync.mark_synced(entries[job])
+            succeeded.add(job)
+            logger.debug(f"{len(succeeded)} files processed")
+    # Same order as a sequential run
+    return [(positions[job][2], jobs[job][0]) for job in sorted(succeeded)]
+
+def _open_ledger(local: Path, namespace: str, force: bool) -> Ledger:
+    """
+    Register of processed zips in local/ledger.db (see electriflux.ledger).
+    A legacy local/<namespace>.csv is imported on first use.
+    """
+    csv_path = local / f"{namespace}.csv"
+    if force and csv_path.exists():
+        csv_path.unlink()
+    ledger = Ledger(local / LEDGER_NAME, namespace, legacy_csv=csv_path)
+    if force:
+        ledger.reset()
+    return ledger
+
+def _open_sync(local: Path, processed_zips: Ledger, force: bool) -> RemoteSync:
+    """Remote listing cache and per-file sync state, in the same local/ledger.db (see electriflux.sync)."""
+    sync = RemoteSync(local / LEDGER_NAME, processed_zips.namespace, local / PARTIAL_DIR, processed_zips)
+    if force:
+        sync.reset()
+    return sync
+
 @check_required(['FTP_ADDRESS', 'FTP_USER', 'FTP_PASSWORD', 'AES_KEY', 'AES_IV'])
 def download_decrypt_extract_new_files(
     config: dict[str, str], 
     tasks: list[str], 
     local: Path,
     force: bool = False,
-    callback: Callable[[str, int, int, str], None] | None = None
+    callback: Callable[[str, int, int, str], None] | None = None,
+    channels: int = 1,
+    workers: int = 1,
+    metrics: Metrics | None = None
 ) -> list[tuple[str, str]]:
     """
     Downloads, decrypts, and extracts new files from the SFTP server, skipping files that have already been processed.
     Uses a callback function for progress tracking.
 
+    Processed files are recorded one by one in local/ledger.db (see electriflux.ledger), so an interrupted
+    run resumes where it stopped. A processed_zips.csv left by previous versions is imported on first use.
+
+    Only new or changed remote files are transferred: each remote directory is listed with every file's
+    size and mtime, a file republished under the same name is downloaded again, and an interrupted
+    download resumes from its local/.partial/<task_type>/*.part file (see electriflux.sync).
+
     Parameters:
     config (dict[str, str]): Configuration dictionary containing SFTP details, key, and IV.
     tasks (list[str]): List of directory types to process (e.g., ['R15', 'C15']).
@@ -118,62 +517,197 @@ def download_decrypt_extract_new_files(
                                    - total_files (int): Total number of files to process.
                                    - current_file (int): Current file being processed (1-indexed).
                                    - file_name (str): Name of the current file being processed.
+    channels (int): Number of concurrent SFTP channels. With channels > 1 or workers > 1, downloads
+                    overlap with decryption and extraction (see pipelined_download_decrypt_extract);
+                    the callback is then called when each file is scheduled, still in order.
+    workers (int): Number of decryption/extraction threads in pipelined mode.
+    metrics (Metrics, optional): Receives 'download', 'decrypt' and 'unzip' timings, downloaded, decrypted,
+                                 resumed and unchanged bytes and errors (see electriflux.metrics).
 
     Returns:
     list[tuple[str, str]]: A list of tuples containing (zip_name, task_type) of newly processed files.
     """
 
+    processed_zips = _open_ledger(local, "processed_zips", force)
+    sync = _open_sync(local, processed_zips, force)
+    transport = None
+
+    newly_processed_files = []
+
+    try:
+        transport = connect(config)
+        newly_processed_files = extract_new_files(transport, config, tasks, local, processed_zips,
+                                                  callback, channels, workers, metrics, sync)
+    finally:
+        if transport is not None:
+            transport.close()
+        sync.close()
+        processed_zips.close()
+
+    return newly_processed_files
+
+
+def connect(config: dict[str, str]) -> paramiko.Transport:
+    """Opens an authenticated SSH transport to the SFTP server of `config` (FTP_ADDRESS, FTP_PORT, FTP_USER, FTP_PASSWORD)."""
+    transport = paramiko.Transport((config['FTP_ADDRESS'], int(config.get('FTP_PORT', 22))))
+    try:
+        transport.connect(username=config['FTP_USER'], password=config['FTP_PASSWORD'])
+    except Exception:
+        transport.close()
+        raise
+    return transport
+
+
+def extract_new_files(
+    transport: paramiko.Transport,
+    config: dict[str, str],
+    tasks: list[str],
+    local: Path,
+    processed_zips: Ledger,
+    callback: Callable[[str, int, int, str], None] | None = None,
+    channels: int = 1,
+    workers: int = 1,
+    metrics: Metrics | None = None,
+    sync: RemoteSync | None = None
+) -> list[tuple[str, str]]:
+    """
+    Same as download_decrypt_extract_new_files, over an open transport and ledger, so that a
+    long-running caller (see electriflux.watch) keeps both between calls. Without `sync`, the
+    sync state of local/ledger.db is opened for the duration of the call.
+    """
     key = bytes.fromhex(config['AES_KEY'])
     iv = bytes.fromhex(config['AES_IV'])
+    own_sync = sync is None
+    if own_sync:
+        sync = _open_sync(local, processed_zips, force=False)
+    try:
+        if channels > 1 or workers > 1:
+            processed = _pipelined_new_files(transport, config, tasks, local, processed_zips, sync,
+                                             key, iv, callback, channels, workers, metrics)
+        else:
+            processed = _sequential_new_files(transport, config, tasks, local, processed_zips, sync,
+                                              key, iv, callback, metrics)
+        logger.info(sync.report())
+        return processed
+    finally:
+        if own_sync:
+            sync.close()
 
-    csv_path = local / "processed_zips.csv"
-    if force and csv_path.exists():
-        csv_path.unlink()
-    
-    if csv_path.exists():
-        df = pd.read_csv(csv_path)
-        processed_zips = set(df['zip_name'])
-    else:
-        df = pd.DataFrame(columns=['zip_name', 'flux'])
-        processed_zips = set()
-
-    transport = paramiko.Transport((config['FTP_ADDRESS'], 22))
-    transport.connect(username=config['FTP_USER'], password=config['FTP_PASSWORD'])
-    sftp = paramiko.SFTPClient.from_transport(transport)
 
-    newly_processed_files = []
+@check_required(['FTP_ADDRESS', 'FTP_USER', 'FTP_PASSWORD', 'AES_KEY', 'AES_IV'])
+def download_decrypt_parse_new_files(
+    config: dict[str, str],
+    tasks: list[str],
+    local: Path,
+    force: bool = False,
+    callback: Callable[[str, int, int, str], None] | None = None,
+    keep_xml: bool = False,
+    stream: bool = False,
+    backend: str = 'rows',
+    max_memory: int = 256 * 1024 * 1024,
+    flux_config_path: Path | None = None,
+    metrics: Metrics | None = None
+) -> Iterator[tuple[str, str, pd.DataFrame]]:
+    """
+    Downloads and decrypts new files from the SFTP server and parses them straight into DataFrames.
+
+    Each archive is decrypted on the fly while it downloads (see DecryptingWriter) into a spooled
+    buffer, kept in memory up to `max_memory` bytes, and its XML members are parsed from there
+    (see simple_reader.zip_to_dataframes): nothing is written to disk unless `keep_xml` is set.
+
+    Files are recorded as processed once their DataFrame has been consumed, in the
+    'parsed_zips' register of the ledger, or in 'processed_zips' with `keep_xml` since the XML
+    files are then extracted to the same place as download_decrypt_extract_new_files would.
+
+    Parameters:
+    config, tasks, local, force, callback: See download_decrypt_extract_new_files.
+    keep_xml (bool): Also write the archive contents to local/<task_type>/<zip name>.
+    stream, backend: Parsing options, see simple_reader.xml_to_dataframe.
+    max_memory (int): Size above which a decrypted archive is spooled to a temporary file.
+    flux_config_path (Path, optional): Flux YAML configuration (simple_flux.yaml by default).
+    metrics (Metrics, optional): Receives 'download' (including decryption) and 'parse' timings,
+                                 downloaded and decrypted bytes and errors (see electriflux.metrics).
+
+    Yields:
+    tuple[str, str, pd.DataFrame]: (zip_name, task_type, DataFrame of all its XML members).
+    """
+    key = bytes.fromhex(config['AES_KEY'])
+    iv = bytes.fromhex(config['AES_IV'])
+
+    processed_zips = _open_ledger(local, "processed_zips" if keep_xml else "parsed_zips", force)
+    sync = _open_sync(local, processed_zips, force)
+    transport = None
+    sftp = None
 
     try:
+        transport = connect(config)
+        sftp = paramiko.SFTPClient.from_transport(transport)
         for task_type in tasks:
-            distant = '/flux_enedis/' + str(config.get(f'FTP_{task_type}_DIR', task_type))
+            distant = _remote_dir(config, task_type)
             local_dir = local.joinpath(task_type)
             local_dir.mkdir(parents=True, exist_ok=True)
 
             try:
-                files_to_process = [f for f in sftp.listdir(distant) if f not in processed_zips]
-                total_files = len(files_to_process)
-
-                for index, file_name in enumerate(files_to_process, start=1):
-                    if callback:
-                        callback(task_type, total_files, index, file_name)
-
-                    remote_file_path = os.path.join(distant, file_name)
-                    output_path = local_dir / file_name.replace('.zip', '')
-                    
-                    success = download_decrypt_extract(sftp, remote_file_path, output_path, key, iv)
-                    
-                    if success:
-                        newly_processed_files.append((file_name, task_type))
-                        df = pd.concat([df, pd.DataFrame({'zip_name': [file_name], 'flux': [task_type]})], ignore_index=True)
-
+                files_to_process = sync.changed(sftp, distant, metrics=metrics)
             except Exception as e:
                 logger.error(f"Failed to process files from {distant}: {e}")
+                continue
+            total_files = len(files_to_process)
 
-    finally:
-        sftp.close()
-        transport.close()
+            for index, entry in enumerate(files_to_process, start=1):
+                file_name = entry.name
+                if callback:
+                    callback(task_type, total_files, index, file_name)
 
-    df.to_csv(csv_path, index=False)
+                remote_file_path = entry.path
+                xml_dir = local_dir / file_name.replace('.zip', '') if keep_xml else None
+                # A bad member is reported but does not keep the archive from being recorded
+                member_errors: list[FileError] = []
+                try:
+                    with tempfile.SpooledTemporaryFile(max_size=max_memory) as spool:
+                        with timed(metrics, 'download'), DecryptingWriter(spool, key, iv) as writer:
+                            sftp.getfo(remote_file_path, writer)
+                        sync.stats.downloaded_bytes += entry.size
+                        if metrics is not None:
+                            metrics.on_transfer('downloaded', remote_file_path, writer.bytes_written)
+                            metrics.on_transfer('decrypted', remote_file_path, writer.bytes_written)
+                        spool.seek(0)
+                        with timed(metrics, 'parse'):
+                            frames = [frame for _, frame in zip_to_dataframes(spool, task_type, flux_config_path,
+                                                                              xml_dir, stream, backend,
+                                                                              member_errors)]
+                except paramiko.SSHException as e:
+                    logger.error(f"SFTP error while downloading {remote_file_path}: {str(e)}")
+                    _record_error(metrics, remote_file_path, e)
+                    continue
+                except ValueError as e:
+                    logger.error(f"Decryption error for {remote_file_path}: {str(e)}")
+                    _record_error(metrics, remote_file_path, e)
+                    continue
+                except zipfile.BadZipFile as e:
+                    logger.error(f"ZIP extraction error for {remote_file_path}: {str(e)}")
+                    _record_error(metrics, remote_file_path, e)
+                    continue
+                except Exception as e:
+                    logger.error(f"Unexpected error processing {remote_file_path}: {str(e)}")
+                    _record_error(metrics, remote_file_path, e)
+                    continue
 
-    return newly_processed_files
+                if metrics is not None:
+                    for error in member_errors:
+                        metrics.on_error(f"{remote_file_path}/{error.file}", error.error_type, error.message)
+                frames = [frame for frame in frames if not frame.empty]
+                yield file_name, task_type, pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+                # Recorded once consumed, so a consumer that stops early will see it again
+                processed_zips.add(file_name, task_type)
+                sync.mark_synced(entry)
+                logger.debug(f"Successfully processed {remote_file_path}")
+        logger.info(sync.report())
 
+    finally:
+        if sftp is not None:
+            sftp.close()
+        if transport is not None:
+            transport.close()
+        sync.close()
+        processed_zips.close()
@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+"""
+Ingestion continue : surveillance du sFTP et des dossiers locaux, écriture au fil de l'eau dans le stockage Parquet.
+
+Plutôt qu'une exécution par cron de `download_decrypt_extract_new_files` puis de
+`iterative_process_flux` pour chaque flux, un `Watcher` tourne en continu :
+ - toutes les `interval` secondes, il liste les dossiers sFTP et télécharge, déchiffre et
+   extrait les nouvelles archives, sur une connexion gardée ouverte entre deux passages ;
+ - il repère les nouveaux XML par comparaison d'instantanés des dossiers locaux
+   (`DirectorySnapshot`) : seuls les dossiers modifiés depuis le passage précédent sont relus ;
+ - chaque nouveau fichier passe par une file bornée vers un thread d'ingestion, qui l'écrit
+   par lots dans le stockage Parquet (voir electriflux.store). Si l'ingestion prend du retard,
+   la file pleine suspend les téléchargements.
+
+Le registre des archives, le manifeste du stockage et l'instantané des dossiers restent en
+mémoire : un passage sans nouveauté ne coûte qu'un listage sFTP et un `stat` par dossier.
+Un fichier est visible dans le stockage quelques secondes après son extraction, au plus
+`interval` secondes après sa publication.
+
+Usage : `electriflux watch` (voir electriflux.cli), ou
+
+    watcher = Watcher(config, ['C15', 'R151'], Path('~/data/flux_enedis').expanduser())
+    watcher.run()
+"""
+
+import os
+import re
+import time
+import queue
+import logging
+import threading
+from pathlib import Path
+from typing import Iterator
+
+import paramiko
+
+from electriflux.ledger import LEDGER_NAME, Ledger
+from electriflux.metrics import Metrics, timed
+from electriflux.parallel import FileError
+from electriflux.plan import DEFAULT_CONFIG_PATH, load_flux_config
+from electriflux.rollup import update_rollups
+from electriflux.simple_reader import parse_xml_files
+from electriflux.store import processed_files, write_parsed
+from electriflux.utils import connect, extract_new_files
+
+_logger = logging.getLogger(__name__)
+
+
+class DirectorySnapshot:
+    """
+    Instantané des fichiers d'une arborescence, mis à jour par différence.
+
+    Chaque dossier est mémorisé avec sa date de modification, ses sous-dossiers et ses
+    fichiers (taille, date de modification). À chaque `scan`, un dossier dont la date n'a
+    pas changé n'est pas relu : ajouter ou renommer un fichier modifie la date de son
+    dossier, pas réécrire un fichier existant, qui n'est donc pas signalé à nouveau.
+
+    Parameters:
+        root (Path): Racine surveillée.
+        suffix (str): Seuls les fichiers de ce suffixe sont suivis.
+        settle (float): Âge minimal (secondes) d'un fichier avant de le signaler, pour ne
+            pas lire un fichier encore en cours d'écriture par un autre processus. Un fichier
+            trop récent est signalé lors d'un passage suivant.
+    """
+
+    def __init__(self, root: Path, suffix: str = '.xml', settle: float = 0.0):
+        self.root = Path(root)
+        self.suffix = suffix
+        self.settle = settle
+        self._dirs: dict[str, tuple[int, list[str], dict[str, tuple[int, int]]]] = {}
+        self._pending: set[str] = set()
+        # `forget` est appelé depuis le thread d'ingestion, pendant que `scan` tourne dans un autre
+        self._lock = threading.Lock()
+
+    def _settled(self, path: str, now: float) -> bool:
+        try:
+            return now - os.stat(path).st_mtime >= self.settle
+        except FileNotFoundError:
+            return False
+
+    def forget(self, paths: list[Path]) -> None:
+        """Oublie des fichiers déjà signalés : le prochain `scan` les signalera de nouveau."""
+        with self._lock:
+            for path in paths:
+                directory, name = os.path.split(str(path))
+                cached = self._dirs.get(directory)
+                if cached is not None:
+                    # Date impossible : le dossier sera relu au prochain passage
+                    files = {k: v for k, v in cached[2].items() if k != name}
+                    self._dirs[directory] = (-1, cached[1], files)
+
+    def scan(self) -> list[Path]:
+        """Fichiers apparus ou modifiés depuis le passage précédent (tous au premier passage), triés."""
+        with self._lock:
+            return self._scan()
+
+    def _scan(self) -> list[Path]:
+        now = time.time()
+        found: list[str] = []
+        seen: set[str] = set()
+        stack = [str(self.root)]
+        while stack:
+            directory = stack.pop()
+            try:
+                mtime = os.stat(directory).st_mtime_ns
+            except FileNotFoundError:
+                continue
+            seen.add(directory)
+            cached = self._dirs.get(directory)
+            if cached is not None and cached[0] == mtime:
+                stack.extend(cached[1])
+                continue
+            subdirs: list[str] = []
+            files: dict[str, tuple[int, int]] = {}
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.path)
+                        elif entry.name.endswith(self.suffix) and entry.is_file():
+                            stat = entry.stat()
+                            files[entry.name] = (stat.st_size, stat.st_mtime_ns)
+            except FileNotFoundError:
+                continue
+            previous = cached[2] if cached is not None else {}
+            found.extend(os.path.join(directory, name) for name, signature in files.items()
+                         if previous.get(name) != signature)
+            self._dirs[directory] = (mtime, subdirs, files)
+            stack.extend(subdirs)
+        # Dossiers disparus : oubliés
+        for directory in self._dirs.keys() - seen:
+            del self._dirs[directory]
+
+        if self.settle > 0:
+            candidates = self._pending | set(found)
+            ready = {path for path in candidates if self._settled(path, now)}
+            self._pending = {path for path in candidates - ready if os.path.exists(path)}
+            found = list(ready)
+        return sorted(Path(path) for path in found)
+
+
+class Watcher:
+    """
+    Ingestion continue des flux `tasks` : sFTP -> `local` -> stockage Parquet `store_dir`.
+
+    Parameters:
+        config (dict[str, str] | None): Accès sFTP et clés AES, comme pour
+            `download_decrypt_extract_new_files`. None : pas de téléchargement, seuls
+            les XML déposés dans `local` sont ingérés.
+        tasks (list[str]): Flux surveillés (C15, F15, R151...). Les archives de chaque flux
+            sont extraites dans `local / flux`, et chaque XML est attribué au flux de ce dossier.
+        local (Path): Dossier local des archives extraites (et du registre ledger.db).
+        store_dir (Path, optional): Stockage Parquet, `local / 'store'` par défaut.
+        flux_config_path (Path, optional): Configuration YAML des flux (simple_flux.yaml par défaut).
+        interval (float): Secondes entre deux passages.
+        channels, workers: Téléchargements sFTP en parallèle (voir `download_decrypt_extract_new_files`).
+        parse_workers (int | None): Processus de lecture des XML (voir `simple_reader.process_flux`).
+        queue_size (int): Nombre maximal de fichiers en attente d'ingestion.
+        batch_files (int): Nombre maximal de fichiers écrits par lot dans le stockage.
+        settle (float): Voir `DirectorySnapshot`.
+        backend (str): Voir `simple_reader.xml_to_dataframe`.
+        metrics (Metrics, optional): Mesures des téléchargements, lectures et écritures.
+    """
+
+    def __init__(self,
+                 config: dict[str, str] | None,
+                 tasks: list[str],
+                 local: Path,
+                 store_dir: Path | None = None,
+                 flux_config_path: Path | None = None,
+                 interval: float = 60.0,
+                 channels: int = 1,
+                 workers: int = 1,
+                 parse_workers: int | None = 1,
+                 queue_size: int = 1024,
+                 batch_files: int = 256,
+                 settle: float = 0.0,
+                 backend: str = 'rows',
+                 metrics: Metrics | None = None):
+        self.config = config
+        self.tasks = list(tasks)
+        self.local = Path(local)
+        self.store_dir = Path(store_dir) if store_dir is not None else self.local / 'store'
+        self.interval = interval
+        self.channels = channels
+        self.workers = workers
+        self.parse_workers = parse_workers
+        self.batch_files = max(1, batch_files)
+        self.backend = backend
+        self.metrics = metrics
+        self.errors: list[FileError] = []
+
+        config_path = flux_config_path or DEFAULT_CONFIG_PATH
+        self.flux_configs = {flux: load_flux_config(flux, config_path) for flux in self.tasks}
+        self.patterns = {flux: re.compile(config['file_regex']) if config.get('file_regex') else None
+                         for flux, config in self.flux_configs.items()}
+        self.local.mkdir(parents=True, exist_ok=True)
+        for flux in self.tasks:
+            (self.local / flux).mkdir(exist_ok=True)
+        self.snapshots = {flux: DirectorySnapshot(self.local / flux, settle=settle) for flux in self.tasks}
+        # Fichiers déjà présents dans le stockage, lus une fois puis tenus à jour en mémoire
+        self.ingested = {flux: processed_files(self.store_dir, flux) for flux in self.tasks}
+        self.files: queue.Queue[tuple[str, Path]] = queue.Queue(maxsize=max(1, queue_size))
+        self._ledger: Ledger | None = None
+        self._transport: paramiko.Transport | None = None
+
+    # Téléchargements
+
+    def download(self) -> list[tuple[str, str]]:
+        """Télécharge, déchiffre et extrait les nouvelles archives ; renvoie les couples (archive, flux)."""
+        if self.config is None:
+            return []
+        if self._ledger is None:
+            self._ledger = Ledger(self.local / LEDGER_NAME, 'processed_zips',
+                                  legacy_csv=self.local / 'processed_zips.csv')
+        if self._transport is None or not self._transport.is_active():
+            self._close_transport()
+            self._transport = connect(self.config)
+        try:
+            return extract_new_files(self._transport, self.config, self.tasks, self.local, self._ledger,
+                                     channels=self.channels, workers=self.workers, metrics=self.metrics)
+        except Exception:
+            # Connexion reprise au prochain passage
+            self._close_transport()
+            raise
+
+    def _safe_download(self) -> None:
+        # Une panne du sFTP n'interrompt pas l'ingestion des fichiers déjà présents
+        try:
+            downloaded = self.download()
+            if downloaded:
+                _logger.info(f"{len(downloaded)} archives extraites")
+        except Exception as e:
+            _logger.error(f"Échec des téléchargements : {e}")
+
+    def _close_transport(self) -> None:
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+
+    # Découverte
+
+    def discover(self) -> Iterator[tuple[str, Path]]:
+        """Nouveaux XML de chaque flux, non encore présents dans le stockage."""
+        for flux, snapshot in self.snapshots.items():
+            with timed(self.metrics, 'discovery'):
+                paths = snapshot.scan()
+            regex = self.patterns[flux]
+            for path in paths:
+                if path.name in self.ingested[flux] or (regex is not None and not regex.search(path.name)):
+                    continue
+                yield flux, path
+
+    def poll(self, stop: threading.Event | None = None) -> int:
+        """
+        Un passage : téléchargements puis mise en file des nouveaux XML.
+
+        La mise en file bloque tant que la file est pleine (ou jusqu'à `stop`).
+
+        Returns:
+            int: Nombre de fichiers mis en file.
+        """
+        self._safe_download()
+        queued = 0
+        for item in self.discover():
+            while True:
+                if stop is not None and stop.is_set():
+                    return queued
+                try:
+                    self.files.put(item, timeout=0.5)
+                    break
+                except queue.Full:
+                    continue
+            queued += 1
+        return queued
+
+    # Ingestion
+
+    def _next_batch(self, timeout: float) -> list[tuple[str, Path]]:
+        try:
+            batch = [self.files.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_files:
+            try:
+                batch.append(self.files.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def ingest(self, batch: list[tuple[str, Path]]) -> int:
+        """
+        Lit et écrit un lot de fichiers dans le stockage, un lot de fragments par flux.
+
+        Les fichiers en erreur sont ajoutés à `errors` et ne sont pas retentés tant qu'ils
+        ne sont pas modifiés.
+
+        Returns:
+            int: Nombre de fichiers écrits.
+        """
+        by_flux: dict[str, list[Path]] = {}
+        for flux, path in batch:
+            if path.name not in self.ingested[flux]:
+                by_flux.setdefault(flux, []).append(path)
+        written = 0
+        for flux, paths in by_flux.items():
+            config = self.flux_configs[flux]
+            parsed = parse_xml_files(paths, config['row_level'], config['metadata_fields'], config['data_fields'],
+                                     config['nested_fields'], workers=self.parse_workers, errors=self.errors,
+                                     backend=self.backend, metrics=self.metrics)
+            if not parsed:
+                continue
+            with timed(self.metrics, 'store'):
+                rows = write_parsed(self.store_dir, flux, parsed, config.get('partition_field'))
+            with timed(self.metrics, 'rollup'):
+                update_rollups(self.store_dir, flux, config.get('rollups'))
+            self.ingested[flux].update(f.name for f, _ in parsed)
+            written += len(parsed)
+            _logger.info(f"{flux} : {len(parsed)} fichiers ingérés ({rows} lignes)")
+        return written
+
+    def _ingest_loop(self, stop: threading.Event) -> None:
+        while not stop.is_set():
+            batch = self._next_batch(timeout=0.5)
+            if not batch:
+                continue
+            try:
+                self.ingest(batch)
+            except Exception as e:
+                # Déjà vus par les instantanés : sans cela, ils ne seraient plus jamais proposés
+                _logger.error(f"Échec de l'ingestion de {len(batch)} fichiers, retentés au prochain passage : {e}")
+                for flux in {flux for flux, _ in batch}:
+                    self.snapshots[flux].forget([path for f, path in batch if f == flux])
+            finally:
+                for _ in batch:
+                    self.files.task_done()
+
+    def run_once(self) -> int:
+        """
+        Un passage complet, sans thread : téléchargements, découverte et ingestion de tous les nouveaux fichiers.
+
+        Returns:
+            int: Nombre de fichiers écrits dans le stockage.
+        """
+        self._safe_download()
+        pending = list(self.discover())
+        written = 0
+        for start in range(0, len(pending), self.batch_files):
+            written += self.ingest(pending[start:start + self.batch_files])
+        return written
+
+    def run(self, stop: threading.Event | None = None) -> None:
+        """
+        Tourne jusqu'à `stop` (ou une interruption clavier) : un passage toutes les `interval`
+        secondes, l'ingestion se faisant en parallèle dans un thread dédié.
+        """
+        stop = stop or threading.Event()
+        ingester = threading.Thread(target=self._ingest_loop, args=(stop,), name='electriflux-ingest', daemon=True)
+        ingester.start()
+        try:
+            while not stop.is_set():
+                started = time.monotonic()
+                queued = self.poll(stop)
+                if queued:
+                    _logger.info(f"{queued} nouveaux fichiers en file")
+                stop.wait(max(0.0, self.interval - (time.monotonic() - started)))
+        except KeyboardInterrupt:
+            _logger.info("Arrêt demandé")
+        finally:
+            stop.set()
+            ingester.join()
+            self.close()
+
+    def close(self) -> None:
+        self._close_transport()
+        if self._ledger is not None:
+            self._ledger.close()
+            self._ledger = None
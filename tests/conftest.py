@@ -0,0 +1,15 @@
+from pathlib import Path
+
+import pytest
+
+from synthetic import Shape, generate_all
+
+DATA_DIR = Path(__file__).parent / 'data'
+
+
+@pytest.fixture(scope='session')
+def synthetic(tmp_path_factory) -> Path:
+    """Flux synthétiques (benchmarks/synthetic.py), un dossier par flux : quelques fichiers de quelques PRM."""
+    root = tmp_path_factory.mktemp('flux')
+    generate_all(root, Shape(prms=20, files=3, nesting=3))
+    return root
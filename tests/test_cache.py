@@ -0,0 +1,90 @@
+import os
+import shutil
+
+import pandas as pd
+import pyarrow as pa
+import pytest
+import yaml
+from polars.testing import assert_frame_equal
+
+import electriflux.polars_reader
+import electriflux.simple_reader
+from electriflux import polars_reader, simple_reader
+from electriflux.cache import ParseCache
+from electriflux.plan import DEFAULT_CONFIG_PATH
+
+
+@pytest.fixture
+def xml_dir(synthetic, tmp_path):
+    shutil.copytree(synthetic / 'R151', tmp_path / 'R151')
+    return tmp_path / 'R151'
+
+
+def n_files(xml_dir):
+    return len(list(xml_dir.rglob('*.xml')))
+
+
+def fail(*args, **kwargs):
+    raise AssertionError("fichier extrait au lieu d'être lu dans le cache")
+
+
+def test_warm_run_reads_only_the_cache(xml_dir, tmp_path, monkeypatch):
+    cache = ParseCache(tmp_path / 'cache')
+    cold = simple_reader.process_flux('R151', xml_dir, cache=cache)
+    assert (cache.hits, cache.misses) == (0, n_files(xml_dir))
+
+    monkeypatch.setattr(electriflux.simple_reader, 'xml_to_dataframe', fail)
+    warm = simple_reader.process_flux('R151', xml_dir, cache=cache)
+    assert (cache.hits, cache.misses) == (n_files(xml_dir), n_files(xml_dir))
+    pd.testing.assert_frame_equal(warm, cold)
+
+
+def test_polars_reader_warm_run(xml_dir, tmp_path, monkeypatch):
+    cache = ParseCache(tmp_path / 'cache')
+    cold = polars_reader.process_flux('R151', xml_dir, cache=cache)
+    monkeypatch.setattr(electriflux.polars_reader, 'xml_to_dataframe', fail)
+    assert_frame_equal(polars_reader.process_flux('R151', xml_dir, cache=cache), cold)
+    assert (cache.hits, cache.misses) == (n_files(xml_dir), n_files(xml_dir))
+
+
+def test_touched_file_is_parsed_again(xml_dir, tmp_path):
+    cache = ParseCache(tmp_path / 'cache')
+    simple_reader.process_flux('R151', xml_dir, cache=cache)
+    touched = next(xml_dir.rglob('*.xml'))
+    stat = touched.stat()
+    os.utime(touched, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    simple_reader.process_flux('R151', xml_dir, cache=cache)
+    assert (cache.hits, cache.misses) == (n_files(xml_dir) - 1, n_files(xml_dir) + 1)
+
+
+def test_yaml_edit_invalidates_entries(xml_dir, tmp_path):
+    cache = ParseCache(tmp_path / 'cache')
+    simple_reader.process_flux('R151', xml_dir, cache=cache)
+    configs = yaml.safe_load(DEFAULT_CONFIG_PATH.read_text())
+    configs['R151']['data_fields']['Id_Affaire'] = 'Donnees_Releve/Id_Affaire_Bis'
+    edited = tmp_path / 'flux.yaml'
+    edited.write_text(yaml.safe_dump(configs, allow_unicode=True))
+
+    simple_reader.process_flux('R151', xml_dir, config_path=edited, cache=cache)
+    assert (cache.hits, cache.misses) == (0, 2 * n_files(xml_dir))
+    # Les entrées de la configuration d'origine restent valables
+    simple_reader.process_flux('R151', xml_dir, cache=cache)
+    assert cache.hits == n_files(xml_dir)
+
+
+def test_lru_eviction(tmp_path):
+    table = pa.table({'a': [str(i) for i in range(1000)]})
+    cache = ParseCache(tmp_path / 'cache')
+    cache.put('aa', table)
+    size = cache.size()
+    cache.max_bytes = int(size * 2.5)
+    cache.put('bb', table)
+    # Horodatages explicites : 'aa' écrit avant 'bb', mais relu depuis
+    for key, seconds in (('aa', 1_000), ('bb', 2_000)):
+        os.utime(tmp_path / 'cache' / key[:2] / f'{key}.parquet', (seconds, seconds))
+    assert cache.get('aa') is not None
+    cache.put('cc', table)
+    assert cache.get('bb') is None
+    assert cache.get('aa') is not None and cache.get('cc') is not None
+    assert cache.size() <= cache.max_bytes
+    assert (cache.hits, cache.misses) == (3, 1)
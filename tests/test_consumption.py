@@ -0,0 +1,72 @@
+import polars as pl
+import pytest
+
+from electriflux.consumption import CADRANS, c15_readings, consumption_intervals, index_readings, prorate
+from electriflux.plan import load_flux_config
+from electriflux.polars_reader import xml_to_dataframe
+
+from .conftest import DATA_DIR
+
+
+def read(name, flux):
+    config = load_flux_config(flux)
+    return xml_to_dataframe(DATA_DIR / name, config['row_level'], config['metadata_fields'],
+                            config['data_fields'], config['nested_fields'])
+
+
+@pytest.fixture
+def intervals():
+    return consumption_intervals(index_readings(read('R151_index.xml', 'R151')),
+                                 c15_readings(read('C15_compteur.xml', 'C15')))
+
+
+def test_intervals(intervals):
+    got = {(row['pdl'], row['Date_Debut'].date().isoformat()): (row['BASE'], row['Tour_Compteur'])
+           for row in intervals.to_dicts()}
+    assert got == pytest.approx({
+        # Index en Wh, convertis en kWh ; 99 990 puis 40 : un tour de compteur de 50 kWh
+        ('00000000000001', '2024-01-01'): (50.0, True),
+        ('00000000000001', '2024-02-01'): (60.0, False),
+        # Dépose puis pose du C15 : deux segments, sans consommation négative
+        ('00000000000002', '2024-01-01'): (300.0, False),
+        ('00000000000002', '2024-02-01'): (200.0, False),
+        # Changement de calendrier : pas d'intervalle à cheval
+        ('00000000000003', '2024-02-01'): (50.0, False),
+    })
+    assert intervals.filter(pl.col('pdl') == '00000000000002')['Num_Compteur'].to_list() == [None, 'NEUF']
+    assert intervals['HPH'].is_null().all()
+
+
+def test_no_rollover_margin(intervals):
+    no_rollover = consumption_intervals(index_readings(read('R151_index.xml', 'R151')), rollover_margin=0)
+    assert no_rollover.filter(pl.col('pdl') == '00000000000001')['BASE'].to_list() == [-99950.0, 60.0]
+    assert not no_rollover['Tour_Compteur'].any()
+
+
+def test_prorate(intervals):
+    periods = pl.DataFrame({
+        'pdl': ['00000000000001', '00000000000001', '00000000000003', '00000000000009'],
+        'Date_Debut': ['2024-01-16', '2023-12-01', '2024-01-01', '2024-01-01'],
+        'Date_Fin': ['2024-02-16', '2024-01-01', '2024-03-01', '2024-02-01'],
+        'Periode': ['a', 'b', 'c', 'd'],
+    })
+    result = {row['Periode']: row for row in prorate(intervals, periods).to_dicts()}
+    # 16 jours sur 31 de janvier, 15 sur 29 de février
+    assert result['a']['BASE'] == pytest.approx(50 * 16 / 31 + 60 * 15 / 29)
+    assert result['a']['Couverture'] == pytest.approx(1.0)
+    # Avant le premier relevé : rien de consommé, rien de couvert
+    assert (result['b']['BASE'], result['b']['Couverture']) == (0.0, 0.0)
+    # Janvier non couvert (changement de calendrier), février couvert
+    assert result['c']['BASE'] == pytest.approx(50.0)
+    assert result['c']['Couverture'] == pytest.approx(29 / 60)
+    # PRM sans relevé, cadran jamais relevé : null
+    assert result['d']['BASE'] is None and result['d']['Couverture'] == 0.0
+    assert result['a']['HPH'] is None
+    assert set(CADRANS) <= set(result['a'])
+
+
+def test_periods_without_pdl_apply_to_every_prm(intervals):
+    periods = pl.DataFrame({'Date_Debut': ['2024-02-01'], 'Date_Fin': ['2024-03-01']})
+    result = prorate(intervals, periods).sort('pdl')
+    assert result['pdl'].to_list() == ['00000000000001', '00000000000002', '00000000000003']
+    assert result['BASE'].to_list() == pytest.approx([60.0, 200.0, 50.0])
@@ -0,0 +1,39 @@
+import pandas as pd
+import pytest
+
+from electriflux.index import PrmIndex, lookup_prm
+from electriflux.simple_reader import process_flux
+
+# F12 et F15 : blocs au niveau de l'ancêtre porteur des champs `../`
+FLUXES = ['C15', 'F12', 'F15', 'R15', 'R151']
+
+
+@pytest.fixture
+def index_path(synthetic, tmp_path):
+    path = tmp_path / 'prm_index.db'
+    with PrmIndex(path) as index:
+        for flux in FLUXES:
+            assert index.update_dir(flux, synthetic / flux) > 0
+    return path
+
+
+def test_lookup_matches_filtered_flux(synthetic, index_path):
+    fluxes = {flux: process_flux(flux, synthetic / flux) for flux in FLUXES}
+    for pdl in sorted(set(fluxes['C15']['pdl']))[:3]:
+        frames = lookup_prm(pdl, index_path)
+        assert set(frames) == {flux for flux, df in fluxes.items() if (df['pdl'] == pdl).any()}
+        for flux, found in frames.items():
+            expected = fluxes[flux][fluxes[flux]['pdl'] == pdl].reset_index(drop=True)[list(found.columns)]
+            pd.testing.assert_frame_equal(found.astype(object).where(found.notna(), None),
+                                          expected.astype(object).where(expected.notna(), None))
+
+
+def test_lookup_restricted_to_fluxes(synthetic, index_path):
+    pdl = process_flux('R151', synthetic / 'R151')['pdl'].iloc[0]
+    assert set(lookup_prm(pdl, index_path, fluxes=['R151'])) == {'R151'}
+    assert lookup_prm('99999999999999', index_path) == {}
+
+
+def test_unchanged_files_are_not_reindexed(synthetic, index_path):
+    with PrmIndex(index_path) as index:
+        assert index.update_dir('R151', synthetic / 'R151') == 0
@@ -0,0 +1,22 @@
+import pandas as pd
+
+from electriflux.ingest import ingest_fluxes
+from electriflux.store import read_store
+
+
+def test_shared_file_names_are_excluded_per_flux(synthetic, tmp_path):
+    # F12 et F15 partagent le même file_regex, et les fichiers synthétiques le même nom
+    store = tmp_path / 'store'
+    assert ingest_fluxes(synthetic, ['F12'], store_dir=store, workers=1)['F12'] > 0
+    alone = ingest_fluxes(synthetic, ['F15'], store_dir=tmp_path / 'f15', workers=1)
+    assert alone['F15'] > 0
+    assert ingest_fluxes(synthetic, ['F12', 'F15'], store_dir=store, workers=1) == {'F12': 0, 'F15': alone['F15']}
+
+
+def test_pool_between_store_writes(synthetic, tmp_path):
+    # Petits lots : le stockage (pyarrow, polars) est écrit entre deux lots du même pool
+    expected = ingest_fluxes(synthetic, ['R151', 'F15'], store_dir=tmp_path / 'seq', workers=1, batch_files=1)
+    got = ingest_fluxes(synthetic, ['R151', 'F15'], store_dir=tmp_path / 'pool', workers=2, batch_files=1)
+    assert got == expected
+    for flux in expected:
+        pd.testing.assert_frame_equal(read_store(tmp_path / 'pool', flux), read_store(tmp_path / 'seq', flux))
@@ -0,0 +1,26 @@
+from electriflux.ledger import Ledger
+
+
+def test_legacy_import_and_idempotent_add(tmp_path):
+    legacy = tmp_path / 'processed_zips.csv'
+    legacy.write_text('zip_name,flux,processed_at\n'
+                      'a.zip,R151,2024-01-01T00:00:00\n'
+                      'b.zip,C15,\n')
+    path = tmp_path / 'ledger.db'
+
+    with Ledger(path, 'processed_zips', legacy_csv=legacy) as ledger:
+        assert ledger.names() == {'a.zip', 'b.zip'}
+        ledger.add('c.zip', 'R151')
+        ledger.add('c.zip', 'R151')
+        ledger.add('a.zip', 'R151')
+
+    # Réouverture : le CSV inchangé n'est pas réimporté, aucun doublon
+    with Ledger(path, 'processed_zips', legacy_csv=legacy) as ledger:
+        entries = ledger.entries()
+        assert entries['name'].tolist() == ['a.zip', 'b.zip', 'c.zip']
+        assert entries['processed_at'].iloc[0] == '2024-01-01T00:00:00'
+        assert entries['flux'].tolist() == ['R151', 'C15', 'R151']
+
+    # Les autres espaces de noms de la base ne sont pas touchés
+    with Ledger(path, 'history') as ledger:
+        assert len(ledger) == 0
@@ -0,0 +1,40 @@
+import shutil
+
+import pytest
+
+from electriflux import polars_reader, simple_reader
+from electriflux.metrics import Metrics, file_stages, timed
+
+
+@pytest.fixture
+def xml_dir(synthetic, tmp_path):
+    shutil.copytree(synthetic / 'R15', tmp_path / 'R15')
+    (tmp_path / 'R15' / 'broken.xml').write_text('<R15><PRM>')
+    return tmp_path / 'R15'
+
+
+@pytest.mark.parametrize('reader', [simple_reader, polars_reader])
+def test_report_does_not_depend_on_workers(xml_dir, reader):
+    reports = []
+    for workers in (1, 2):
+        metrics = Metrics()
+        df = reader.process_flux('R15', xml_dir, workers=workers, metrics=metrics)
+        report = metrics.report()
+        assert report['rows'] == len(df)
+        assert {'discovery', 'parse', 'extract', 'frame', 'concat'} <= set(report['stages'])
+        assert report['stages']['parse']['calls'] == report['files']
+        assert [(e['file'], e['error_type']) for e in report['error_details']] \
+            == [(str(xml_dir / 'broken.xml'), 'XMLSyntaxError')]
+        reports.append(report)
+    sequential, pooled = ({key: report[key] for key in ('files', 'rows', 'bytes', 'errors')} for report in reports)
+    assert sequential == pooled
+    assert sequential['files'] == len(list(xml_dir.rglob('*.xml'))) - 1
+    assert sorted(f['file'] for f in reports[0]['per_file']) == sorted(f['file'] for f in reports[1]['per_file'])
+
+
+def test_nothing_measured_without_metrics(xml_dir):
+    # Sans Metrics : un contexte vide partagé, aucune étape collectée par fichier
+    assert timed(None, 'parse') is timed(None, 'concat')
+    df = simple_reader.process_flux('R15', xml_dir)
+    assert file_stages() is None
+    assert df.equals(simple_reader.process_flux('R15', xml_dir, metrics=Metrics()))
@@ -0,0 +1,36 @@
+import pytest
+from polars.testing import assert_frame_equal
+
+from electriflux.plan import load_flux_config
+from electriflux.polars_reader import find_xml_files, xml_to_dataframe
+
+from .conftest import DATA_DIR
+
+
+def read(path, flux, **kwargs):
+    config = load_flux_config(flux)
+    return xml_to_dataframe(path, config['row_level'], config['metadata_fields'], config['data_fields'],
+                            config['nested_fields'], **kwargs)
+
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_long_table_edge_cases(stream):
+    df = read(DATA_DIR / 'C15_nested.xml', 'C15', stream=stream)
+    assert_frame_equal(df, read(DATA_DIR / 'C15_nested.xml', 'C15', stream=stream, nested='rows'))
+    first, second = df.to_dicts()
+    # La dernière valeur d'un identifiant répété l'emporte
+    assert first['Avant_HPH'] == '110'
+    # Condition sur Classe_Mesure non remplie : pas de colonne ; Sens_Mesure absent : ignoré
+    assert 'Avant_HCH' not in df.columns
+    assert first['Avant_HCB'] == '50'
+    assert (first['Après_HPH'], first['Après_None']) == ('0', '7')
+    assert (first['Avant_Date_Releve'], first['Après_Date_Releve']) == ('2024-02-29', '2024-03-01')
+    assert second['Avant_HPH'] is None
+
+
+@pytest.mark.parametrize('flux', ['C15', 'R15', 'R151', 'R15_ACC'])
+def test_long_table_matches_rows(synthetic, flux):
+    files = find_xml_files(synthetic / flux, load_flux_config(flux).get('file_regex'))
+    assert files
+    for path in files:
+        assert_frame_equal(read(path, flux), read(path, flux, nested='rows'))
@@ -0,0 +1,12 @@
+import polars as pl
+from polars.testing import assert_frame_equal
+
+from electriflux import polars_reader
+
+
+def test_pool_after_polars_work(synthetic):
+    # Les threads de polars tournent déjà : un pool créé par fork resterait bloqué
+    pl.DataFrame({'a': range(10_000)}).group_by('a').len()
+    sequential = polars_reader.process_flux('R151', synthetic / 'R151')
+    for _ in range(2):
+        assert_frame_equal(polars_reader.process_flux('R151', synthetic / 'R151', workers=2), sequential)
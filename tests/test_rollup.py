@@ -0,0 +1,60 @@
+import shutil
+
+import pandas as pd
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from electriflux.plan import load_flux_config
+from electriflux.rollup import COUNT, MEASURES, MONTH, read_rollup, reconcile_rollups, rollup_path
+from electriflux.simple_reader import iterative_process_flux
+from electriflux.store import partition_month, read_store
+
+ROLLUPS = load_flux_config('F15')['rollups']
+
+
+def ingest_in_two_runs(synthetic, tmp_path):
+    xml_dir, store = tmp_path / 'F15', tmp_path / 'store'
+    for name in ('FL_0_0', 'FL_1_1'):
+        shutil.copytree(synthetic / 'F15' / name, xml_dir / name)
+        iterative_process_flux('F15', xml_dir, storage='parquet', store_dir=store)
+    return store
+
+
+def expected(store, keys):
+    detail = read_store(store, 'F15')
+    detail[MONTH] = partition_month(detail['Date_Facture'])
+    for measure in MEASURES:
+        detail[measure] = pd.to_numeric(detail[measure])
+    return (detail.groupby(list(keys), dropna=False)
+            .agg(**{m: (m, 'sum') for m in MEASURES}, **{COUNT: (MEASURES[0], 'size')})
+            .reset_index())
+
+
+def sort(df, keys):
+    return df.sort_values(list(keys)).reset_index(drop=True)
+
+
+def test_rollups_match_detail(synthetic, tmp_path):
+    store = ingest_in_two_runs(synthetic, tmp_path)
+    for name, keys in ROLLUPS.items():
+        got = sort(read_rollup(store, 'F15', name), keys)
+        pd.testing.assert_frame_equal(got, sort(expected(store, keys), keys), check_dtype=False)
+    assert all(diff.empty for diff in reconcile_rollups(store, 'F15', ROLLUPS).values())
+
+
+def test_reconcile_repairs_tampered_table(synthetic, tmp_path):
+    store = ingest_in_two_runs(synthetic, tmp_path)
+    path = rollup_path(store, 'F15', 'facture')
+    table = pq.read_table(path)
+    # Montants doublés, métadonnées conservées : la table semble à jour
+    index = table.schema.get_field_index('Montant_HT')
+    pq.write_table(table.set_column(index, 'Montant_HT', pc.multiply(table['Montant_HT'], 2.0)), path)
+
+    differences = reconcile_rollups(store, 'F15', ROLLUPS)
+    assert len(differences['facture']) == pc.sum(pc.not_equal(table['Montant_HT'], 0.0)).as_py()
+    assert differences['prm_mois'].empty
+    reconcile_rollups(store, 'F15', ROLLUPS, repair=True)
+    assert all(diff.empty for diff in reconcile_rollups(store, 'F15', ROLLUPS).values())
+    keys = ROLLUPS['facture']
+    pd.testing.assert_frame_equal(sort(read_rollup(store, 'F15', 'facture'), keys),
+                                  sort(expected(store, keys), keys), check_dtype=False)
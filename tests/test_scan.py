@@ -0,0 +1,77 @@
+import datetime
+import logging
+
+import polars as pl
+import pytest
+from polars.testing import assert_frame_equal
+
+from electriflux.polars_reader import process_flux, scan_flux
+from electriflux.stats import predicate_constraints
+
+
+def write_r151(path, prm, day):
+    path.write_text(f"""<?xml version='1.0' encoding='UTF-8'?>
+<R151>
+  <En_Tete_Flux><Unite_Mesure_Index>kWh</Unite_Mesure_Index></En_Tete_Flux>
+  <PRM>
+    <Id_PRM>{prm}</Id_PRM>
+    <Donnees_Releve>
+      <Date_Releve>{day}</Date_Releve>
+      <Id_Calendrier_Distributeur>DI000003</Id_Calendrier_Distributeur>
+      <Classe_Temporelle_Distributeur><Id_Classe_Temporelle>HPH</Id_Classe_Temporelle><Valeur>10</Valeur></Classe_Temporelle_Distributeur>
+    </Donnees_Releve>
+  </PRM>
+</R151>
+""")
+
+
+@pytest.fixture
+def xml_dir(tmp_path):
+    for i, (prm, day) in enumerate([('01', '2024-01-15'), ('02', '2024-06-02'), ('03', '2024-12-31')]):
+        write_r151(tmp_path / f'R151_{i}.xml', f'000000000000{prm}', day)
+    return tmp_path
+
+
+def scanned(caplog, lazy):
+    caplog.clear()
+    with caplog.at_level(logging.INFO, logger='electriflux.polars_reader'):
+        df = lazy.collect()
+    read = [r.getMessage() for r in caplog.records if r.getMessage().startswith('scan_flux')]
+    return df, read[-1].split(' : ')[1]
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_scan_prunes_files(xml_dir, caplog, workers):
+    # Un premier calcul polars : le pool ne doit pas en dépendre
+    assert_frame_equal(scan_flux('R151', xml_dir, workers=workers).collect(), process_flux('R151', xml_dir))
+
+    df, read = scanned(caplog, scan_flux('R151', xml_dir, workers=workers)
+                       .filter(pl.col('pdl') == '00000000000002'))
+    assert (df['pdl'].to_list(), read) == (['00000000000002'], '1/3 fichiers à lire')
+
+    df, read = scanned(caplog, scan_flux('R151', xml_dir, workers=workers)
+                       .filter(pl.col('pdl').is_in(['00000000000001', '00000000000003'])))
+    assert (df.height, read) == (2, '2/3 fichiers à lire')
+
+    month = pl.col('Date_Releve').is_between(pl.datetime(2024, 6, 1, time_zone='Europe/Paris'),
+                                             pl.datetime(2024, 6, 30, time_zone='Europe/Paris'))
+    df, read = scanned(caplog, scan_flux('R151', xml_dir, workers=workers).filter(month))
+    assert (df['pdl'].to_list(), read) == (['00000000000002'], '1/3 fichiers à lire')
+
+
+def test_stats_follow_modified_files(xml_dir):
+    assert scan_flux('R151', xml_dir).filter(pl.col('pdl') == '00000000000009').collect().is_empty()
+    write_r151(xml_dir / 'R151_1.xml', '00000000000009', '2024-06-02')
+    df = scan_flux('R151', xml_dir).filter(pl.col('pdl') == '00000000000009').collect()
+    assert df['Date_Releve'].dt.date().to_list() == [datetime.date(2024, 6, 2)]
+
+
+
+def test_aware_bounds_use_paris_dates():
+    # 2024-06-01 23:30 UTC est déjà le 2 juin à Paris
+    bound = datetime.datetime(2024, 6, 1, 23, 30, tzinfo=datetime.timezone.utc)
+    assert predicate_constraints(pl.col('Date_Releve') < bound).ranges == {'Date_Releve': [None, '2024-06-02']}
+    assert predicate_constraints(pl.col('Date_Facture') >= bound).ranges == {'Date_Facture': ['2024-06-02', None]}
+    # Sans fuseau : déjà une heure de Paris
+    naive = datetime.datetime(2024, 6, 1, 23, 30)
+    assert predicate_constraints(pl.col('Date_Releve') < naive).ranges == {'Date_Releve': [None, '2024-06-01']}
@@ -0,0 +1,71 @@
+import datetime
+
+import pandas as pd
+import polars as pl
+import pytest
+from polars.testing import assert_frame_equal
+
+from electriflux import polars_reader, simple_reader
+from electriflux.schema import TIME_ZONE, apply_pandas_types, type_expr
+
+UTC = datetime.timezone.utc
+
+
+def typed(values, spec):
+    return pl.DataFrame({'v': values}, schema={'v': pl.Utf8}).select(type_expr('v', spec))['v']
+
+
+def utc(values, spec='DateTime'):
+    return typed(values, spec).dt.convert_time_zone('UTC').dt.replace_time_zone(None).to_list()
+
+
+def test_datetime_offsets_and_local_times():
+    assert typed(['2024-06-01'], 'DateTime').dtype == pl.Datetime('us', TIME_ZONE)
+    assert utc(['2024-06-01T12:00:00+02:00', '2024-06-01T12:00:00+00:00', '2024-01-15T08:00:00-05:00']) == [
+        datetime.datetime(2024, 6, 1, 10), datetime.datetime(2024, 6, 1, 12), datetime.datetime(2024, 1, 15, 13)]
+    # Sans décalage : heure de Paris (été, hiver, date seule)
+    assert utc(['2024-06-01T12:00:00', '2024-01-15T12:00:00', '2024-06-01']) == [
+        datetime.datetime(2024, 6, 1, 10), datetime.datetime(2024, 1, 15, 11), datetime.datetime(2024, 5, 31, 22)]
+
+
+def test_datetime_daylight_saving_rules():
+    # 02:30 n'existe pas le 31 mars 2024 ; 02:30 le 27 octobre existe deux fois
+    assert utc(['2024-03-31T02:30:00', '2024-10-27T02:30:00']) == [None, datetime.datetime(2024, 10, 27, 0, 30)]
+    # Une heure avec décalage n'est jamais ambiguë
+    assert utc(['2024-10-27T02:30:00+01:00']) == [datetime.datetime(2024, 10, 27, 1, 30)]
+
+
+def test_empty_and_invalid_values_become_null():
+    for spec in ('Float64', 'Int64', 'Date', 'DateTime', 'Categorical', ['A', 'B']):
+        assert typed(['', '  ', None], spec).null_count() == 3, spec
+    assert typed(['', None], 'String').to_list() == ['', None]
+    assert typed([' 1.5 ', 'abc', '2'], 'Float64').to_list() == [1.5, None, 2.0]
+    assert typed(['3', '3.5', 'x'], 'Int64').to_list() == [3, None, None]
+    assert typed(['2024-06-01T12:00:00+02:00', '2024-13-01'], 'Date').to_list() == [datetime.date(2024, 6, 1), None]
+
+
+def test_enum_nulls_unknown_values():
+    values = typed(['A', 'C', 'B'], ['A', 'B'])
+    assert values.dtype == pl.Enum(['A', 'B'])
+    assert values.to_list() == ['A', None, 'B']
+
+
+def test_pandas_types_follow_the_same_rules():
+    types = {'date': 'DateTime', 'n': 'Int64', 'x': 'Float64', 'cat': ['A', 'B'], 's': 'String'}
+    df = pd.DataFrame({'date': ['2024-06-01T12:00:00+02:00', '2024-03-31T02:30:00', ''],
+                       'n': ['1', '', 'x'], 'x': ['1.5', None, ''], 'cat': ['A', 'C', ''], 's': ['', 'a', None]})
+    result = apply_pandas_types(df, types)
+    assert str(result['date'].dtype) == f'datetime64[us, {TIME_ZONE}]'
+    assert result['date'].iloc[0] == pd.Timestamp('2024-06-01T10:00:00Z')
+    assert result['date'].iloc[1:].isna().all()
+    assert result['n'].dtype == 'Int64' and result['n'].tolist()[0] == 1 and result['n'].iloc[1:].isna().all()
+    assert result['x'].iloc[0] == 1.5 and result['x'].iloc[1:].isna().all()
+    assert result['cat'].dtype == 'category' and result['cat'].iloc[0] == 'A' and result['cat'].iloc[1:].isna().all()
+    assert result['s'].equals(df['s'])
+
+
+@pytest.mark.parametrize('flux', ['C15', 'R15', 'R151', 'F15'])
+def test_typed_readers_agree(synthetic, flux):
+    pandas_typed = simple_reader.process_flux(flux, synthetic / flux, typed=True)
+    assert_frame_equal(pl.from_pandas(pandas_typed), polars_reader.process_flux(flux, synthetic / flux),
+                       categorical_as_str=True)
@@ -0,0 +1,72 @@
+import shutil
+
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from electriflux.simple_reader import iterative_process_flux, load_history, process_flux
+
+
+def test_failed_files_are_retried(synthetic, tmp_path):
+    xml_dir = tmp_path / 'F15'
+    shutil.copytree(synthetic / 'F15', xml_dir)
+    broken = xml_dir / 'FL_9_9.xml'
+    broken.write_text('<F15><Rappel_En_Tete>')
+
+    errors = []
+    first = iterative_process_flux('F15', xml_dir, errors=errors)
+    assert [e.file.name for e in errors] == [broken.name]
+    assert broken.name not in set(load_history(xml_dir / 'history.csv')['file'])
+
+    broken.unlink()
+    shutil.copy(synthetic / 'F15' / 'FL_0_0' / 'FL_0_0.xml', broken)
+    second = iterative_process_flux('F15', xml_dir)
+    assert len(second) == len(first) + len(process_flux('F15', synthetic / 'F15' / 'FL_0_0'))
+
+
+def test_parquet_storage_returns_new_rows(synthetic, tmp_path):
+    xml_dir = tmp_path / 'F15'
+    shutil.copytree(synthetic / 'F15' / 'FL_0_0', xml_dir / 'FL_0_0')
+    first = iterative_process_flux('F15', xml_dir, storage='parquet')
+    assert len(first) == len(process_flux('F15', xml_dir))
+
+    shutil.copytree(synthetic / 'F15' / 'FL_1_1', xml_dir / 'FL_1_1')
+    second = iterative_process_flux('F15', xml_dir, storage='parquet')
+    assert len(second) == len(process_flux('F15', synthetic / 'F15' / 'FL_1_1'))
+    assert iterative_process_flux('F15', xml_dir, storage='parquet').empty
+    assert len(iterative_process_flux('F15', xml_dir, storage='parquet', read_all=True)) == len(first) + len(second)
+
+
+def test_bad_zip_member_is_skipped(synthetic, tmp_path):
+    import zipfile
+
+    from electriflux.simple_reader import zip_to_dataframes
+
+    good = synthetic / 'F15' / 'FL_0_0' / 'FL_0_0.xml'
+    archive = tmp_path / 'F15.zip'
+    with zipfile.ZipFile(archive, 'w') as zf:
+        zf.write(good, 'FL_0_0.xml')
+        zf.writestr('FL_1_1.xml', '<F15><Rappel_En_Tete>')
+    errors = []
+    members = list(zip_to_dataframes(archive, 'F15', errors=errors))
+    assert [name for name, _ in members] == ['FL_0_0.xml']
+    assert len(members[0][1]) == len(process_flux('F15', good.parent))
+    assert [e.file.name for e in errors] == ['FL_1_1.xml']
+
+
+def values(df):
+    # Les backends diffèrent par le type des colonnes (str ou string[pyarrow]), pas par les valeurs
+    return df.astype(object).where(df.notna(), None)
+
+
+# C15 : champs imbriqués ; R15, R151 : métadonnées d'en-tête ; F12, F15 : champs `../`
+@pytest.mark.parametrize('backend', ['rows', 'arrow'])
+@pytest.mark.parametrize('flux', ['C15', 'F12', 'F15', 'R15', 'R151', 'R15_ACC'])
+def test_stream_and_backend_match_tree(synthetic, flux, backend):
+    tree = process_flux(flux, synthetic / flux)
+    assert len(tree)
+    streamed = process_flux(flux, synthetic / flux, stream=True, backend=backend)
+    pd.testing.assert_frame_equal(streamed, process_flux(flux, synthetic / flux, backend=backend))
+    if backend == 'arrow':
+        assert (streamed.dtypes == pd.ArrowDtype(pa.string())).all()
+    pd.testing.assert_frame_equal(values(streamed), values(tree))
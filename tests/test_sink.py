@@ -0,0 +1,88 @@
+import shutil
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+import pytest
+
+from electriflux.simple_reader import process_flux, process_flux_to
+from electriflux.sink import TableSink
+from electriflux.store import to_string_table
+
+from .conftest import DATA_DIR
+
+FORMATS = ['parquet', 'arrow', 'csv']
+
+
+def read(path):
+    if path.suffix == '.parquet':
+        return pq.read_table(path)
+    if path.suffix == '.arrow':
+        return feather.read_table(path)
+    # Comme `sink._read_batches` : nulls sans guillemets, chaînes vides entre guillemets
+    columns = pa_csv.read_csv(path).column_names
+    return pa_csv.read_csv(path, convert_options=pa_csv.ConvertOptions(
+        column_types={col: pa.string() for col in columns}, strings_can_be_null=True,
+        quoted_strings_can_be_null=False))
+
+
+@pytest.mark.parametrize('suffix', FORMATS)
+def test_union_schema(tmp_path, suffix):
+    path = tmp_path / f'out.{suffix}'
+    with TableSink(path, batch_rows=1) as sink:
+        sink.write(pd.DataFrame({'a': ['1', ''], 'b': ['x', None]}))
+        # Nouvelle colonne : nouveau segment
+        sink.write(pd.DataFrame({'c': ['3'], 'a': [None]}))
+        sink.write(pd.DataFrame(columns=['d']))
+        sink.write(pd.DataFrame({'b': ['y']}))
+    assert sorted(p.name for p in tmp_path.iterdir()) == [path.name]
+    assert read(path).column_names == ['a', 'b', 'c', 'd']
+    assert read(path).to_pydict() == {
+        'a': ['1', '', None, None],
+        'b': ['x', None, None, 'y'],
+        'c': [None, None, '3', None],
+        'd': [None, None, None, None],
+    }
+
+
+@pytest.mark.parametrize('suffix', FORMATS)
+def test_abort_leaves_nothing(tmp_path, suffix):
+    path = tmp_path / f'out.{suffix}'
+    with pytest.raises(RuntimeError):
+        with TableSink(path, batch_rows=1) as sink:
+            sink.write(pd.DataFrame({'a': ['1']}))
+            sink.write(pd.DataFrame({'b': ['2']}))
+            raise RuntimeError
+    assert not list(tmp_path.iterdir())
+
+
+def test_empty_sink_keeps_columns(tmp_path):
+    path = tmp_path / 'out.parquet'
+    with TableSink(path) as sink:
+        sink.write(pd.DataFrame(columns=['a', 'b']))
+    assert pq.read_table(path).column_names == ['a', 'b']
+
+
+@pytest.mark.parametrize('suffix', FORMATS)
+def test_files_with_different_columns(tmp_path, suffix):
+    # Relevés Avant_/Après_ différents d'un fichier à l'autre
+    xml_dir = tmp_path / 'C15'
+    xml_dir.mkdir()
+    for name in ('C15_nested.xml', 'C15_compteur.xml'):
+        shutil.copy(DATA_DIR / name, xml_dir / name)
+    path = tmp_path / f'C15.{suffix}'
+    assert process_flux_to('C15', xml_dir, path, batch_rows=1) == 3
+    expected = to_string_table(process_flux('C15', xml_dir))
+    assert read(path).column_names == expected.column_names
+    assert read(path).to_pydict() == expected.to_pydict()
+
+
+@pytest.mark.parametrize('flux', ['C15', 'R151', 'F15'])
+def test_matches_process_flux(synthetic, tmp_path, flux):
+    path = tmp_path / f'{flux}.parquet'
+    rows = process_flux_to(flux, synthetic / flux, path, batch_rows=7, batch_files=1)
+    expected = to_string_table(process_flux(flux, synthetic / flux))
+    assert rows == expected.num_rows
+    assert pq.read_table(path).equals(expected.replace_schema_metadata(None))
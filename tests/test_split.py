@@ -0,0 +1,24 @@
+import pandas as pd
+import polars as pl
+import pytest
+
+from electriflux.simple_reader import process_flux
+
+# F12 et F15 remontent au-dessus de la ligne (`../`) : toujours lus d'un bloc
+FLUXES = ['C15', 'R15', 'R151', 'R15_ACC']
+
+
+@pytest.mark.parametrize('backend', ['rows', 'arrow'])
+@pytest.mark.parametrize('flux', FLUXES)
+def test_split_matches_whole_file(synthetic, flux, backend):
+    whole = process_flux(flux, synthetic / flux, backend=backend)
+    split = process_flux(flux, synthetic / flux, backend=backend, workers=2, split_bytes=1)
+    pd.testing.assert_frame_equal(split, whole)
+
+
+def test_split_after_polars_work(synthetic):
+    # Pool créé après un calcul polars dans ce processus (voir `parallel.process_pool`)
+    pl.DataFrame({'a': range(10_000)}).group_by('a').len()
+    whole = process_flux('C15', synthetic / 'C15', backend='arrow')
+    split = process_flux('C15', synthetic / 'C15', backend='arrow', workers=2, split_bytes=1)
+    pd.testing.assert_frame_equal(split, whole)
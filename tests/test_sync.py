@@ -0,0 +1,30 @@
+import stat
+from types import SimpleNamespace
+
+from electriflux.sync import RemoteSync
+
+
+class FakeSftp:
+    """Dossier distant en mémoire : nom -> (taille, date)."""
+
+    def __init__(self, files):
+        self.files = files
+
+    def stat(self, path):
+        # La date du dossier ne change pas quand un fichier est réécrit sur place
+        return SimpleNamespace(st_mtime=1_000, st_size=0, st_mode=stat.S_IFDIR)
+
+    def listdir_attr(self, directory):
+        return [SimpleNamespace(filename=name, st_size=size, st_mtime=mtime, st_mode=stat.S_IFREG)
+                for name, (size, mtime) in self.files.items()]
+
+
+def test_republished_file_is_changed(tmp_path):
+    sftp = FakeSftp({'a.zip': (10, 2_000), 'b.zip': (20, 2_000)})
+    with RemoteSync(tmp_path / 'ledger.db', 'processed_zips', tmp_path / '.partial') as sync:
+        assert [e.name for e in sync.changed(sftp, '/F15')] == ['a.zip', 'b.zip']
+        sync.mark_synced(*sync.list_dir(sftp, '/F15'))
+        assert sync.changed(sftp, '/F15') == []
+
+        sftp.files['a.zip'] = (12, 2_000)
+        assert [e.name for e in sync.changed(sftp, '/F15')] == ['a.zip']
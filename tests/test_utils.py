@@ -0,0 +1,149 @@
+import io
+import stat
+import threading
+import zipfile
+from types import SimpleNamespace
+
+import paramiko
+import pytest
+from Crypto.Cipher import AES
+
+import electriflux.utils
+from electriflux.metrics import Metrics
+from electriflux.sync import RemoteSync
+from electriflux.utils import (CHUNK_SIZE, decrypt_file, download_decrypt_parse_new_files, encrypt_file,
+                               pipelined_download_decrypt_extract)
+
+from .conftest import DATA_DIR
+
+KEY, IV = bytes(range(16)), bytes(range(16, 32))
+CONFIG = {'FTP_ADDRESS': 'sftp.invalid', 'FTP_USER': 'user', 'FTP_PASSWORD': 'secret',
+          'AES_KEY': KEY.hex(), 'AES_IV': IV.hex()}
+
+
+def encrypted_zip(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for name, content in members.items():
+            archive.writestr(name, content)
+    data = buffer.getvalue()
+    # Dernier bloc complété par des espaces, comme `encrypt_file`
+    data += b' ' * (-len(data) % AES.block_size)
+    return AES.new(KEY, AES.MODE_CBC, IV).encrypt(data)
+
+
+class FakeSftp:
+    """Serveur sFTP en mémoire : chemin -> contenu, ou exception levée à la lecture."""
+
+    def __init__(self, files):
+        self.files = files
+
+    def _content(self, path):
+        content = self.files[path]
+        if isinstance(content, Exception):
+            raise content
+        return content
+
+    def listdir_attr(self, directory):
+        return [SimpleNamespace(filename=path.rsplit('/', 1)[1], st_size=len(content) if isinstance(content, bytes) else 1,
+                                st_mtime=1_000, st_mode=stat.S_IFREG)
+                for path, content in self.files.items() if path.rsplit('/', 1)[0] == directory]
+
+    def stat(self, path):
+        return SimpleNamespace(st_size=len(self._content(path)), st_mtime=1_000, st_mode=stat.S_IFREG)
+
+    def getfo(self, path, writer):
+        content = self._content(path)
+        # Morceaux de taille quelconque, comme paramiko
+        for start in range(0, len(content), 1000):
+            writer.write(content[start:start + 1000])
+
+    def get(self, path, local_path):
+        with open(local_path, 'wb') as f:
+            self.getfo(path, f)
+
+    def open(self, path, mode='rb'):
+        remote = io.BytesIO(self._content(path))
+        remote.prefetch = lambda size=None: None
+        return remote
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def server(monkeypatch):
+    sftp = FakeSftp({})
+    monkeypatch.setattr(electriflux.utils, 'connect', lambda config: SimpleNamespace(close=lambda: None))
+    monkeypatch.setattr(paramiko.SFTPClient, 'from_transport', lambda transport: sftp)
+    return sftp
+
+
+def test_parse_new_files(server, tmp_path):
+    xml = (DATA_DIR / 'R151_index.xml').read_bytes()
+    server.files['/flux_enedis/R151/a.zip'] = encrypted_zip({'R151_a.xml': xml})
+    server.files['/flux_enedis/R151/b.zip'] = encrypted_zip({'R151_b.xml': xml, 'R151_c.xml': b'<R151><PRM>'})
+    metrics = Metrics()
+    parsed = [(name, flux, len(df)) for name, flux, df in
+              download_decrypt_parse_new_files(CONFIG, ['R151'], tmp_path, metrics=metrics)]
+    assert parsed == [('a.zip', 'R151', 8), ('b.zip', 'R151', 8)]
+    assert [e['file'] for e in metrics.report()['error_details']] == ['/flux_enedis/R151/b.zip/R151_c.xml']
+    # Archives enregistrées : rien de nouveau au passage suivant
+    assert list(download_decrypt_parse_new_files(CONFIG, ['R151'], tmp_path)) == []
+
+
+@pytest.mark.parametrize('resumable', [False, True])
+def test_pipeline_reports_failures_without_blocking(server, tmp_path, resumable):
+    good = encrypted_zip({'R151_a.xml': (DATA_DIR / 'R151_index.xml').read_bytes()})
+    server.files.update({
+        '/flux_enedis/R151/good.zip': good,
+        '/flux_enedis/R151/again.zip': good,
+        '/flux_enedis/R151/lost.zip': OSError("connexion perdue"),
+        '/flux_enedis/R151/truncated.zip': good[:-5],
+        '/flux_enedis/R151/garbage.zip': AES.new(KEY, AES.MODE_CBC, IV).encrypt(b'x' * 64),
+    })
+    names = ['good', 'lost', 'truncated', 'garbage', 'again']
+    jobs = [('R151', f'/flux_enedis/R151/{name}.zip', tmp_path / 'out' / str(i)) for i, name in enumerate(names)]
+    metrics = Metrics()
+    results = {}
+
+    def run():
+        with RemoteSync(tmp_path / 'ledger.db', 'processed_zips', tmp_path / '.partial') as sync:
+            results.update(pipelined_download_decrypt_extract(
+                None, jobs, KEY, IV, channels=2, workers=1, metrics=metrics, sync=sync if resumable else None))
+
+    # Un résultat perdu laisserait le générateur en attente pour toujours
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(timeout=60)
+    assert not thread.is_alive()
+    assert results == {0: True, 1: False, 2: False, 3: False, 4: True}
+    assert (tmp_path / 'out' / '0' / 'R151_a.xml').exists()
+    failed = [e['file'] for e in metrics.report()['error_details']]
+    assert sorted(failed) == sorted(f'/flux_enedis/R151/{name}.zip' for name in ('lost', 'truncated', 'garbage'))
+
+
+@pytest.mark.parametrize('chunk_size, size', [
+    *((32, size) for size in (0, 1, 15, 16, 17, 31, 32, 33, 64 + 5, 3 * 32 + 16)),
+    *((CHUNK_SIZE, size) for size in (CHUNK_SIZE - 1, CHUNK_SIZE, CHUNK_SIZE + 5)),
+])
+def test_encrypt_decrypt_round_trip(tmp_path, chunk_size, size):
+    content = bytes(i % 251 for i in range(size))
+    source = tmp_path / 'flux.zip'
+    source.write_bytes(content)
+    padded = content + b' ' * (-size % AES.block_size)
+
+    encrypted = encrypt_file(source, KEY, IV, chunk_size=chunk_size)
+    # Le chiffrement par morceaux doit être identique à un chiffrement en une passe
+    assert encrypted.read_bytes() == AES.new(KEY, AES.MODE_CBC, IV).encrypt(padded)
+    assert decrypt_file(encrypted, KEY, IV, chunk_size=chunk_size).read_bytes() == padded
+
+
+@pytest.mark.parametrize('chunk_size', [0, -16, 1, 15, 24])
+def test_chunk_size_must_be_a_block_multiple(tmp_path, chunk_size):
+    source = tmp_path / 'flux.zip'
+    source.write_bytes(b'x' * 32)
+    with pytest.raises(ValueError):
+        encrypt_file(source, KEY, IV, chunk_size=chunk_size)
+    with pytest.raises(ValueError):
+        decrypt_file(source, KEY, IV, chunk_size=chunk_size)
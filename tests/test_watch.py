@@ -0,0 +1,29 @@
+import shutil
+import threading
+
+import electriflux.watch
+from electriflux.watch import Watcher
+
+
+def test_failed_batch_is_rediscovered(synthetic, tmp_path, monkeypatch):
+    shutil.copytree(synthetic / 'F15', tmp_path / 'F15')
+    watcher = Watcher(None, ['F15'], tmp_path)
+
+    def fail(*args, **kwargs):
+        raise OSError("disque plein")
+
+    monkeypatch.setattr(electriflux.watch, 'write_parsed', fail)
+    queued = watcher.poll()
+    assert queued > 0
+    stop = threading.Event()
+    ingester = threading.Thread(target=watcher._ingest_loop, args=(stop,))
+    ingester.start()
+    watcher.files.join()
+    stop.set()
+    ingester.join()
+    assert not watcher.ingested['F15']
+
+    # Le lot en échec est de nouveau proposé au passage suivant
+    monkeypatch.undo()
+    assert watcher.run_once() == queued
+    assert watcher.run_once() == 0